@@ -0,0 +1,72 @@
+"""
+Content-addressed store for generated report files.
+
+Each .docx is written once to REPORT_BLOB_DIR (default: `report_blobs/` next
+to the SQLite database) under its sha256, the same digest the staged pipeline
+records as the assembly `output_hash`. generated_reports keeps only that
+digest and the size, so status and queue queries never page the document in
+and downloads are served straight from disk.
+"""
+import hashlib
+import os
+import tempfile
+from typing import Optional
+
+from app.db import DB_PATH, get_inline_report_doc, get_inline_report_ids, set_report_doc
+
+BLOB_DIR = os.environ.get("REPORT_BLOB_DIR") or os.path.join(os.path.dirname(os.path.abspath(DB_PATH)), "report_blobs")
+
+
+def digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def path_for(doc_sha256: str) -> str:
+    # Two-character fan-out keeps any one directory small.
+    return os.path.join(BLOB_DIR, doc_sha256[:2], f"{doc_sha256}.docx")
+
+
+def put(data: bytes) -> str:
+    """Store data (if not already present) and return its sha256."""
+    doc_sha256 = digest(data)
+    path = path_for(doc_sha256)
+    if os.path.exists(path):
+        return doc_sha256
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write to a temp file in the same directory, then rename, so readers never see a partial file.
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return doc_sha256
+
+
+def open_path(doc_sha256: Optional[str]) -> Optional[str]:
+    """Path of a stored report, or None if there is no pointer or the file is gone."""
+    if not doc_sha256:
+        return None
+    path = path_for(doc_sha256)
+    return path if os.path.exists(path) else None
+
+
+def delete(doc_sha256: str) -> None:
+    try:
+        os.remove(path_for(doc_sha256))
+    except FileNotFoundError:
+        pass
+
+
+def migrate_inline_reports() -> int:
+    """Move documents still stored inline in generated_reports.doc_bytes to the blob store."""
+    moved = 0
+    for submission_id in get_inline_report_ids():
+        data = get_inline_report_doc(submission_id)
+        if data:
+            set_report_doc(submission_id, put(data), len(data))
+            moved += 1
+    return moved
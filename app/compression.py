@@ -0,0 +1,179 @@
+"""
+Transparent compression for the large text columns in SQLite.
+
+Section text (report_sections, llm_response_cache) and validation event
+details are zlib-compressed against a preset dictionary of the headings,
+table headers and JSON keys that every report repeats, which is what makes
+short values compress well. A compressed value is stored as a BLOB:
+
+    MARKER (2 bytes) | dictionary version (1 byte) | zlib stream
+
+Anything else read back -- TEXT rows written before compression existed, or
+values too small to be worth compressing -- is returned unchanged, so no
+migration is needed and DB_COMPRESSION_ENABLED=false only stops new writes
+from being compressed.
+
+A dictionary that has shipped must never be edited: rows written with it
+need the exact same bytes to decompress. Add a new version instead and point
+CURRENT_DICT_VERSION at it.
+"""
+import os
+import zlib
+from typing import Optional, Union
+
+COMPRESSION_ENABLED = os.environ.get("DB_COMPRESSION_ENABLED", "true").lower() == "true"
+# Below this many UTF-8 bytes the zlib header and checksum outweigh the saving.
+MIN_COMPRESS_BYTES = 64
+COMPRESSION_LEVEL = 6
+
+MARKER = b"\x1fZ"
+
+# Least common first: zlib finds matches near the end of the dictionary more cheaply.
+_DICT_V1_PHRASES = (
+    # Chapter and appendix headings from app/prompts.
+    "## 2.1 Background",
+    "## 2.2 Project Idea and Value Proposition",
+    "## 2.3 Promoters' Background",
+    "## 3. Regulatory Framework Overview",
+    "## 3.1 Licenses and Approvals",
+    "## 3.2 Regulatory Support and Restrictions",
+    "## 3.3 Government Incentives and Subsidies",
+    "## 4. Market Assessment Introduction",
+    "## 4.1 Industry Analysis and Overview",
+    "## 4.2 Market Segmentation",
+    "## 4.3 Demand Assessment",
+    "## 4.4 Demand Drivers",
+    "## 4.5 Supply Assessment",
+    "## 4.6 Competition Analysis",
+    "## 4.7 Demand-Supply Gap and Market Forecast",
+    "## 5. Business and Operating Model Overview",
+    "## 5.1 Proposed Products",
+    "## 5.2 Alternative Technologies",
+    "## 5.3 Manufacturing Process",
+    "## 5.4 Plant & Machinery and Plant Layout",
+    "## 5.5 Installed Capacity and Utilisation",
+    "## 5.6 Infrastructure, Land and Location",
+    "## 5.7 Raw Materials, Consumables and Utilities",
+    "## 5.8 Inbound, In-plant and Outbound Logistics",
+    "## 5.9 Manpower Plan and Organisation Structure",
+    "## 6.1 Key Project Assumptions",
+    "## 6.2 Cost of the Project",
+    "## 6.3 Means of Finance",
+    "## 6.4 Revenue Estimates",
+    "## 6.5 OPEX Estimates",
+    "## 6.6 Loan Repayment Schedule",
+    "## 6.7 Taxation",
+    "## 6.8 Depreciation",
+    "## 6.9 Proforma P&L",
+    "## 6.10 Proforma Balance Sheet",
+    "## 6.11 Cash Flow Statement",
+    "## 6.12 Key Project Metrics",
+    "## 8.1 Reliance and Purpose",
+    "## 8.2 Data Limitations",
+    "## 8.3 Financial Projections",
+    "## 8.4 Regulatory and Approvals",
+    "## 8.5 Professional Responsibility",
+    "## Appendix Index",
+    "## Appendix A: Key Assumptions Register",
+    "## Appendix B: Data Sources and References",
+    "## Appendix C: Regulatory Approvals Checklist",
+    "## Appendix D: Certifications and Non-Negotiables Tracker",
+    "## Appendix E: Sensitivity Analysis Summary",
+    "## Appendix F: Client Documents to Attach",
+    # Recurring table headers and body phrasing.
+    "| Assumption | Value | Unit | Basis | Chapter Reference |",
+    "| Authority | Current Status | Target Date | Notes |",
+    "| Year 1 | Year 2 | Year 3 | Year 4 | Year 5 |",
+    "|---|---|---|---|---|",
+    "Client Provided",
+    "Tool default",
+    "reliable public data not available",
+    "lender-grade feasibility report",
+    "Rs. lakh",
+    "INR crore",
+    "per annum",
+    "capacity utilisation",
+    "working capital",
+    "debt service coverage ratio (DSCR)",
+    "internal rate of return (IRR)",
+    "break-even",
+    "Source: ",
+    "https://www.",
+    "[STUB MODE] Placeholder response for:",
+    "In production, this would be generated by the LLM API.",
+    # Validation event details: baseline artifact, provenance and quality checks.
+    '{"passed": false, "warnings": ["page_intent_low_content:',
+    '"overlap_ratio_business_vs_equipment": ',
+    '{"has_url": false, "has_image_link": false, "has_brand_or_manufacturer": false, '
+    '"has_technical_specs": false, "has_performance_specs": false, "missing_keys": '
+    '["oem_or_product_link", "image_link", "brand_or_manufacturer", "technical_specifications", '
+    '"performance_specifications"], "valid": false}',
+    '{"mapped_fields": [',
+    '"missing_in_chapter": [',
+    '"match": false}',
+    '{"missing": [], "questions": []}',
+    '{"snapshot": {',
+    '{"project_definition_summary": {"business_idea": ',
+    '"product_service": null, "target_market": null, "target_customer": null, '
+    '"project_state": null, "project_country": null}',
+    '"mode_selection_logic": {"sizing_mode": "not_provided", "selected_basis_field": "total_investment"}',
+    '"sizing_basis_statement": "Sizing basis is not clearly set."',
+    '"key_implications": ["Report generation quality may degrade until sizing mode is confirmed."]',
+    '"missing_inputs": [',
+    '"missing_input_questions": [',
+    '"assumptions_table": [',
+    '"unable_to_source_count": ',
+    '"records": [',
+    '"debt_percentage", "equity_percentage", "interest_rate", "loan_tenor", "moratorium_period", '
+    '"operating_days", "production_rampup", "repayment_frequency", "selling_price", '
+    '"target_capacity", "total_investment"',
+    '"provenance": "unable_to_source", "source": "No confirmed source", "source_url": null, '
+    '"note": "No client value or review-source metadata available"}, {"field": "',
+    '"provenance": "client_provided", "source": "Submission payload", "source_url": null, '
+    '"note": "Derived from submission payload"}, {"field": "',
+    '"unit": "months", "basis": "AI Default", "source_links": []}, {"assumption": "shifts_per_day", '
+    '"value": null, "unit": "shifts/day", "basis": "AI Default", "source_links": []}, '
+    '{"assumption": "hours_per_shift", "value": null, "unit": "hours/shift"',
+    '"unit": "units", "basis": "AI Default", "source_links": []}], "missing_inputs": [], "missing_input_questions": []}',
+    '"unit": "% p.a.", "unit": "days/year", "unit": "years", "unit": "%", ',
+    '"unit": "currency", "basis": "Client Provided", "source_links": []}, {"assumption": "',
+)
+
+_DICTIONARIES = {
+    1: "\n".join(_DICT_V1_PHRASES).encode("utf-8"),
+}
+CURRENT_DICT_VERSION = 1
+
+
+def compress_text(text: Optional[str]) -> Union[str, bytes, None]:
+    """Value to store for text: a marked BLOB, or the text itself when compression would not help."""
+    if text is None or not COMPRESSION_ENABLED:
+        return text
+    raw = text.encode("utf-8")
+    if len(raw) < MIN_COMPRESS_BYTES:
+        return text
+    compressor = zlib.compressobj(COMPRESSION_LEVEL, zdict=_DICTIONARIES[CURRENT_DICT_VERSION])
+    packed = MARKER + bytes([CURRENT_DICT_VERSION]) + compressor.compress(raw) + compressor.flush()
+    return packed if len(packed) < len(raw) else text
+
+
+def decompress_text(value: Union[str, bytes, None]) -> Optional[str]:
+    """Inverse of compress_text; plain TEXT values pass through untouched."""
+    if value is None or isinstance(value, str):
+        return value
+    value = bytes(value)
+    if not value.startswith(MARKER):
+        return value.decode("utf-8")
+    version = value[len(MARKER)]
+    if version not in _DICTIONARIES:
+        raise ValueError(f"Unknown compression dictionary version {version}")
+    decompressor = zlib.decompressobj(zdict=_DICTIONARIES[version])
+    raw = decompressor.decompress(value[len(MARKER) + 1:]) + decompressor.flush()
+    return raw.decode("utf-8")
+
+
+def stored_size(value: Union[str, bytes, None]) -> int:
+    """Bytes a stored value occupies (compressed size for BLOBs, UTF-8 length for text)."""
+    if value is None:
+        return 0
+    return len(value) if isinstance(value, (bytes, bytearray)) else len(value.encode("utf-8"))
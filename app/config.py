@@ -20,12 +20,62 @@ class Config:
     CLAUDE_RATE_LIMIT_RETRIES = int(os.getenv("CLAUDE_RATE_LIMIT_RETRIES", "4"))
     CLAUDE_RATE_LIMIT_BASE_SLEEP_SEC = float(os.getenv("CLAUDE_RATE_LIMIT_BASE_SLEEP_SEC", "2.0"))
     GENERATION_ROUND_COOLDOWN_SEC = float(os.getenv("GENERATION_ROUND_COOLDOWN_SEC", "20.0"))
-    REPORT_LOCK_STALE_SECONDS = int(os.getenv("REPORT_LOCK_STALE_SECONDS", "1200"))
+    # How many reports may generate at the same time. Further requests wait in the
+    # persisted report queue and are admitted as soon as a slot frees up.
+    MAX_CONCURRENT_REPORTS = int(os.getenv("MAX_CONCURRENT_REPORTS", "2"))
+    # Seconds of waiting that count as one extra priority level, so older
+    # low-priority jobs are never starved by newer high-priority ones.
+    REPORT_QUEUE_AGING_SECONDS = float(os.getenv("REPORT_QUEUE_AGING_SECONDS", "300"))
+    # Anthropic tokens-per-minute budget enforced before each call, shared by all
+    # sections of all running reports. Set to your plan's limit; 0 disables it.
+    CLAUDE_TOKENS_PER_MINUTE = int(os.getenv("CLAUDE_TOKENS_PER_MINUTE", "80000"))
     # How many report sections to generate at the same time.
-    # 3 is the safe default — enough to be ~3x faster than sequential without
-    # hammering the Anthropic TPM (tokens-per-minute) limit.
-    # Raise to 4-5 only if you have a higher-tier API plan.
+    # CLAUDE_TOKENS_PER_MINUTE keeps calls within the Anthropic TPM limit, so this
+    # mainly bounds open connections and how many sections share that budget.
     PARALLEL_SECTION_WORKERS = int(os.getenv("PARALLEL_SECTION_WORKERS", "3"))
+    # Content-addressed cache of LLM output keyed by rendered prompt, model, mode
+    # and max_tokens (see app/llm_cache.py).
+    LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+    LLM_CACHE_TTL_HOURS = float(os.getenv("LLM_CACHE_TTL_HOURS", "168"))
+    LLM_CACHE_MAX_MB = float(os.getenv("LLM_CACHE_MAX_MB", "64"))
+    # Idle seconds before a pooled HTTPS connection to the LLM APIs is closed.
+    LLM_HTTP_KEEPALIVE_SEC = float(os.getenv("LLM_HTTP_KEEPALIVE_SEC", "60"))
+    # Stream plain-mode section output so progress shows tokens as they arrive.
+    LLM_STREAMING_ENABLED = os.getenv("LLM_STREAMING_ENABLED", "true").lower() == "true"
+    # Output tokens between progress updates while a section is streaming.
+    STREAM_PROGRESS_INTERVAL_TOKENS = int(os.getenv("STREAM_PROGRESS_INTERVAL_TOKENS", "150"))
+    # Stop a streaming financial chapter and retry it at once when, after this
+    # share of its max_tokens, it already states SOURCING_EARLY_ABORT_CLAIMS
+    # figures and not one source link or fallback phrase. The last attempt
+    # always runs to completion. A share of 0 disables the early stop.
+    SOURCING_EARLY_ABORT_SHARE = float(os.getenv("SOURCING_EARLY_ABORT_SHARE", "0.35"))
+    SOURCING_EARLY_ABORT_CLAIMS = int(os.getenv("SOURCING_EARLY_ABORT_CLAIMS", "6"))
+    # Re-read prompt templates and the output specification when their files
+    # change on disk (development). Off, they are read once per process.
+    PROMPT_HOT_RELOAD = os.getenv("PROMPT_HOT_RELOAD", "false").lower() == "true"
+    # Send the report brief shared by every section (prompts/report_brief.txt)
+    # as a system-prompt prefix marked for Anthropic prompt caching, on Claude
+    # routes where it reaches the model's minimum cacheable length.
+    PROMPT_CACHE_ENABLED = os.getenv("PROMPT_CACHE_ENABLED", "true").lower() == "true"
+
+    # Profile report generation (see app/profiling.py): "cprofile" or "sample",
+    # optionally with ",memory" for tracemalloc; empty turns it off. One report
+    # can also be profiled with POST /api/report/{id}/start?profile=sample.
+    PROFILE_REPORTS = os.getenv("PROFILE_REPORTS", "").strip().lower()
+    # Keep PROFILE_REPORTS profiles only of reports that took at least this long (0 keeps all).
+    PROFILE_SLOW_REPORT_SEC = float(os.getenv("PROFILE_SLOW_REPORT_SEC", "0"))
+    PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+
+    # LLM_PROVIDER=simulated: offline stand-in for the LLM APIs (see app/llm_simulator.py).
+    LLM_SIM_SEED = os.getenv("LLM_SIM_SEED", "0")
+    # Multiplier on every simulated delay; 0.01 replays realistic timings 100x faster.
+    LLM_SIM_TIME_SCALE = float(os.getenv("LLM_SIM_TIME_SCALE", "1.0"))
+    LLM_SIM_429_RATE = float(os.getenv("LLM_SIM_429_RATE", "0"))
+    LLM_SIM_5XX_RATE = float(os.getenv("LLM_SIM_5XX_RATE", "0"))
+    # Simulated organisation tokens-per-minute limit (0 = unlimited).
+    LLM_SIM_TPM = int(os.getenv("LLM_SIM_TPM", "0"))
+    # Per-model overrides, e.g. {"claude-sonnet-4-6": {"ttft_s": 2.0, "tokens_per_s": 40}}
+    LLM_SIM_PROFILES_JSON = os.getenv("LLM_SIM_PROFILES_JSON", "")
 
     # Maps section names to the model that should generate them.
     # Format: "provider:model-name"  — "claude" means use the default Claude model.
@@ -4,6 +4,8 @@ import hashlib
 from datetime import datetime, timedelta
 from typing import Any, Optional
 
+from app.telemetry import DATA_FETCHER_CACHE_LOOKUPS
+
 _CACHE_DIR = os.path.join(
     os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
     ".data_cache",
@@ -22,9 +24,12 @@ def get(key: str) -> Optional[Any]:
         with open(_path(key)) as f:
             entry = json.load(f)
         if datetime.utcnow() > datetime.fromisoformat(entry["expires_at"]):
+            DATA_FETCHER_CACHE_LOOKUPS.inc(result="miss")
             return None
+        DATA_FETCHER_CACHE_LOOKUPS.inc(result="hit")
         return entry["data"]
     except Exception:
+        DATA_FETCHER_CACHE_LOOKUPS.inc(result="miss")
         return None
 
 
@@ -1,17 +1,106 @@
 import sqlite3
 import json
 import os
+import threading
+import weakref
 from datetime import datetime
 from typing import Optional, Dict, Any
+from app.compression import compress_text, decompress_text, stored_size
+from app.db_migrations import apply_migrations
 from app.location_seed import INDIA_LOCATION_SEED
+from app.progress_bus import progress_bus
+from app.telemetry import DB_COMMITS
 
 # Database path — can be overridden via DATABASE_PATH env var (used in Modal)
 DB_PATH = os.environ.get("DATABASE_PATH") or os.path.join(os.path.dirname(os.path.dirname(__file__)), "app.db")
 
+# WAL lets readers run alongside a writer. Use DELETE on filesystems without
+# shared-memory support or shared by several hosts (e.g. network volumes;
+# modal_pipeline.py sets it for the Modal Volume).
+SQLITE_JOURNAL_MODE = os.environ.get("SQLITE_JOURNAL_MODE", "WAL")
+# How long a writer waits for another writer's lock before raising "database is locked".
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_CACHED_STATEMENTS = 256
+
+
+class _PooledConnection:
+    """The pooled connection as handed to an accessor: close() gives it back instead of closing it."""
+
+    __slots__ = ("_conn",)
+
+    def __init__(self, conn: sqlite3.Connection):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def commit(self) -> None:
+        self._conn.commit()
+        DB_COMMITS.inc()
+
+    def close(self) -> None:
+        # Discard anything the accessor left uncommitted so the next caller starts clean.
+        if self._conn.in_transaction:
+            self._conn.rollback()
+
+
+class ConnectionPool:
+    """
+    One long-lived SQLite connection per thread.
+
+    Accessors keep their connect / execute / commit / close shape, but the
+    connection (with its prepared-statement cache and PRAGMAs) is reused by
+    every later call on the same thread instead of being reopened. SQLite
+    connections must not run statements from two threads at once, so
+    connections are never shared between threads; they close when their
+    thread exits.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def connect(self) -> _PooledConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._open()
+            self._local.conn = conn
+        elif conn.in_transaction:
+            conn.rollback()  # an earlier accessor raised before commit/close
+        return _PooledConnection(conn)
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+            cached_statements=SQLITE_CACHED_STATEMENTS,
+            check_same_thread=False,
+        )
+        # Only takes effect on a new, empty database (and must precede the WAL
+        # switch); app.maintenance then returns freed pages in small steps.
+        # Older databases are converted with `python -m app.maintenance --convert-auto-vacuum`.
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+        # With WAL, NORMAL only syncs at checkpoints; a power cut can lose the
+        # last commits but never corrupts the database. Other journal modes
+        # keep SQLite's FULL default, which they need for that guarantee.
+        if SQLITE_JOURNAL_MODE.upper() == "WAL":
+            conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        return conn
+
+
+_pool = ConnectionPool(DB_PATH)
+
+
+def get_connection() -> _PooledConnection:
+    """This thread's pooled connection to DB_PATH; call close() when done, as with sqlite3."""
+    return _pool.connect()
+
 
 def init_db():
     """Initialize database and create tables if they don't exist."""
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
     
     cursor.execute("""
@@ -99,7 +188,7 @@ def init_db():
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             submission_id INTEGER NOT NULL UNIQUE,
             status TEXT NOT NULL DEFAULT 'pending',
-            doc_bytes BLOB,
+            doc_bytes BLOB,  -- legacy inline .docx; new documents live in app.blob_store
             error_message TEXT,
             created_at TEXT NOT NULL,
             updated_at TEXT NOT NULL,
@@ -107,21 +196,33 @@ def init_db():
         )
     """)
 
-    cursor.execute("PRAGMA table_info(submissions)")
-    submission_columns = [row[1] for row in cursor.fetchall()]
-    if "execution_mode" not in submission_columns:
-        cursor.execute("ALTER TABLE submissions ADD COLUMN execution_mode TEXT")
-    if "last_failed_stage" not in submission_columns:
-        cursor.execute("ALTER TABLE submissions ADD COLUMN last_failed_stage TEXT")
-
-    cursor.execute("PRAGMA table_info(generated_reports)")
-    report_columns = [row[1] for row in cursor.fetchall()]
-    if "sections_done" not in report_columns:
-        cursor.execute("ALTER TABLE generated_reports ADD COLUMN sections_done INTEGER DEFAULT 0")
-    if "sections_total" not in report_columns:
-        cursor.execute("ALTER TABLE generated_reports ADD COLUMN sections_total INTEGER DEFAULT 0")
-    if "current_section" not in report_columns:
-        cursor.execute("ALTER TABLE generated_reports ADD COLUMN current_section TEXT")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS report_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            submission_id INTEGER NOT NULL UNIQUE,
+            status TEXT NOT NULL DEFAULT 'queued',
+            priority INTEGER NOT NULL DEFAULT 0,
+            force INTEGER NOT NULL DEFAULT 0,
+            error_message TEXT,
+            enqueued_at TEXT NOT NULL,
+            started_at TEXT,
+            finished_at TEXT,
+            FOREIGN KEY (submission_id) REFERENCES submissions(id)
+        )
+    """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS llm_response_cache (
+            cache_key TEXT PRIMARY KEY,
+            route TEXT NOT NULL,
+            max_tokens INTEGER NOT NULL,
+            content TEXT NOT NULL,
+            content_size INTEGER NOT NULL,
+            hit_count INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL,
+            last_used_at TEXT NOT NULL
+        )
+    """)
 
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS locations (
@@ -134,6 +235,9 @@ def init_db():
         )
     """)
 
+    # Column additions and indexes since the tables above were first created.
+    apply_migrations(cursor)
+
     cursor.execute("SELECT COUNT(*) FROM locations")
     location_count = cursor.fetchone()[0]
     if location_count == 0:
@@ -161,7 +265,7 @@ def save_submission(payload: Dict[str, Any]) -> int:
     Returns:
         The submission ID
     """
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
     
     created_at = datetime.utcnow().isoformat()
@@ -197,7 +301,7 @@ def get_submission(submission_id: int) -> Optional[Dict[str, Any]]:
     Returns:
         Dictionary with submission data or None if not found
     """
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
     
     cursor.execute(
@@ -232,7 +336,7 @@ def update_submission_fields(submission_id: int, updates: Dict[str, Any]) -> Opt
     Returns:
         Updated submission payload with id/created_at, or None if not found
     """
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
 
     cursor.execute(
@@ -274,7 +378,7 @@ def get_cached_section(submission_id: int, section_name: str) -> Optional[str]:
     Returns:
         Section content string or None if not found
     """
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
     
     cursor.execute(
@@ -285,7 +389,7 @@ def get_cached_section(submission_id: int, section_name: str) -> Optional[str]:
     row = cursor.fetchone()
     conn.close()
     
-    return row[0] if row else None
+    return decompress_text(row[0]) if row else None
 
 
 def save_section(submission_id: int, section_name: str, content: str) -> None:
@@ -297,7 +401,7 @@ def save_section(submission_id: int, section_name: str, content: str) -> None:
         section_name: Name of the section
         content: Generated content for the section
     """
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
     
     created_at = datetime.utcnow().isoformat()
@@ -309,7 +413,7 @@ def save_section(submission_id: int, section_name: str, content: str) -> None:
         ON CONFLICT(submission_id, section_name) 
         DO UPDATE SET content = excluded.content, created_at = excluded.created_at
         """,
-        (submission_id, section_name, content, created_at)
+        (submission_id, section_name, compress_text(content), created_at)
     )
     
     conn.commit()
@@ -317,7 +421,7 @@ def save_section(submission_id: int, section_name: str, content: str) -> None:
 
 
 def get_submission_baseline_lock(submission_id: int) -> Optional[Dict[str, Any]]:
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute(
         "SELECT baseline_json, baseline_hash, created_at FROM baseline_locks WHERE submission_id = ?",
@@ -338,7 +442,7 @@ def get_submission_baseline_lock(submission_id: int) -> Optional[Dict[str, Any]]
 
 
 def save_submission_baseline_lock(submission_id: int, baseline: Dict[str, Any], baseline_hash: str) -> None:
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
     created_at = datetime.utcnow().isoformat()
     cursor.execute(
@@ -357,6 +461,53 @@ def save_submission_baseline_lock(submission_id: int, baseline: Dict[str, Any],
     conn.close()
 
 
+_UPSERT_STAGE_CHECKPOINT_SQL = """
+    INSERT INTO stage_checkpoints (
+        submission_id, stage_name, baseline_hash, status, attempt_count,
+        error_message, output_hash, output_size, created_at, updated_at
+    )
+    VALUES (?, ?, ?, ?, 1, ?, ?, ?, ?, ?)
+    ON CONFLICT(submission_id, stage_name)
+    DO UPDATE SET
+        baseline_hash = excluded.baseline_hash,
+        status = excluded.status,
+        attempt_count = stage_checkpoints.attempt_count + 1,
+        error_message = excluded.error_message,
+        output_hash = excluded.output_hash,
+        output_size = excluded.output_size,
+        updated_at = excluded.updated_at
+"""
+
+_INSERT_VALIDATION_EVENT_SQL = """
+    INSERT INTO validation_events (submission_id, stage_name, event_type, passed, details_json, created_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+
+def _stage_checkpoint_params(
+    submission_id: int,
+    stage_name: str,
+    baseline_hash: str,
+    status: str,
+    error_message: Optional[str] = None,
+    output_hash: str = "",
+    output_size: int = 0,
+) -> tuple:
+    now = datetime.utcnow().isoformat()
+    return (submission_id, stage_name, baseline_hash, status, error_message, output_hash, output_size, now, now)
+
+
+def _validation_event_params(
+    submission_id: int,
+    stage_name: str,
+    event_type: str,
+    passed: bool,
+    details: Optional[Dict[str, Any]] = None,
+) -> tuple:
+    created_at = datetime.utcnow().isoformat()
+    return (submission_id, stage_name, event_type, 1 if passed else 0, compress_text(json.dumps(details or {}, default=str)), created_at)
+
+
 def upsert_stage_checkpoint(
     submission_id: int,
     stage_name: str,
@@ -366,40 +517,12 @@ def upsert_stage_checkpoint(
     output_hash: str = "",
     output_size: int = 0,
 ) -> None:
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
-    now = datetime.utcnow().isoformat()
-
     cursor.execute(
-        """
-        INSERT INTO stage_checkpoints (
-            submission_id, stage_name, baseline_hash, status, attempt_count,
-            error_message, output_hash, output_size, created_at, updated_at
-        )
-        VALUES (?, ?, ?, ?, 1, ?, ?, ?, ?, ?)
-        ON CONFLICT(submission_id, stage_name)
-        DO UPDATE SET
-            baseline_hash = excluded.baseline_hash,
-            status = excluded.status,
-            attempt_count = stage_checkpoints.attempt_count + 1,
-            error_message = excluded.error_message,
-            output_hash = excluded.output_hash,
-            output_size = excluded.output_size,
-            updated_at = excluded.updated_at
-        """,
-        (
-            submission_id,
-            stage_name,
-            baseline_hash,
-            status,
-            error_message,
-            output_hash,
-            output_size,
-            now,
-            now,
-        ),
+        _UPSERT_STAGE_CHECKPOINT_SQL,
+        _stage_checkpoint_params(submission_id, stage_name, baseline_hash, status, error_message, output_hash, output_size),
     )
-
     conn.commit()
     conn.close()
 
@@ -411,29 +534,81 @@ def add_validation_event(
     passed: bool,
     details: Optional[Dict[str, Any]] = None,
 ) -> None:
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
-    created_at = datetime.utcnow().isoformat()
     cursor.execute(
-        """
-        INSERT INTO validation_events (submission_id, stage_name, event_type, passed, details_json, created_at)
-        VALUES (?, ?, ?, ?, ?, ?)
-        """,
-        (
-            submission_id,
-            stage_name,
-            event_type,
-            1 if passed else 0,
-            json.dumps(details or {}, default=str),
-            created_at,
-        ),
+        _INSERT_VALIDATION_EVENT_SQL,
+        _validation_event_params(submission_id, stage_name, event_type, passed, details),
     )
     conn.commit()
     conn.close()
 
 
+class StageRecordBuffer:
+    """
+    Drop-in replacement for add_validation_event / upsert_stage_checkpoint that
+    queues the writes in memory and commits them, in call order, in a single
+    transaction on flush(). The staged pipeline flushes when a stage starts
+    and when it ends, and closes the buffer when the run is over.
+
+    Rows are timestamped when queued, and get_validation_events /
+    get_stage_checkpoints flush any open buffer for the submission first, so
+    reads see exactly what an unbuffered writer would have written.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: list[tuple[int, str, tuple]] = []
+        with _open_buffers_lock:
+            _open_buffers.add(self)
+
+    def upsert_stage_checkpoint(self, submission_id: int, stage_name: str, baseline_hash: str, status: str, **kwargs) -> None:
+        params = _stage_checkpoint_params(submission_id, stage_name, baseline_hash, status, **kwargs)
+        with self._lock:
+            self._pending.append((submission_id, _UPSERT_STAGE_CHECKPOINT_SQL, params))
+
+    def add_validation_event(self, submission_id: int, stage_name: str, event_type: str, passed: bool, details: Optional[Dict[str, Any]] = None) -> None:
+        params = _validation_event_params(submission_id, stage_name, event_type, passed, details)
+        with self._lock:
+            self._pending.append((submission_id, _INSERT_VALIDATION_EVENT_SQL, params))
+
+    def flush(self, submission_id: Optional[int] = None) -> int:
+        """Commit queued writes (only those for submission_id, if given); returns how many were written."""
+        # Held for the whole write so a concurrent flush cannot commit later rows first.
+        with self._lock:
+            batch = [op for op in self._pending if submission_id is None or op[0] == submission_id]
+            if not batch:
+                return 0
+            conn = get_connection()
+            cursor = conn.cursor()
+            for _, sql, params in batch:
+                cursor.execute(sql, params)
+            conn.commit()
+            conn.close()
+            self._pending = [op for op in self._pending if submission_id is not None and op[0] != submission_id]
+            return len(batch)
+
+    def close(self) -> None:
+        """Flush everything and stop tracking this buffer."""
+        self.flush()
+        with _open_buffers_lock:
+            _open_buffers.discard(self)
+
+
+_open_buffers: "weakref.WeakSet[StageRecordBuffer]" = weakref.WeakSet()
+_open_buffers_lock = threading.Lock()
+
+
+def _flush_stage_records(submission_id: int) -> None:
+    with _open_buffers_lock:
+        buffers = list(_open_buffers)
+    for buffer in buffers:
+        buffer.flush(submission_id)
+
+
 def get_stage_checkpoints(submission_id: int) -> list[Dict[str, Any]]:
-    conn = sqlite3.connect(DB_PATH)
+    _flush_stage_records(submission_id)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute(
         """
@@ -463,7 +638,8 @@ def get_stage_checkpoints(submission_id: int) -> list[Dict[str, Any]]:
 
 
 def get_validation_events(submission_id: int) -> list[Dict[str, Any]]:
-    conn = sqlite3.connect(DB_PATH)
+    _flush_stage_records(submission_id)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute(
         """
@@ -481,7 +657,7 @@ def get_validation_events(submission_id: int) -> list[Dict[str, Any]]:
             "stage_name": row[0],
             "event_type": row[1],
             "passed": bool(row[2]),
-            "details": json.loads(row[3]) if row[3] else {},
+            "details": json.loads(decompress_text(row[3])) if row[3] else {},
             "created_at": row[4],
         }
         for row in rows
@@ -489,7 +665,7 @@ def get_validation_events(submission_id: int) -> list[Dict[str, Any]]:
 
 
 def set_submission_execution_mode(submission_id: int, mode: str) -> None:
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute(
         "UPDATE submissions SET execution_mode = ? WHERE id = ?",
@@ -500,7 +676,7 @@ def set_submission_execution_mode(submission_id: int, mode: str) -> None:
 
 
 def get_submission_execution_mode(submission_id: int) -> Optional[str]:
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute(
         "SELECT execution_mode FROM submissions WHERE id = ?",
@@ -514,7 +690,7 @@ def get_submission_execution_mode(submission_id: int) -> Optional[str]:
 
 
 def set_submission_last_failed_stage(submission_id: int, stage_name: Optional[str]) -> None:
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute(
         "UPDATE submissions SET last_failed_stage = ? WHERE id = ?",
@@ -534,7 +710,7 @@ def upsert_assumptions_review(
     baseline: Optional[Dict[str, Any]] = None,
     baseline_hash: Optional[str] = None,
 ) -> None:
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
     now = datetime.utcnow().isoformat()
     approved_at = now if approved else None
@@ -577,7 +753,7 @@ def upsert_assumptions_review(
 
 
 def get_assumptions_review(submission_id: int) -> Optional[Dict[str, Any]]:
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute(
         """
@@ -610,40 +786,65 @@ def get_assumptions_review(submission_id: int) -> Optional[Dict[str, Any]]:
 def upsert_report_status(
     submission_id: int,
     status: str,
-    doc_bytes: Optional[bytes] = None,
+    doc_sha256: Optional[str] = None,
     error_message: Optional[str] = None,
     sections_done: Optional[int] = None,
     sections_total: Optional[int] = None,
     current_section: Optional[str] = None,
+    doc_size: Optional[int] = None,
 ) -> None:
-    conn = sqlite3.connect(DB_PATH)
+    """doc_sha256/doc_size point at the finished .docx in app.blob_store."""
+    conn = get_connection()
     cursor = conn.cursor()
     now = datetime.utcnow().isoformat()
     cursor.execute(
         """
         INSERT INTO generated_reports
-            (submission_id, status, doc_bytes, error_message, sections_done, sections_total, current_section, created_at, updated_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            (submission_id, status, doc_sha256, doc_size, error_message, sections_done, sections_total, current_section, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ON CONFLICT(submission_id) DO UPDATE SET
             status = excluded.status,
-            doc_bytes = COALESCE(excluded.doc_bytes, generated_reports.doc_bytes),
+            doc_sha256 = COALESCE(excluded.doc_sha256, generated_reports.doc_sha256),
+            doc_size = COALESCE(excluded.doc_size, generated_reports.doc_size),
             error_message = excluded.error_message,
             sections_done = COALESCE(excluded.sections_done, generated_reports.sections_done),
             sections_total = COALESCE(excluded.sections_total, generated_reports.sections_total),
             current_section = COALESCE(excluded.current_section, generated_reports.current_section),
             updated_at = excluded.updated_at
         """,
-        (submission_id, status, doc_bytes, error_message, sections_done, sections_total, current_section, now, now),
+        (submission_id, status, doc_sha256, doc_size, error_message, sections_done, sections_total, current_section, now, now),
+    )
+    conn.commit()
+    conn.close()
+
+    changes = {"status": status, "error_message": error_message, "updated_at": now}
+    for key, value in (("sections_done", sections_done), ("sections_total", sections_total), ("current_section", current_section)):
+        if value is not None:
+            changes[key] = value
+    progress_bus.publish(submission_id, changes)
+
+
+def update_report_progress(submission_id: int, current_section: str) -> None:
+    """Update only the progress message, and only while the report is still generating."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    now = datetime.utcnow().isoformat()
+    cursor.execute(
+        "UPDATE generated_reports SET current_section = ?, updated_at = ? WHERE submission_id = ? AND status = 'generating'",
+        (current_section, now, submission_id),
     )
+    updated = cursor.rowcount > 0
     conn.commit()
     conn.close()
+    if updated:
+        progress_bus.publish(submission_id, {"current_section": current_section, "updated_at": now})
 
 
 def get_report_record(submission_id: int) -> Optional[Dict[str, Any]]:
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute(
-        "SELECT status, doc_bytes, error_message, sections_done, sections_total, current_section FROM generated_reports WHERE submission_id = ?",
+        "SELECT status, doc_sha256, doc_size, error_message, sections_done, sections_total, current_section, updated_at FROM generated_reports WHERE submission_id = ?",
         (submission_id,),
     )
     row = cursor.fetchone()
@@ -652,11 +853,162 @@ def get_report_record(submission_id: int) -> Optional[Dict[str, Any]]:
         return None
     return {
         "status": row[0],
-        "doc_bytes": row[1],
-        "error_message": row[2],
-        "sections_done": row[3] or 0,
-        "sections_total": row[4] or 0,
-        "current_section": row[5],
+        "doc_sha256": row[1],
+        "doc_size": row[2],
+        "error_message": row[3],
+        "sections_done": row[4] or 0,
+        "sections_total": row[5] or 0,
+        "current_section": row[6],
+        "updated_at": row[7],
+    }
+
+
+def get_inline_report_ids() -> list[int]:
+    """Submissions whose .docx is still stored inline in generated_reports.doc_bytes."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT submission_id FROM generated_reports WHERE doc_bytes IS NOT NULL")
+    rows = cursor.fetchall()
+    conn.close()
+    return [row[0] for row in rows]
+
+
+def get_inline_report_doc(submission_id: int) -> Optional[bytes]:
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT doc_bytes FROM generated_reports WHERE submission_id = ?", (submission_id,))
+    row = cursor.fetchone()
+    conn.close()
+    return row[0] if row else None
+
+
+def set_report_doc(submission_id: int, doc_sha256: str, doc_size: int) -> None:
+    """Point a report at its blob-store file and drop any inline copy."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "UPDATE generated_reports SET doc_sha256 = ?, doc_size = ?, doc_bytes = NULL WHERE submission_id = ?",
+        (doc_sha256, doc_size, submission_id),
+    )
+    conn.commit()
+    conn.close()
+
+
+def save_report_token_usage(submission_id: int, usage: Dict[str, int]) -> None:
+    """Record the LLM token usage of a report's latest generation (see llm_client.TokenUsageLedger)."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        UPDATE generated_reports
+        SET llm_calls = ?, input_tokens = ?, output_tokens = ?, cache_read_tokens = ?, cache_write_tokens = ?
+        WHERE submission_id = ?
+        """,
+        (
+            usage.get("calls", 0),
+            usage.get("input_tokens", 0),
+            usage.get("output_tokens", 0),
+            usage.get("cache_read_input_tokens", 0),
+            usage.get("cache_creation_input_tokens", 0),
+            submission_id,
+        ),
+    )
+    conn.commit()
+    conn.close()
+
+
+def get_report_token_usage(submission_id: int) -> Optional[Dict[str, int]]:
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        SELECT llm_calls, input_tokens, output_tokens, cache_read_tokens, cache_write_tokens
+        FROM generated_reports WHERE submission_id = ?
+        """,
+        (submission_id,),
+    )
+    row = cursor.fetchone()
+    conn.close()
+    if not row:
+        return None
+    return {
+        "llm_calls": row[0] or 0,
+        "input_tokens": row[1] or 0,
+        "output_tokens": row[2] or 0,
+        "cache_read_tokens": row[3] or 0,
+        "cache_write_tokens": row[4] or 0,
+    }
+
+
+SECTION_METRIC_COLUMNS = (
+    "submission_id", "run_id", "section_name", "status", "cache", "model", "generation_mode",
+    "start_offset_ms", "queue_wait_ms", "render_ms", "llm_ms", "total_ms", "docx_render_ms",
+    "llm_calls", "retries", "input_tokens", "output_tokens", "cache_read_tokens", "cache_write_tokens",
+    "cost_usd", "error", "created_at",
+)
+
+
+def save_section_metrics(rows: list[Dict[str, Any]]) -> None:
+    """Insert section_metrics rows (dicts keyed by SECTION_METRIC_COLUMNS) in one transaction."""
+    if not rows:
+        return
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.executemany(
+        f"INSERT INTO section_metrics ({', '.join(SECTION_METRIC_COLUMNS)}) "
+        f"VALUES ({', '.join('?' * len(SECTION_METRIC_COLUMNS))})",
+        [tuple(row.get(column) for column in SECTION_METRIC_COLUMNS) for row in rows],
+    )
+    conn.commit()
+    conn.close()
+
+
+def get_section_metrics(submission_id: int, run_id: Optional[str] = None) -> list[Dict[str, Any]]:
+    """section_metrics rows of one generation run (the latest when run_id is None), in start order."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    if run_id is None:
+        cursor.execute(
+            "SELECT run_id FROM section_metrics WHERE submission_id = ? ORDER BY id DESC LIMIT 1",
+            (submission_id,),
+        )
+        row = cursor.fetchone()
+        if not row:
+            conn.close()
+            return []
+        run_id = row[0]
+    cursor.execute(
+        f"""
+        SELECT {', '.join(SECTION_METRIC_COLUMNS)} FROM section_metrics
+        WHERE submission_id = ? AND run_id = ?
+        ORDER BY start_offset_ms ASC, id ASC
+        """,
+        (submission_id, run_id),
+    )
+    rows = cursor.fetchall()
+    conn.close()
+    return [dict(zip(SECTION_METRIC_COLUMNS, row)) for row in rows]
+
+
+def get_report_progress(submission_id: int) -> Optional[Dict[str, Any]]:
+    """Status and progress fields of a report, without the document BLOB."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT status, error_message, sections_done, sections_total, current_section, updated_at FROM generated_reports WHERE submission_id = ?",
+        (submission_id,),
+    )
+    row = cursor.fetchone()
+    conn.close()
+    if row is None:
+        return None
+    return {
+        "status": row[0],
+        "error_message": row[1],
+        "sections_done": row[2] or 0,
+        "sections_total": row[3] or 0,
+        "current_section": row[4],
+        "updated_at": row[5],
     }
 
 
@@ -668,7 +1020,7 @@ def get_any_generating_submission_id() -> Optional[int]:
 
 def get_any_generating_report_lock() -> Optional[Dict[str, Any]]:
     """Return metadata for the most recently updated generating report lock."""
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute(
         """
@@ -690,3 +1042,170 @@ def get_any_generating_report_lock() -> Optional[Dict[str, Any]]:
         "current_section": row[3],
         "updated_at": row[4],
     }
+
+
+def enqueue_report_job(submission_id: int, priority: int = 0, force: bool = False) -> str:
+    """Queue a report job, resetting any finished job previously recorded for the submission. Returns enqueued_at."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    now = datetime.utcnow().isoformat()
+    cursor.execute(
+        """
+        INSERT INTO report_jobs (submission_id, status, priority, force, enqueued_at)
+        VALUES (?, 'queued', ?, ?, ?)
+        ON CONFLICT(submission_id) DO UPDATE SET
+            status = 'queued',
+            priority = excluded.priority,
+            force = excluded.force,
+            error_message = NULL,
+            enqueued_at = excluded.enqueued_at,
+            started_at = NULL,
+            finished_at = NULL
+        """,
+        (submission_id, priority, 1 if force else 0, now),
+    )
+    conn.commit()
+    conn.close()
+    return now
+
+
+def get_report_jobs(statuses: tuple = ("queued", "running")) -> list[Dict[str, Any]]:
+    """Return report jobs in the given statuses, oldest first."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    placeholders = ", ".join("?" for _ in statuses)
+    cursor.execute(
+        f"""
+        SELECT submission_id, status, priority, force, enqueued_at, started_at
+        FROM report_jobs
+        WHERE status IN ({placeholders})
+        ORDER BY enqueued_at ASC
+        """,
+        tuple(statuses),
+    )
+    rows = cursor.fetchall()
+    conn.close()
+    return [
+        {
+            "submission_id": row[0],
+            "status": row[1],
+            "priority": row[2] or 0,
+            "force": bool(row[3]),
+            "enqueued_at": row[4],
+            "started_at": row[5],
+        }
+        for row in rows
+    ]
+
+
+def set_report_job_status(submission_id: int, status: str, error_message: Optional[str] = None) -> None:
+    """Move a report job to running/done/failed, stamping start and finish times, or back to queued."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    now = datetime.utcnow().isoformat()
+    if status == "queued":
+        cursor.execute(
+            "UPDATE report_jobs SET status = ?, started_at = NULL, finished_at = NULL WHERE submission_id = ?",
+            (status, submission_id),
+        )
+    elif status == "running":
+        cursor.execute(
+            "UPDATE report_jobs SET status = ?, started_at = ?, error_message = NULL WHERE submission_id = ?",
+            (status, now, submission_id),
+        )
+    else:
+        cursor.execute(
+            "UPDATE report_jobs SET status = ?, finished_at = ?, error_message = ? WHERE submission_id = ?",
+            (status, now, error_message, submission_id),
+        )
+    conn.commit()
+    conn.close()
+
+
+def requeue_running_report_jobs() -> int:
+    """Return jobs left 'running' by a crashed process to the queue. Returns how many were requeued."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "UPDATE report_jobs SET status = 'queued', started_at = NULL WHERE status = 'running'"
+    )
+    requeued = cursor.rowcount
+    conn.commit()
+    conn.close()
+    return requeued
+
+
+def get_llm_cache_entry(cache_key: str, not_before: str) -> Optional[str]:
+    """Return cached LLM output created at or after not_before, marking it as recently used."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT content FROM llm_response_cache WHERE cache_key = ? AND created_at >= ?",
+        (cache_key, not_before),
+    )
+    row = cursor.fetchone()
+    if row is not None:
+        cursor.execute(
+            "UPDATE llm_response_cache SET hit_count = hit_count + 1, last_used_at = ? WHERE cache_key = ?",
+            (datetime.utcnow().isoformat(), cache_key),
+        )
+        conn.commit()
+    conn.close()
+    return decompress_text(row[0]) if row else None
+
+
+def save_llm_cache_entry(
+    cache_key: str,
+    route: str,
+    max_tokens: int,
+    content: str,
+    not_before: str,
+    max_total_bytes: int,
+) -> None:
+    """
+    Store LLM output, then evict expired entries and least-recently-used entries
+    until the cache fits within max_total_bytes (counted as stored, i.e. compressed, bytes).
+    """
+    stored = compress_text(content)
+    conn = get_connection()
+    cursor = conn.cursor()
+    now = datetime.utcnow().isoformat()
+    cursor.execute(
+        """
+        INSERT INTO llm_response_cache
+            (cache_key, route, max_tokens, content, content_size, hit_count, created_at, last_used_at)
+        VALUES (?, ?, ?, ?, ?, 0, ?, ?)
+        ON CONFLICT(cache_key) DO UPDATE SET
+            content = excluded.content,
+            content_size = excluded.content_size,
+            created_at = excluded.created_at,
+            last_used_at = excluded.last_used_at
+        """,
+        (cache_key, route, max_tokens, stored, stored_size(stored), now, now),
+    )
+    cursor.execute("DELETE FROM llm_response_cache WHERE created_at < ?", (not_before,))
+    cursor.execute(
+        """
+        DELETE FROM llm_response_cache
+        WHERE cache_key IN (
+            SELECT cache_key FROM (
+                SELECT cache_key,
+                       SUM(content_size) OVER (ORDER BY last_used_at DESC, cache_key) AS running_size
+                FROM llm_response_cache
+            )
+            WHERE running_size > ?
+        )
+        """,
+        (max_total_bytes,),
+    )
+    conn.commit()
+    conn.close()
+
+
+def get_llm_cache_usage() -> Dict[str, int]:
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*), COALESCE(SUM(content_size), 0) FROM llm_response_cache")
+    row = cursor.fetchone()
+    conn.close()
+    return {"entries": row[0], "bytes": row[1]}
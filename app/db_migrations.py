@@ -0,0 +1,154 @@
+"""
+Versioned schema migrations applied by db.init_db.
+
+init_db creates the original tables; every later schema change is a numbered
+entry in MIGRATIONS. Applied versions are recorded in `schema_migrations`, so
+each migration runs once per database. Migrations must stay idempotent because
+databases created before this table existed already carry some of the columns
+that the early entries add.
+
+To change the schema, append a new (version, name, function) entry; never edit
+or renumber one that has shipped.
+"""
+import sqlite3
+from datetime import datetime
+from typing import Callable, List, Tuple
+
+
+def _add_column_if_missing(cursor: sqlite3.Cursor, table: str, column: str, declaration: str) -> None:
+    cursor.execute(f"PRAGMA table_info({table})")
+    if column not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+
+def _submission_execution_columns(cursor: sqlite3.Cursor) -> None:
+    _add_column_if_missing(cursor, "submissions", "execution_mode", "TEXT")
+    _add_column_if_missing(cursor, "submissions", "last_failed_stage", "TEXT")
+
+
+def _report_progress_columns(cursor: sqlite3.Cursor) -> None:
+    _add_column_if_missing(cursor, "generated_reports", "sections_done", "INTEGER DEFAULT 0")
+    _add_column_if_missing(cursor, "generated_reports", "sections_total", "INTEGER DEFAULT 0")
+    _add_column_if_missing(cursor, "generated_reports", "current_section", "TEXT")
+
+
+def _report_blob_pointer_columns(cursor: sqlite3.Cursor) -> None:
+    _add_column_if_missing(cursor, "generated_reports", "doc_sha256", "TEXT")
+    _add_column_if_missing(cursor, "generated_reports", "doc_size", "INTEGER")
+
+
+def _lookup_indexes(cursor: sqlite3.Cursor) -> None:
+    # Covers get_any_generating_report_lock entirely: the status filter, the
+    # updated_at ordering and every selected column come from the index.
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_generated_reports_status_updated
+        ON generated_reports (status, updated_at, submission_id, sections_done, sections_total, current_section)
+        """
+    )
+    # get_validation_events: seek by submission, rows already in created_at order.
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_validation_events_submission_created ON validation_events (submission_id, created_at)"
+    )
+    # get_stage_checkpoints orders by created_at within a submission.
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_stage_checkpoints_submission_created ON stage_checkpoints (submission_id, created_at)"
+    )
+    # get_report_jobs filters on status and orders by enqueued_at.
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_report_jobs_status_enqueued ON report_jobs (status, enqueued_at)")
+    # LLM cache expiry deletes by created_at; LRU eviction orders by last_used_at.
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_llm_response_cache_created ON llm_response_cache (created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_llm_response_cache_last_used ON llm_response_cache (last_used_at)")
+
+
+def _report_token_usage_columns(cursor: sqlite3.Cursor) -> None:
+    _add_column_if_missing(cursor, "generated_reports", "llm_calls", "INTEGER DEFAULT 0")
+    _add_column_if_missing(cursor, "generated_reports", "input_tokens", "INTEGER DEFAULT 0")
+    _add_column_if_missing(cursor, "generated_reports", "output_tokens", "INTEGER DEFAULT 0")
+    _add_column_if_missing(cursor, "generated_reports", "cache_read_tokens", "INTEGER DEFAULT 0")
+    _add_column_if_missing(cursor, "generated_reports", "cache_write_tokens", "INTEGER DEFAULT 0")
+
+
+def _section_metrics_table(cursor: sqlite3.Cursor) -> None:
+    # One row per get_or_generate_section call; see app/section_metrics.py.
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS section_metrics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            submission_id INTEGER NOT NULL,
+            run_id TEXT NOT NULL,
+            section_name TEXT NOT NULL,
+            status TEXT NOT NULL,
+            cache TEXT NOT NULL,
+            model TEXT,
+            generation_mode TEXT,
+            start_offset_ms REAL,
+            queue_wait_ms REAL,
+            render_ms REAL,
+            llm_ms REAL,
+            total_ms REAL,
+            docx_render_ms REAL,
+            llm_calls INTEGER DEFAULT 0,
+            retries INTEGER DEFAULT 0,
+            input_tokens INTEGER DEFAULT 0,
+            output_tokens INTEGER DEFAULT 0,
+            cache_read_tokens INTEGER DEFAULT 0,
+            cache_write_tokens INTEGER DEFAULT 0,
+            cost_usd REAL DEFAULT 0,
+            error TEXT,
+            created_at TEXT NOT NULL,
+            FOREIGN KEY (submission_id) REFERENCES submissions(id)
+        )
+        """
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_section_metrics_submission_run ON section_metrics (submission_id, run_id, id)"
+    )
+
+
+def _narrow_report_status_index(cursor: sqlite3.Cursor) -> None:
+    # The covering version of this index (migration 4) also held the progress
+    # columns, which every streamed progress update rewrites. Status reads are
+    # served from memory (app.progress_bus), so the filter and ordering suffice.
+    cursor.execute("DROP INDEX IF EXISTS idx_generated_reports_status_updated")
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_generated_reports_status_updated ON generated_reports (status, updated_at)"
+    )
+
+
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Cursor], None]]] = [
+    (1, "submission_execution_columns", _submission_execution_columns),
+    (2, "report_progress_columns", _report_progress_columns),
+    (3, "report_blob_pointer_columns", _report_blob_pointer_columns),
+    (4, "lookup_indexes", _lookup_indexes),
+    (5, "report_token_usage_columns", _report_token_usage_columns),
+    (6, "section_metrics_table", _section_metrics_table),
+    (7, "narrow_report_status_index", _narrow_report_status_index),
+]
+
+
+def apply_migrations(cursor: sqlite3.Cursor) -> List[int]:
+    """Run every migration not yet recorded in schema_migrations; returns the versions applied."""
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        )
+        """
+    )
+    cursor.execute("SELECT version FROM schema_migrations")
+    applied = {row[0] for row in cursor.fetchall()}
+
+    newly_applied = []
+    for version, name, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+        migrate(cursor)
+        cursor.execute(
+            "INSERT OR IGNORE INTO schema_migrations (version, name, applied_at) VALUES (?, ?, ?)",
+            (version, name, datetime.utcnow().isoformat()),
+        )
+        newly_applied.append(version)
+    return newly_applied
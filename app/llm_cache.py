@@ -0,0 +1,101 @@
+"""
+Content-addressed cache for LLM section output.
+
+Entries are keyed by a hash of the rendered prompt, the route that would serve
+the call (provider, model and generation mode) and max_tokens, so identical
+prompts from different submissions, or a forced rerun whose prompt did not
+change, reuse the earlier answer instead of paying for a new call.
+
+Entries live in the `llm_response_cache` table, expire after
+LLM_CACHE_TTL_HOURS and are evicted least-recently-used first once the cache
+grows past LLM_CACHE_MAX_MB.
+"""
+import hashlib
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from app import telemetry
+from app.config import Config
+from app.db import get_llm_cache_entry, get_llm_cache_usage, save_llm_cache_entry
+
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "stores": 0}
+
+
+def _lookup_counts() -> Dict[tuple, float]:
+    with _stats_lock:
+        return {("hit",): _stats["hits"], ("miss",): _stats["misses"]}
+
+
+def _hit_ratio() -> float:
+    counts = _lookup_counts()
+    return telemetry.hit_ratio(counts[("hit",)], counts[("miss",)])
+
+
+telemetry.Callback(
+    "llm_cache_lookups_total", "LLM response cache lookups by result.", _lookup_counts,
+    kind="counter", label_names=("result",),
+)
+telemetry.Callback(
+    "llm_cache_hit_ratio", "Share of LLM response cache lookups answered from the cache since start.",
+    _hit_ratio,
+)
+
+
+def make_key(prompt: str, route: str, max_tokens: int) -> str:
+    digest = hashlib.sha256()
+    for part in (route, str(max_tokens), prompt):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _not_before() -> str:
+    return (datetime.utcnow() - timedelta(hours=Config.LLM_CACHE_TTL_HOURS)).isoformat()
+
+
+def _count(name: str) -> None:
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def get(key: str) -> Optional[str]:
+    if not Config.LLM_CACHE_ENABLED:
+        return None
+    try:
+        content = get_llm_cache_entry(key, _not_before())
+    except Exception:
+        content = None  # non-fatal: fall through to a live call
+    _count("hits" if content else "misses")
+    return content or None
+
+
+def set(key: str, route: str, max_tokens: int, content: str) -> None:
+    if not Config.LLM_CACHE_ENABLED or not content:
+        return
+    try:
+        save_llm_cache_entry(
+            key,
+            route,
+            max_tokens,
+            content,
+            not_before=_not_before(),
+            max_total_bytes=int(Config.LLM_CACHE_MAX_MB * 1024 * 1024),
+        )
+        _count("stores")
+    except Exception:
+        pass  # non-fatal
+
+
+def stats() -> Dict[str, Any]:
+    with _stats_lock:
+        counters = dict(_stats)
+    lookups = counters["hits"] + counters["misses"]
+    counters["hit_ratio"] = round(counters["hits"] / lookups, 4) if lookups else 0.0
+    counters["enabled"] = Config.LLM_CACHE_ENABLED
+    try:
+        counters.update(get_llm_cache_usage())
+    except Exception:
+        pass
+    return counters
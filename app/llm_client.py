@@ -1,17 +1,415 @@
 import os
 import time
 import random
+import asyncio
+import contextvars
+import threading
+import weakref
+from typing import Any, Callable, Dict, List, Optional
 from dotenv import load_dotenv
 from app.config import Config
+from app import telemetry
 
 load_dotenv()
 
+CLAUDE_MODEL = "claude-sonnet-4-6"
+
+# Rough English-text ratio used to estimate input tokens before a call is made.
+CHARS_PER_TOKEN = 3.5
+
+
+def prompt_cache_min_tokens(model: str) -> int:
+    """Shortest prefix Anthropic caches for a model; a shorter cache_control prefix is billed as plain input."""
+    return 2048 if "haiku" in model else 1024
+
+
+class TokenBucketRateLimiter:
+    """
+    Proactive tokens-per-minute budget shared by every thread and every report.
+
+    Each call reserves its estimated tokens up front. The bucket may go into
+    debt; the caller then sleeps exactly long enough for the debt to refill,
+    which admits calls in the order they asked and avoids busy polling.
+    A limit of 0 disables the limiter.
+    """
+
+    def __init__(self, tokens_per_minute: int):
+        self.tokens_per_minute = max(0, tokens_per_minute)
+        self._rate = self.tokens_per_minute / 60.0
+        self._tokens = float(self.tokens_per_minute)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.tokens_per_minute > 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(float(self.tokens_per_minute), self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def reserve(self, tokens: int) -> float:
+        """Reserve tokens and return how many seconds the caller must wait before sending."""
+        if not self.enabled:
+            return 0.0
+        with self._lock:
+            self._refill()
+            self._tokens -= min(tokens, self.tokens_per_minute)
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self._rate
+
+    def acquire(self, tokens: int) -> None:
+        wait_s = self.reserve(tokens)
+        if wait_s > 0:
+            time.sleep(wait_s)
+
+    async def acquire_async(self, tokens: int) -> None:
+        wait_s = self.reserve(tokens)
+        if wait_s > 0:
+            await asyncio.sleep(wait_s)
+
+    def settle(self, reserved: int, actual: int) -> None:
+        """Return (or charge) the difference between the estimate and the real usage."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._refill()
+            self._tokens = min(float(self.tokens_per_minute), self._tokens + (min(reserved, self.tokens_per_minute) - actual))
+
+    def penalize(self) -> None:
+        """Drain the bucket after a 429 so every caller pauses, not just the one that failed."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, 0.0)
+
+
+def estimate_request_tokens(request: Dict[str, Any]) -> int:
+    """Estimate input tokens (system + messages) plus the max_tokens output allowance."""
+    system = request.get("system") or ""
+    if isinstance(system, list):
+        text_chars = sum(len(block.get("text", "")) for block in system)
+    else:
+        text_chars = len(str(system))
+    for message in request.get("messages") or []:
+        text_chars += len(str(message.get("content") or ""))
+    return int(text_chars / CHARS_PER_TOKEN) + int(request.get("max_tokens") or 0)
+
+
+# One budget for the whole process: all section threads of all concurrent reports draw from it.
+claude_rate_limiter = TokenBucketRateLimiter(Config.CLAUDE_TOKENS_PER_MINUTE)
+
+
+PLAIN_SYSTEM_PROMPT = (
+    "You are a professional business consultant writing detailed feasibility "
+    "reports for Indian businesses. Use clear structure, practical assumptions, "
+    "and concise business language."
+)
+
+WEB_SYSTEM_PROMPT = (
+    "You are a professional business consultant writing detailed feasibility reports "
+    "for Indian businesses. Use web search to look up current market data, regulatory "
+    "requirements, industry statistics, equipment costs, and any other facts needed to "
+    "produce an accurate and up-to-date report. Always ground your output in real, "
+    "searchable information."
+)
+
+WEB_SEARCH_TOOL = {
+    "type": "web_search_20250305",
+    "name": "web_search",
+}
+
+
+def _is_rate_limit_error(exc: Exception) -> bool:
+    msg = str(exc).lower()
+    return (
+        "rate_limit_error" in msg or
+        "error code: 429" in msg or
+        "would exceed your organization's rate limit" in msg
+    )
+
+
+def _backoff_seconds(attempt: int) -> float:
+    return (Config.CLAUDE_RATE_LIMIT_BASE_SLEEP_SEC * (2 ** (attempt - 1))) + random.uniform(0, 0.7)
+
+
+def _usage_tokens(message) -> int:
+    usage = getattr(message, "usage", None)
+    if usage is None:
+        return -1
+    # Cache writes count against the input-token limit; cache reads do not.
+    return (
+        (getattr(usage, "input_tokens", 0) or 0)
+        + (getattr(usage, "cache_creation_input_tokens", 0) or 0)
+        + (getattr(usage, "output_tokens", 0) or 0)
+    )
+
+
+USAGE_FIELDS = ("input_tokens", "output_tokens", "cache_read_input_tokens", "cache_creation_input_tokens")
+
+# The usage_key passed to the generate()/agenerate() call currently running.
+_usage_key: contextvars.ContextVar[Optional[Any]] = contextvars.ContextVar("llm_usage_key", default=None)
+
+
+class TokenUsageLedger:
+    """
+    Anthropic token usage summed per key (the submission id for report sections).
+    input_tokens excludes prompt-cache reads and writes, which are counted
+    separately, as the API reports them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals: Dict[Any, Dict[str, int]] = {}
+
+    def add(self, key: Any, message) -> None:
+        usage = getattr(message, "usage", None)
+        if key is None or usage is None:
+            return
+        with self._lock:
+            totals = self._totals.setdefault(key, dict.fromkeys(USAGE_FIELDS + ("calls",), 0))
+            for field in USAGE_FIELDS:
+                totals[field] += getattr(usage, field, 0) or 0
+            totals["calls"] += 1
+
+    def get(self, key: Any) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._totals.get(key) or dict.fromkeys(USAGE_FIELDS + ("calls",), 0))
+
+    def take(self, key: Any) -> Dict[str, int]:
+        """Return the totals for key and start it again from zero."""
+        with self._lock:
+            return self._totals.pop(key, None) or dict.fromkeys(USAGE_FIELDS + ("calls",), 0)
+
+
+token_usage = TokenUsageLedger()
+
+
+class CallMetrics:
+    """
+    What one generate()/agenerate() call took, for per-section telemetry: the
+    model that finally answered (after any GitHub -> Claude fallback), API
+    calls, rate-limit retries and token usage. GitHub Models prompt/completion
+    tokens are counted as input/output; streamed GitHub responses carry none.
+    """
+
+    def __init__(self):
+        self.model: Optional[str] = None
+        self.calls = 0
+        self.retries = 0
+        self.usage: Dict[str, int] = dict.fromkeys(USAGE_FIELDS, 0)
+
+    def record(self, model: str, message) -> None:
+        self.model = model
+        self.calls += 1
+        usage = getattr(message, "usage", None)
+        if usage is None:
+            return
+        if hasattr(usage, "prompt_tokens"):
+            self.usage["input_tokens"] += usage.prompt_tokens or 0
+            self.usage["output_tokens"] += usage.completion_tokens or 0
+            return
+        for field in USAGE_FIELDS:
+            self.usage[field] += getattr(usage, field, 0) or 0
+
+
+_call_metrics: contextvars.ContextVar[Optional[CallMetrics]] = contextvars.ContextVar("llm_call_metrics", default=None)
+
+
+def _record_call(model: str, message) -> None:
+    metrics = _call_metrics.get()
+    if metrics is not None:
+        metrics.record(model, message)
+
+
+def _record_retry() -> None:
+    metrics = _call_metrics.get()
+    if metrics is not None:
+        metrics.retries += 1
+
+
+ProgressCallback = Callable[[str, int], None]
+
+
+class StreamAborted(Exception):
+    """Raised from an on_progress callback to stop a response before it finishes."""
+
+
+class _StreamMonitor:
+    """
+    Accumulates streamed text and calls on_progress(text_so_far, output_tokens)
+    every STREAM_PROGRESS_INTERVAL_TOKENS (estimated) and once for the full text.
+    """
+
+    def __init__(self, on_progress: ProgressCallback):
+        self.on_progress = on_progress
+        self._interval_chars = max(1, Config.STREAM_PROGRESS_INTERVAL_TOKENS) * CHARS_PER_TOKEN
+        self.reset()
+
+    def reset(self) -> None:
+        """Drop partial text, e.g. before a rate-limited call is retried."""
+        self._parts: List[str] = []
+        self._chars = 0
+        self._reported_chars = 0
+
+    @property
+    def text(self) -> str:
+        return "".join(self._parts)
+
+    @property
+    def tokens(self) -> int:
+        return int(self._chars / CHARS_PER_TOKEN)
+
+    def feed(self, delta: str) -> None:
+        if not delta:
+            return
+        self._parts.append(delta)
+        self._chars += len(delta)
+        if self._chars - self._reported_chars >= self._interval_chars:
+            self._reported_chars = self._chars
+            self.on_progress(self.text, self.tokens)
+
+    def finish(self, text: str) -> None:
+        """
+        Report the final text (non-streamed routes only report here). The
+        answer is complete and paid for by now, so a StreamAborted from the
+        callback is ignored; the caller validates the full text itself.
+        """
+        if len(text) != self._reported_chars:
+            self._reported_chars = len(text)
+            try:
+                self.on_progress(text, int(len(text) / CHARS_PER_TOKEN))
+            except StreamAborted:
+                pass
+
+
+def _aborted_usage(request: Dict[str, Any], estimated_tokens: int, monitor: "_StreamMonitor") -> int:
+    """Tokens a stopped stream actually cost: the estimated input plus the output received."""
+    return estimated_tokens - int(request.get("max_tokens") or 0) + monitor.tokens
+
+
+def _message_text(message) -> List[str]:
+    return [block.text for block in message.content if hasattr(block, "text")]
+
+
+def _web_tool_results(message) -> List[Dict[str, Any]]:
+    tool_results = []
+    for block in message.content:
+        if getattr(block, "type", None) == "tool_use":
+            tool_results.append(
+                {
+                    "type": "tool_result",
+                    "tool_use_id": block.id,
+                    "content": block.input.get("query", ""),
+                }
+            )
+    return tool_results
+
 
 class LLMClient:
     def __init__(self):
         self.provider = os.getenv("LLM_PROVIDER", "stub")
         self.api_key = os.getenv("ANTHROPIC_API_KEY", "")
-        self.stub_mode = self.provider == "stub" or not self.api_key
+        self.simulated = self.provider == "simulated"
+        self.stub_mode = self.provider == "stub" or (not self.api_key and not self.simulated)
+        self._simulator = None
+        self.rate_limiter = claude_rate_limiter
+        self.token_usage = token_usage
+        # SDK clients are built on first use (stub mode never imports the SDKs) and then
+        # reused by every thread so TLS sessions and keep-alive connections are shared.
+        self._client_lock = threading.Lock()
+        self._anthropic_client = None
+        self._github_client = None
+        # Async clients hold connections bound to one event loop, so they are kept per loop.
+        self._async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, Any]]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def _http_pool_limits(self, sdk):
+        """
+        Keep-alive pool sized for every section worker of every concurrent report.
+        Built from the SDK's own default limits so it matches the httpx it ships with.
+        """
+        pool_size = max(1, Config.PARALLEL_SECTION_WORKERS * Config.MAX_CONCURRENT_REPORTS)
+        return type(sdk.DEFAULT_CONNECTION_LIMITS)(
+            max_connections=pool_size,
+            max_keepalive_connections=pool_size,
+            keepalive_expiry=Config.LLM_HTTP_KEEPALIVE_SEC,
+        )
+
+    def _get_simulator(self):
+        if self._simulator is None:
+            with self._client_lock:
+                if self._simulator is None:
+                    from app.llm_simulator import SimulatedBackend
+
+                    self._simulator = SimulatedBackend()
+        return self._simulator
+
+    def _get_anthropic_client(self):
+        """Return the shared Anthropic client, importing the SDK and building it on first use."""
+        if self.simulated:
+            from app.llm_simulator import SimulatedAnthropic
+
+            return SimulatedAnthropic(self._get_simulator())
+        if self._anthropic_client is None:
+            with self._client_lock:
+                if self._anthropic_client is None:
+                    import anthropic
+
+                    self._anthropic_client = anthropic.Anthropic(
+                        api_key=self.api_key,
+                        http_client=anthropic.DefaultHttpxClient(limits=self._http_pool_limits(anthropic)),
+                    )
+        return self._anthropic_client
+
+    def _get_github_client(self, github_token: str):
+        """Return the shared OpenAI-compatible client for GitHub Models."""
+        if self.simulated:
+            from app.llm_simulator import SimulatedOpenAI
+
+            return SimulatedOpenAI(self._get_simulator())
+        if self._github_client is None:
+            with self._client_lock:
+                if self._github_client is None:
+                    import openai
+
+                    self._github_client = openai.OpenAI(
+                        base_url="https://models.inference.ai.azure.com",
+                        api_key=github_token,
+                        http_client=openai.DefaultHttpxClient(limits=self._http_pool_limits(openai)),
+                    )
+        return self._github_client
+
+    def _get_async_client(self, kind: str, github_token: str = ""):
+        """Return the async Anthropic ('anthropic') or GitHub Models ('github') client for the running loop."""
+        loop = asyncio.get_running_loop()
+        clients = self._async_clients.setdefault(loop, {})
+        if kind not in clients:
+            if self.simulated:
+                from app.llm_simulator import SimulatedAsyncAnthropic, SimulatedAsyncOpenAI
+
+                simulated_client = SimulatedAsyncAnthropic if kind == "anthropic" else SimulatedAsyncOpenAI
+                clients[kind] = simulated_client(self._get_simulator())
+            elif kind == "anthropic":
+                import anthropic
+
+                clients[kind] = anthropic.AsyncAnthropic(
+                    api_key=self.api_key,
+                    http_client=anthropic.DefaultAsyncHttpxClient(limits=self._http_pool_limits(anthropic)),
+                )
+            else:
+                import openai
+
+                clients[kind] = openai.AsyncOpenAI(
+                    base_url="https://models.inference.ai.azure.com",
+                    api_key=github_token,
+                    http_client=openai.DefaultAsyncHttpxClient(limits=self._http_pool_limits(openai)),
+                )
+        return clients[kind]
 
     def generate(
         self,
@@ -19,6 +417,41 @@ class LLMClient:
         max_tokens: int = 4096,
         mode: str = "plain",
         model: str = "claude",
+        on_progress: Optional[ProgressCallback] = None,
+        shared_context: Optional[str] = None,
+        usage_key: Optional[Any] = None,
+        call_metrics: Optional[CallMetrics] = None,
+    ) -> str:
+        """
+        Generate text for a prompt.
+
+        With on_progress, plain-mode Claude and GitHub Models responses are
+        streamed (when LLM_STREAMING_ENABLED) and on_progress(text_so_far,
+        output_tokens) is called as text arrives and once with the full text.
+        The callback may raise StreamAborted to stop a streamed response
+        early; once the response is complete it is returned regardless.
+
+        shared_context is text common to many calls (see
+        prompt_renderer.build_shared_context). It is appended to the system
+        prompt and, for Claude, marked as a prompt-cache breakpoint so repeat
+        calls read it from cache. Claude usage is added to
+        token_usage under usage_key, and every API call made is recorded in
+        call_metrics when one is given.
+        """
+        monitor = _StreamMonitor(on_progress) if on_progress else None
+        token = _usage_key.set(usage_key)
+        metrics_token = _call_metrics.set(call_metrics)
+        try:
+            text = self._route_generate(prompt, max_tokens, mode, model, self._streaming(monitor), shared_context)
+        finally:
+            _call_metrics.reset(metrics_token)
+            _usage_key.reset(token)
+        if monitor:
+            monitor.finish(text)
+        return text
+
+    def _route_generate(
+        self, prompt: str, max_tokens: int, mode: str, model: str, monitor, shared_context: Optional[str] = None
     ) -> str:
         if self.stub_mode:
             return self._generate_stub(prompt)
@@ -27,16 +460,176 @@ class LLMClient:
         # Requires GITHUB_TOKEN env var. Uses OpenAI-compatible SDK.
         if model.startswith("github:"):
             model_name = model.split(":", 1)[1]
-            return self._generate_github(prompt, model_name, max_tokens)
+            return self._generate_github(prompt, model_name, max_tokens, monitor, shared_context)
 
-        if self.provider == "claude":
+        if self.provider in ("claude", "simulated"):
+            # Web mode is never streamed: its answer depends on a tool-use round trip.
             if mode == "web" and Config.ENABLE_CLAUDE_WEB_SEARCH:
-                return self._generate_claude_web(prompt, max_tokens)
-            return self._generate_claude_plain(prompt, max_tokens)
+                return self._generate_claude_web(prompt, max_tokens, shared_context)
+            return self._generate_claude_plain(prompt, max_tokens, monitor, shared_context)
 
         raise ValueError(f"Unsupported LLM provider: {self.provider}")
 
-    def _generate_github(self, prompt: str, model_name: str, max_tokens: int) -> str:
+    async def agenerate(
+        self,
+        prompt: str,
+        max_tokens: int = 4096,
+        mode: str = "plain",
+        model: str = "claude",
+        on_progress: Optional[ProgressCallback] = None,
+        shared_context: Optional[str] = None,
+        usage_key: Optional[Any] = None,
+        call_metrics: Optional[CallMetrics] = None,
+    ) -> str:
+        """Async twin of generate(): same routing and streaming, using the SDKs' async clients."""
+        monitor = _StreamMonitor(on_progress) if on_progress else None
+        token = _usage_key.set(usage_key)
+        metrics_token = _call_metrics.set(call_metrics)
+        try:
+            text = await self._aroute_generate(
+                prompt, max_tokens, mode, model, self._streaming(monitor), shared_context
+            )
+        finally:
+            _call_metrics.reset(metrics_token)
+            _usage_key.reset(token)
+        if monitor:
+            monitor.finish(text)
+        return text
+
+    async def _aroute_generate(
+        self, prompt: str, max_tokens: int, mode: str, model: str, monitor, shared_context: Optional[str] = None
+    ) -> str:
+        if self.stub_mode:
+            return self._generate_stub(prompt)
+
+        if model.startswith("github:"):
+            model_name = model.split(":", 1)[1]
+            return await self._agenerate_github(prompt, model_name, max_tokens, monitor, shared_context)
+
+        if self.provider in ("claude", "simulated"):
+            if mode == "web" and Config.ENABLE_CLAUDE_WEB_SEARCH:
+                return await self._agenerate_claude_web(prompt, max_tokens, shared_context)
+            return await self._agenerate_claude_plain(prompt, max_tokens, monitor, shared_context)
+
+        raise ValueError(f"Unsupported LLM provider: {self.provider}")
+
+    @staticmethod
+    def _streaming(monitor: Optional[_StreamMonitor]) -> Optional[_StreamMonitor]:
+        """The monitor to stream into, or None when the response should be fetched whole."""
+        return monitor if Config.LLM_STREAMING_ENABLED else None
+
+    def describe_route(self, mode: str = "plain", model: str = "claude") -> str:
+        """
+        Identify the backend that generate() would use for these arguments, e.g.
+        'claude:claude-sonnet-4-6:web' or 'github:Phi-4'. Used to key cached output.
+        """
+        if self.stub_mode:
+            return "stub"
+        if model.startswith("github:") and self._github_token():
+            route = model
+        elif model.startswith("github:"):
+            # Without a token _generate_github falls back to plain Claude, whatever the mode.
+            route = f"claude:{CLAUDE_MODEL}:plain"
+        elif self.provider in ("claude", "simulated"):
+            claude_mode = "web" if mode == "web" and Config.ENABLE_CLAUDE_WEB_SEARCH else "plain"
+            route = f"claude:{CLAUDE_MODEL}:{claude_mode}"
+        else:
+            route = f"{self.provider}:{model}:{mode}"
+        # Simulated output must never be served from the cache to a real provider.
+        return f"simulated:{route}" if self.simulated else route
+
+    def answered_route(self, route: str, call_metrics: CallMetrics) -> str:
+        """
+        The route that actually answered a call made on route: a GitHub Models
+        call that failed over to Claude (see _generate_github) is reported as
+        plain Claude, so its output is never cached as the GitHub model's.
+        """
+        if not route.removeprefix("simulated:").startswith("github:"):
+            return route
+        if call_metrics.model is None or call_metrics.model.startswith("github:"):
+            return route
+        answered = f"claude:{CLAUDE_MODEL}:plain"
+        return f"simulated:{answered}" if self.simulated else answered
+
+    def caches_prefix(self, route: str, shared_context: str) -> bool:
+        """
+        Whether shared_context is worth sending as a cached prefix on a route
+        (see describe_route): only Claude caches it, and only when the system
+        prompt plus shared_context reaches the model's minimum cacheable length.
+        """
+        parts = route.removeprefix("simulated:").split(":")
+        if parts[0] != "claude" or len(parts) < 3:
+            return False
+        system_prompt = WEB_SYSTEM_PROMPT if parts[-1] == "web" else PLAIN_SYSTEM_PROMPT
+        estimated_tokens = (len(system_prompt) + len(shared_context)) / CHARS_PER_TOKEN
+        return estimated_tokens >= prompt_cache_min_tokens(parts[1])
+
+    def _github_token(self) -> str:
+        if self.simulated:
+            return "simulated"
+        return os.getenv("GITHUB_TOKEN") or os.getenv("GITHUB_PERSONAL_ACCESS_TOKEN", "")
+
+    # -- request builders shared by the sync and async paths -----------------
+
+    @staticmethod
+    def _claude_system(system_prompt: str, shared_context: Optional[str]):
+        """System prompt, with shared_context as a second block marked as the prompt-cache breakpoint."""
+        if not shared_context:
+            return system_prompt
+        return [
+            {"type": "text", "text": system_prompt},
+            {"type": "text", "text": shared_context, "cache_control": {"type": "ephemeral"}},
+        ]
+
+    @staticmethod
+    def _github_request(prompt: str, model_name: str, max_tokens: int, shared_context: Optional[str] = None) -> Dict[str, Any]:
+        # No explicit cache control on GitHub Models; a stable system message
+        # still lets providers with automatic prefix caching reuse it.
+        system_prompt = f"{PLAIN_SYSTEM_PROMPT}\n\n{shared_context}" if shared_context else PLAIN_SYSTEM_PROMPT
+        return {
+            "model": model_name,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt},
+            ],
+            "max_tokens": max_tokens,
+            "temperature": 0.7,
+        }
+
+    @classmethod
+    def _claude_plain_request(cls, prompt: str, max_tokens: int, shared_context: Optional[str] = None) -> Dict[str, Any]:
+        return {
+            "model": CLAUDE_MODEL,
+            "max_tokens": max_tokens,
+            "system": cls._claude_system(PLAIN_SYSTEM_PROMPT, shared_context),
+            "messages": [{"role": "user", "content": prompt}],
+        }
+
+    @classmethod
+    def _claude_web_request(
+        cls, prompt: str, max_tokens: int, initial=None, tool_results=None, shared_context: Optional[str] = None
+    ) -> Dict[str, Any]:
+        messages: List[Dict[str, Any]] = [{"role": "user", "content": prompt}]
+        if initial is not None:
+            # At most one follow-up call using minimal context.
+            # No iterative conversation accumulation to avoid exploding input tokens.
+            messages += [
+                {"role": "assistant", "content": initial.content},
+                {"role": "user", "content": tool_results},
+            ]
+        return {
+            "model": CLAUDE_MODEL,
+            "max_tokens": max_tokens,
+            "system": cls._claude_system(WEB_SYSTEM_PROMPT, shared_context),
+            "tools": [WEB_SEARCH_TOOL],
+            "messages": messages,
+        }
+
+    # -- sync path ------------------------------------------------------------
+
+    def _generate_github(
+        self, prompt: str, model_name: str, max_tokens: int, monitor=None, shared_context: Optional[str] = None
+    ) -> str:
         """
         Generate text using a free open-source model via the GitHub Models API.
         Requires GITHUB_TOKEN env var (a GitHub personal access token).
@@ -44,39 +637,31 @@ class LLMClient:
         Rate limits: generous free tier, suitable for report generation workloads.
         Docs: https://docs.github.com/en/github-models
         """
-        github_token = os.getenv("GITHUB_TOKEN") or os.getenv("GITHUB_PERSONAL_ACCESS_TOKEN", "")
+        github_token = self._github_token()
         if not github_token:
             # Gracefully fall back to Claude plain if no token is configured
-            return self._generate_claude_plain(prompt, max_tokens)
+            return self._generate_claude_plain(prompt, max_tokens, monitor, shared_context)
 
         try:
-            from openai import OpenAI
-
-            client = OpenAI(
-                base_url="https://models.inference.ai.azure.com",
-                api_key=github_token,
-            )
-            response = client.chat.completions.create(
-                model=model_name,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": (
-                            "You are a professional business consultant writing detailed "
-                            "feasibility reports for Indian businesses. Use clear structure, "
-                            "practical assumptions, and concise business language."
-                        ),
-                    },
-                    {"role": "user", "content": prompt},
-                ],
-                max_tokens=max_tokens,
-                temperature=0.7,
-            )
-            return response.choices[0].message.content or ""
+            client = self._get_github_client(github_token)
+            request = self._github_request(prompt, model_name, max_tokens, shared_context)
+            if monitor is None:
+                response = client.chat.completions.create(**request)
+                _record_call(f"github:{model_name}", response)
+                return response.choices[0].message.content or ""
+            monitor.reset()
+            with client.chat.completions.create(**request, stream=True) as stream:
+                for chunk in stream:
+                    if chunk.choices:
+                        monitor.feed(chunk.choices[0].delta.content or "")
+            _record_call(f"github:{model_name}", None)
+            return monitor.text
+        except StreamAborted:
+            raise
         except Exception as e:
             # Fall back to Claude plain on any GitHub Models error so the report
             # always completes — log the issue but don't raise.
-            return self._generate_claude_plain(prompt, max_tokens)
+            return self._generate_claude_plain(prompt, max_tokens, monitor, shared_context)
 
     def _generate_stub(self, prompt: str) -> str:
         return (
@@ -85,91 +670,162 @@ class LLMClient:
             f"In production, this would be generated by the LLM API."
         )
 
-    def _generate_claude_plain(self, prompt: str, max_tokens: int) -> str:
+    def _generate_claude_plain(self, prompt: str, max_tokens: int, monitor=None, shared_context: Optional[str] = None) -> str:
         try:
-            import anthropic
-
-            client = anthropic.Anthropic(api_key=self.api_key)
+            client = self._get_anthropic_client()
             message = self._claude_messages_create_with_retry(
-                client,
-                model="claude-sonnet-4-6",
-                max_tokens=max_tokens,
-                system=(
-                    "You are a professional business consultant writing detailed feasibility "
-                    "reports for Indian businesses. Use clear structure, practical assumptions, "
-                    "and concise business language."
-                ),
-                messages=[{"role": "user", "content": prompt}],
+                client, monitor=monitor, **self._claude_plain_request(prompt, max_tokens, shared_context)
             )
             return message.content[0].text
 
+        except StreamAborted:
+            raise
         except ImportError:
             raise ImportError("Anthropic library not installed. Run: pip install anthropic")
         except Exception as e:
             raise Exception(f"Claude API error: {str(e)}")
 
-    def _generate_claude_web(self, prompt: str, max_tokens: int) -> str:
+    def _generate_claude_web(self, prompt: str, max_tokens: int, shared_context: Optional[str] = None) -> str:
         try:
-            import anthropic
+            client = self._get_anthropic_client()
 
-            client = anthropic.Anthropic(api_key=self.api_key)
+            # 1) Single initial call with tools enabled.
+            initial = self._claude_messages_create_with_retry(
+                client, **self._claude_web_request(prompt, max_tokens, shared_context=shared_context)
+            )
+            initial_text = _message_text(initial)
+            if initial.stop_reason != "tool_use":
+                return "\n".join(initial_text)
 
-            web_search_tool = {
-                "type": "web_search_20250305",
-                "name": "web_search",
-            }
+            # 2) At most one follow-up call carrying the tool results.
+            tool_results = _web_tool_results(initial)
+            if not tool_results:
+                return "\n".join(initial_text)
 
-            system = (
-                "You are a professional business consultant writing detailed feasibility reports "
-                "for Indian businesses. Use web search to look up current market data, regulatory "
-                "requirements, industry statistics, equipment costs, and any other facts needed to "
-                "produce an accurate and up-to-date report. Always ground your output in real, "
-                "searchable information."
+            followup = self._claude_messages_create_with_retry(
+                client, **self._claude_web_request(prompt, max_tokens, initial, tool_results, shared_context)
             )
+            followup_text = _message_text(followup)
+            return "\n".join(followup_text) if followup_text else "\n".join(initial_text)
 
-            # 1) Single initial call with tools enabled.
-            initial = self._claude_messages_create_with_retry(
-                client,
-                model="claude-sonnet-4-6",
-                max_tokens=max_tokens,
-                system=system,
-                tools=[web_search_tool],
-                messages=[{"role": "user", "content": prompt}],
+        except ImportError:
+            raise ImportError("Anthropic library not installed. Run: pip install anthropic")
+        except Exception as e:
+            raise Exception(f"Claude API error: {str(e)}")
+
+    def _claude_messages_create_with_retry(self, client, monitor=None, **kwargs):
+        """
+        Send an Anthropic call once the shared token budget admits it, retrying
+        rate-limit errors that still slip through with exponential backoff + jitter.
+        With a monitor the response is streamed into it and the final message returned.
+        """
+        last_exc = None
+        max_attempts = max(1, Config.CLAUDE_RATE_LIMIT_RETRIES)
+        estimated_tokens = estimate_request_tokens(kwargs)
+        for attempt in range(1, max_attempts + 1):
+            self.rate_limiter.acquire(estimated_tokens)
+            try:
+                if monitor is None:
+                    message = client.messages.create(**kwargs)
+                else:
+                    monitor.reset()
+                    with client.messages.stream(**kwargs) as stream:
+                        for delta in stream.text_stream:
+                            monitor.feed(delta)
+                        message = stream.get_final_message()
+            except StreamAborted:
+                self.rate_limiter.settle(estimated_tokens, _aborted_usage(kwargs, estimated_tokens, monitor))
+                raise
+            except Exception as exc:
+                if not _is_rate_limit_error(exc):
+                    self.rate_limiter.settle(estimated_tokens, 0)
+                    raise
+                # The rejected call used nothing; refund it so the retry is charged once.
+                self.rate_limiter.settle(estimated_tokens, 0)
+                self.rate_limiter.penalize()
+                if attempt == max_attempts:
+                    raise
+
+                last_exc = exc
+                _record_retry()
+                backoff = _backoff_seconds(attempt)
+                telemetry.LLM_RATE_LIMIT_RETRIES.inc()
+                telemetry.LLM_RATE_LIMIT_SLEEP_SECONDS.inc(backoff)
+                time.sleep(backoff)
+                continue
+
+            actual_tokens = _usage_tokens(message)
+            if actual_tokens >= 0:
+                self.rate_limiter.settle(estimated_tokens, actual_tokens)
+            self.token_usage.add(_usage_key.get(), message)
+            _record_call(kwargs.get("model"), message)
+            return message
+
+        raise last_exc
+
+    # -- async path -----------------------------------------------------------
+
+    async def _agenerate_github(
+        self, prompt: str, model_name: str, max_tokens: int, monitor=None, shared_context: Optional[str] = None
+    ) -> str:
+        github_token = self._github_token()
+        if not github_token:
+            return await self._agenerate_claude_plain(prompt, max_tokens, monitor, shared_context)
+
+        try:
+            client = self._get_async_client("github", github_token)
+            request = self._github_request(prompt, model_name, max_tokens, shared_context)
+            if monitor is None:
+                response = await client.chat.completions.create(**request)
+                _record_call(f"github:{model_name}", response)
+                return response.choices[0].message.content or ""
+            monitor.reset()
+            async with await client.chat.completions.create(**request, stream=True) as stream:
+                async for chunk in stream:
+                    if chunk.choices:
+                        monitor.feed(chunk.choices[0].delta.content or "")
+            _record_call(f"github:{model_name}", None)
+            return monitor.text
+        except StreamAborted:
+            raise
+        except Exception:
+            return await self._agenerate_claude_plain(prompt, max_tokens, monitor, shared_context)
+
+    async def _agenerate_claude_plain(
+        self, prompt: str, max_tokens: int, monitor=None, shared_context: Optional[str] = None
+    ) -> str:
+        try:
+            client = self._get_async_client("anthropic")
+            message = await self._aclaude_messages_create_with_retry(
+                client, monitor=monitor, **self._claude_plain_request(prompt, max_tokens, shared_context)
             )
+            return message.content[0].text
+
+        except StreamAborted:
+            raise
+        except ImportError:
+            raise ImportError("Anthropic library not installed. Run: pip install anthropic")
+        except Exception as e:
+            raise Exception(f"Claude API error: {str(e)}")
 
-            initial_text = [block.text for block in initial.content if hasattr(block, "text")]
+    async def _agenerate_claude_web(self, prompt: str, max_tokens: int, shared_context: Optional[str] = None) -> str:
+        try:
+            client = self._get_async_client("anthropic")
+            initial = await self._aclaude_messages_create_with_retry(
+                client, **self._claude_web_request(prompt, max_tokens, shared_context=shared_context)
+            )
+            initial_text = _message_text(initial)
             if initial.stop_reason != "tool_use":
                 return "\n".join(initial_text)
 
-            # 2) At most one follow-up call using minimal context.
-            #    No iterative conversation accumulation to avoid exploding input tokens.
-            tool_results = []
-            for block in initial.content:
-                if getattr(block, "type", None) == "tool_use":
-                    tool_results.append(
-                        {
-                            "type": "tool_result",
-                            "tool_use_id": block.id,
-                            "content": block.input.get("query", ""),
-                        }
-                    )
-
+            tool_results = _web_tool_results(initial)
             if not tool_results:
                 return "\n".join(initial_text)
 
-            followup = self._claude_messages_create_with_retry(
-                client,
-                model="claude-sonnet-4-6",
-                max_tokens=max_tokens,
-                system=system,
-                tools=[web_search_tool],
-                messages=[
-                    {"role": "user", "content": prompt},
-                    {"role": "assistant", "content": initial.content},
-                    {"role": "user", "content": tool_results},
-                ],
+            followup = await self._aclaude_messages_create_with_retry(
+                client, **self._claude_web_request(prompt, max_tokens, initial, tool_results, shared_context)
             )
-            followup_text = [block.text for block in followup.content if hasattr(block, "text")]
+            followup_text = _message_text(followup)
             return "\n".join(followup_text) if followup_text else "\n".join(initial_text)
 
         except ImportError:
@@ -177,26 +833,49 @@ class LLMClient:
         except Exception as e:
             raise Exception(f"Claude API error: {str(e)}")
 
-    def _claude_messages_create_with_retry(self, client, **kwargs):
-        """Retry Anthropic calls on rate-limit errors using exponential backoff + jitter."""
+    async def _aclaude_messages_create_with_retry(self, client, monitor=None, **kwargs):
+        """Async twin of _claude_messages_create_with_retry; waits without blocking the event loop."""
         last_exc = None
         max_attempts = max(1, Config.CLAUDE_RATE_LIMIT_RETRIES)
+        estimated_tokens = estimate_request_tokens(kwargs)
         for attempt in range(1, max_attempts + 1):
+            await self.rate_limiter.acquire_async(estimated_tokens)
             try:
-                return client.messages.create(**kwargs)
+                if monitor is None:
+                    message = await client.messages.create(**kwargs)
+                else:
+                    monitor.reset()
+                    async with client.messages.stream(**kwargs) as stream:
+                        async for delta in stream.text_stream:
+                            monitor.feed(delta)
+                        message = await stream.get_final_message()
+            except StreamAborted:
+                self.rate_limiter.settle(estimated_tokens, _aborted_usage(kwargs, estimated_tokens, monitor))
+                raise
             except Exception as exc:
-                msg = str(exc).lower()
-                is_rate_limited = (
-                    "rate_limit_error" in msg or
-                    "error code: 429" in msg or
-                    "would exceed your organization's rate limit" in msg
-                )
-                if not is_rate_limited or attempt == max_attempts:
+                if not _is_rate_limit_error(exc):
+                    self.rate_limiter.settle(estimated_tokens, 0)
+                    raise
+                # The rejected call used nothing; refund it so the retry is charged once.
+                self.rate_limiter.settle(estimated_tokens, 0)
+                self.rate_limiter.penalize()
+                if attempt == max_attempts:
                     raise
 
                 last_exc = exc
-                sleep_s = (Config.CLAUDE_RATE_LIMIT_BASE_SLEEP_SEC * (2 ** (attempt - 1))) + random.uniform(0, 0.7)
-                time.sleep(sleep_s)
+                _record_retry()
+                backoff = _backoff_seconds(attempt)
+                telemetry.LLM_RATE_LIMIT_RETRIES.inc()
+                telemetry.LLM_RATE_LIMIT_SLEEP_SECONDS.inc(backoff)
+                await asyncio.sleep(backoff)
+                continue
+
+            actual_tokens = _usage_tokens(message)
+            if actual_tokens >= 0:
+                self.rate_limiter.settle(estimated_tokens, actual_tokens)
+            self.token_usage.add(_usage_key.get(), message)
+            _record_call(kwargs.get("model"), message)
+            return message
 
         raise last_exc
 
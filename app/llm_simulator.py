@@ -0,0 +1,402 @@
+"""
+Simulated LLM backend for offline load tests (LLM_PROVIDER=simulated).
+
+SimulatedAnthropic / SimulatedOpenAI (and their async twins) mimic the parts
+of the anthropic and openai SDK clients that LLMClient uses, so the real
+request builders, rate limiter, retry loop and streaming code all run; only
+the network is replaced. Each call:
+
+- waits a time-to-first-token drawn from the model's log-normal latency
+  profile, then produces output at the model's tokens-per-second rate
+  (streamed in small chunks when the caller streams);
+- is checked against a simulated organisation tokens-per-minute budget and
+  fails with a 429 when it would exceed it;
+- fails with an injected 429 or 5xx at the configured rates;
+- reports usage, including prompt-cache reads for a repeated cache_control
+  prefix that reaches the model's minimum cacheable length (shorter
+  prefixes are billed as plain input, as the real API does).
+
+Outcomes are deterministic: the random draws are seeded from LLM_SIM_SEED,
+the request content and how many times that request has been seen, so the
+same run replays identically. LLM_SIM_TIME_SCALE shrinks every delay (0.01
+runs a report 100x faster with the same relative timings).
+"""
+import asyncio
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.config import Config
+from app.llm_client import prompt_cache_min_tokens
+
+# Median time to first token (s), its log-normal spread, and output tokens/second.
+DEFAULT_MODEL_PROFILES: Dict[str, Dict[str, float]] = {
+    "claude-sonnet-4-6": {"ttft_s": 1.2, "ttft_sigma": 0.35, "tokens_per_s": 55.0},
+    "Phi-4": {"ttft_s": 0.6, "ttft_sigma": 0.3, "tokens_per_s": 90.0},
+    "Meta-Llama-3.3-70B-Instruct": {"ttft_s": 0.9, "ttft_sigma": 0.3, "tokens_per_s": 70.0},
+    "default": {"ttft_s": 1.0, "ttft_sigma": 0.3, "tokens_per_s": 60.0},
+}
+
+CHARS_PER_TOKEN = 4.0
+# Output tokens per streamed chunk.
+STREAM_CHUNK_TOKENS = 8
+
+_WORDS = (
+    "the project market demand capacity utilisation revenue cost assumption lender cash flow "
+    "working capital plant machinery supply growth risk mitigation regulatory approval district "
+    "state buyers pricing margin operating expenses depreciation repayment schedule tenor equity"
+).split()
+
+
+class SimulatedAPIError(Exception):
+    """Raised for injected failures; the message mirrors the SDKs' 'Error code: NNN - ...' format."""
+
+    def __init__(self, status_code: int, error_type: str):
+        self.status_code = status_code
+        super().__init__(f"Error code: {status_code} - {{'type': 'error', 'error': {{'type': '{error_type}'}}}}")
+
+
+def _model_profiles() -> Dict[str, Dict[str, float]]:
+    profiles = {name: dict(profile) for name, profile in DEFAULT_MODEL_PROFILES.items()}
+    raw = Config.LLM_SIM_PROFILES_JSON.strip()
+    if raw:
+        for name, overrides in json.loads(raw).items():
+            profiles.setdefault(name, dict(DEFAULT_MODEL_PROFILES["default"])).update(overrides)
+    return profiles
+
+
+class _OrganisationBudget:
+    """Server-side tokens-per-minute budget: unlike the client limiter it rejects instead of waiting."""
+
+    def __init__(self, tokens_per_minute: int):
+        self.tokens_per_minute = tokens_per_minute
+        self._tokens = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def admit(self, tokens: int, time_scale: float) -> bool:
+        if self.tokens_per_minute <= 0:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            # Simulated minutes pass time_scale times faster than real ones.
+            elapsed = (now - self._updated) / max(time_scale, 1e-9)
+            self._tokens = min(float(self.tokens_per_minute), self._tokens + elapsed * self.tokens_per_minute / 60.0)
+            self._updated = now
+            tokens = min(tokens, self.tokens_per_minute)
+            if tokens > self._tokens:
+                return False
+            self._tokens -= tokens
+            return True
+
+
+class _Plan:
+    """Everything one simulated call will do, decided before any waiting."""
+
+    __slots__ = ("error", "ttft_s", "chunks", "chunk_delay_s", "usage")
+
+    def __init__(self):
+        self.error: Optional[SimulatedAPIError] = None
+        self.ttft_s = 0.0
+        self.chunks: List[str] = []
+        self.chunk_delay_s = 0.0
+        self.usage: Dict[str, int] = {}
+
+
+class SimulatedBackend:
+    """Shared state of the simulation: profiles, the TPM budget, prompt-cache prefixes and call counters."""
+
+    def __init__(self):
+        self.seed = Config.LLM_SIM_SEED
+        self.time_scale = Config.LLM_SIM_TIME_SCALE
+        self.rate_limit_rate = Config.LLM_SIM_429_RATE
+        self.server_error_rate = Config.LLM_SIM_5XX_RATE
+        self.profiles = _model_profiles()
+        self.budget = _OrganisationBudget(Config.LLM_SIM_TPM)
+        self._lock = threading.Lock()
+        self._seen: Dict[str, int] = {}
+        # Every request planned, including ones that fail with an injected error.
+        self.requests = 0
+        self._cached_prefixes: set = set()
+
+    def _rng(self, request_digest: str) -> random.Random:
+        with self._lock:
+            occurrence = self._seen.get(request_digest, 0)
+            self._seen[request_digest] = occurrence + 1
+            self.requests += 1
+        return random.Random(f"{self.seed}:{request_digest}:{occurrence}")
+
+    def _cache_split(self, model: str, system: Any) -> Tuple[int, Optional[str]]:
+        """(uncached system chars, digest of the cache_control prefix or None)."""
+        if not isinstance(system, list):
+            return len(str(system or "")), None
+        prefix_chars = 0
+        digest = hashlib.sha256()
+        for block in system:
+            prefix_chars += len(block.get("text", ""))
+            digest.update(block.get("text", "").encode("utf-8"))
+            if block.get("cache_control"):
+                if prefix_chars / CHARS_PER_TOKEN < prompt_cache_min_tokens(model):
+                    break
+                return 0, f"{prefix_chars}:{digest.hexdigest()}"
+        return sum(len(block.get("text", "")) for block in system), None
+
+    def plan(self, model: str, system: Any, messages: List[Dict[str, Any]], max_tokens: int) -> _Plan:
+        message_chars = sum(len(str(message.get("content") or "")) for message in messages)
+        system_chars, prefix = self._cache_split(model, system)
+        request_digest = hashlib.sha256(
+            json.dumps([model, system, messages, max_tokens], default=str, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+        rng = self._rng(request_digest)
+        profile = self.profiles.get(model, self.profiles["default"])
+        plan = _Plan()
+        plan.ttft_s = profile["ttft_s"] * math.exp(rng.gauss(0.0, profile["ttft_sigma"])) * self.time_scale
+
+        cache_read = cache_write = 0
+        if prefix is not None:
+            prefix_tokens = int(int(prefix.split(":", 1)[0]) / CHARS_PER_TOKEN)
+            with self._lock:
+                hit = prefix in self._cached_prefixes
+            if hit:
+                cache_read = prefix_tokens
+            else:
+                cache_write = prefix_tokens
+        input_tokens = int((system_chars + message_chars) / CHARS_PER_TOKEN)
+
+        # Cache reads do not count against the organisation's input budget.
+        roll = rng.random()
+        if not self.budget.admit(input_tokens + cache_write + max_tokens, self.time_scale) or roll < self.rate_limit_rate:
+            plan.error = SimulatedAPIError(429, "rate_limit_error")
+            return plan
+        if roll < self.rate_limit_rate + self.server_error_rate:
+            plan.error = SimulatedAPIError(529, "overloaded_error")
+            return plan
+        if cache_write:
+            with self._lock:
+                self._cached_prefixes.add(prefix)
+
+        output_tokens = max(1, int(max_tokens * rng.uniform(0.6, 1.0)))
+        plan.chunk_delay_s = STREAM_CHUNK_TOKENS / profile["tokens_per_s"] * self.time_scale
+        plan.chunks = list(_text_chunks(rng, output_tokens))
+        plan.usage = {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "cache_read_input_tokens": cache_read,
+            "cache_creation_input_tokens": cache_write,
+        }
+        return plan
+
+
+def _text_chunks(rng: random.Random, output_tokens: int) -> Iterator[str]:
+    """Markdown-shaped filler: a heading, paragraphs, a small table and a source link, STREAM_CHUNK_TOKENS at a time."""
+    words: List[str] = ["## Simulated section\n\n"]
+    target_words = max(1, int(output_tokens * 0.75))
+    while len(words) < target_words:
+        sentence = " ".join(rng.choice(_WORDS) for _ in range(rng.randint(8, 18)))
+        words.extend(f"{sentence.capitalize()}.".split(" "))
+        if rng.random() < 0.15:
+            words.append("\n\n")
+    words.append(
+        "\n\n| Item | Year 1 | Year 2 |\n|---|---|---|\n| Revenue | 120.0 | 138.0 |\n\n"
+        "Source: https://example.com/simulated-source\n"
+    )
+    step = max(1, int(STREAM_CHUNK_TOKENS * 0.75))
+    for start in range(0, len(words), step):
+        yield " ".join(words[start:start + step]) + " "
+
+
+def _anthropic_message(plan: _Plan) -> SimpleNamespace:
+    return SimpleNamespace(
+        content=[SimpleNamespace(type="text", text="".join(plan.chunks))],
+        stop_reason="end_turn",
+        usage=SimpleNamespace(**plan.usage),
+    )
+
+
+def _openai_response(plan: _Plan) -> SimpleNamespace:
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content="".join(plan.chunks)))],
+        usage=SimpleNamespace(prompt_tokens=plan.usage["input_tokens"], completion_tokens=plan.usage["output_tokens"]),
+    )
+
+
+def _openai_chunk(text: str) -> SimpleNamespace:
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+
+def _openai_split(messages: List[Dict[str, Any]]) -> Tuple[str, List[Dict[str, Any]]]:
+    system = "".join(str(m.get("content") or "") for m in messages if m.get("role") == "system")
+    return system, [m for m in messages if m.get("role") != "system"]
+
+
+# -- sync clients -------------------------------------------------------------
+
+
+class _SyncStream:
+    def __init__(self, plan: _Plan, chunks):
+        self._plan = plan
+        self._chunks = chunks
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def __iter__(self):
+        return self._chunks
+
+    @property
+    def text_stream(self):
+        return self._chunks
+
+    def get_final_message(self):
+        return _anthropic_message(self._plan)
+
+
+def _sync_chunks(plan: _Plan, wrap=lambda text: text):
+    time.sleep(plan.ttft_s)
+    for chunk in plan.chunks:
+        yield wrap(chunk)
+        time.sleep(plan.chunk_delay_s)
+
+
+# Rejected calls still cost a round trip, about a quarter of a time-to-first-token.
+def _sync_wait_whole(plan: _Plan) -> None:
+    if plan.error:
+        time.sleep(0.25 * plan.ttft_s)
+        raise plan.error
+    time.sleep(plan.ttft_s + plan.chunk_delay_s * len(plan.chunks))
+
+
+class _SyncMessages:
+    def __init__(self, backend: SimulatedBackend):
+        self._backend = backend
+
+    def create(self, model: str, max_tokens: int, messages, system="", **_):
+        plan = self._backend.plan(model, system, messages, max_tokens)
+        _sync_wait_whole(plan)
+        return _anthropic_message(plan)
+
+    def stream(self, model: str, max_tokens: int, messages, system="", **_):
+        plan = self._backend.plan(model, system, messages, max_tokens)
+        if plan.error:
+            raise plan.error
+        return _SyncStream(plan, _sync_chunks(plan))
+
+
+class SimulatedAnthropic:
+    """Stands in for anthropic.Anthropic."""
+
+    def __init__(self, backend: SimulatedBackend):
+        self.messages = _SyncMessages(backend)
+
+
+class _SyncCompletions:
+    def __init__(self, backend: SimulatedBackend):
+        self._backend = backend
+
+    def create(self, model: str, messages, max_tokens: int = 1024, stream: bool = False, **_):
+        system, rest = _openai_split(messages)
+        plan = self._backend.plan(model, system, rest, max_tokens)
+        if stream:
+            if plan.error:
+                raise plan.error
+            return _SyncStream(plan, _sync_chunks(plan, _openai_chunk))
+        _sync_wait_whole(plan)
+        return _openai_response(plan)
+
+
+class SimulatedOpenAI:
+    """Stands in for openai.OpenAI (GitHub Models)."""
+
+    def __init__(self, backend: SimulatedBackend):
+        self.chat = SimpleNamespace(completions=_SyncCompletions(backend))
+
+
+# -- async clients ------------------------------------------------------------
+
+
+class _AsyncStream:
+    def __init__(self, plan: _Plan, wrap=lambda text: text):
+        self._plan = plan
+        self._wrap = wrap
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def _chunks(self):
+        await asyncio.sleep(self._plan.ttft_s)
+        for chunk in self._plan.chunks:
+            yield self._wrap(chunk)
+            await asyncio.sleep(self._plan.chunk_delay_s)
+
+    def __aiter__(self):
+        return self._chunks()
+
+    @property
+    def text_stream(self):
+        return self._chunks()
+
+    async def get_final_message(self):
+        return _anthropic_message(self._plan)
+
+
+async def _async_wait_whole(plan: _Plan) -> None:
+    if plan.error:
+        await asyncio.sleep(0.25 * plan.ttft_s)
+        raise plan.error
+    await asyncio.sleep(plan.ttft_s + plan.chunk_delay_s * len(plan.chunks))
+
+
+class _AsyncMessages:
+    def __init__(self, backend: SimulatedBackend):
+        self._backend = backend
+
+    async def create(self, model: str, max_tokens: int, messages, system="", **_):
+        plan = self._backend.plan(model, system, messages, max_tokens)
+        await _async_wait_whole(plan)
+        return _anthropic_message(plan)
+
+    def stream(self, model: str, max_tokens: int, messages, system="", **_):
+        plan = self._backend.plan(model, system, messages, max_tokens)
+        if plan.error:
+            raise plan.error
+        return _AsyncStream(plan)
+
+
+class SimulatedAsyncAnthropic:
+    """Stands in for anthropic.AsyncAnthropic."""
+
+    def __init__(self, backend: SimulatedBackend):
+        self.messages = _AsyncMessages(backend)
+
+
+class _AsyncCompletions:
+    def __init__(self, backend: SimulatedBackend):
+        self._backend = backend
+
+    async def create(self, model: str, messages, max_tokens: int = 1024, stream: bool = False, **_):
+        system, rest = _openai_split(messages)
+        plan = self._backend.plan(model, system, rest, max_tokens)
+        if stream:
+            if plan.error:
+                raise plan.error
+            return _AsyncStream(plan, _openai_chunk)
+        await _async_wait_whole(plan)
+        return _openai_response(plan)
+
+
+class SimulatedAsyncOpenAI:
+    """Stands in for openai.AsyncOpenAI (GitHub Models)."""
+
+    def __init__(self, backend: SimulatedBackend):
+        self.chat = SimpleNamespace(completions=_AsyncCompletions(backend))
@@ -1,15 +1,14 @@
 import json
-import sqlite3
 from typing import Optional
 
-from app.db import DB_PATH
+from app.db import get_connection
 
 
 MAX_CITY_RESULTS = 20
 
 
 def get_states(country: str = "India") -> list[str]:
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute(
         """
@@ -27,7 +26,7 @@ def get_states(country: str = "India") -> list[str]:
 
 def search_cities(state: str, query: str = "", country: str = "India", limit: int = MAX_CITY_RESULTS) -> list[dict[str, object]]:
     normalized_query = query.strip().lower()
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute(
         """
@@ -59,7 +58,7 @@ def get_canonical_city(state: str, city_or_alias: str, country: str = "India") -
     if not lookup:
         return None
 
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute(
         """
@@ -1,20 +1,27 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
-from fastapi.responses import HTMLResponse, StreamingResponse
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import FileResponse, HTMLResponse, PlainTextResponse, StreamingResponse
 from jinja2 import Environment, FileSystemLoader
 import os
+import json
 import asyncio
-from datetime import datetime
-from typing import Set
-from app.config import Config
+from typing import Any, Dict, Optional, Set
 from app.models import SubmissionCreate, SubmissionResponse, SubmissionResponseWithValidation, ValidationSummary
-from app.db import init_db, save_submission, get_submission, upsert_report_status, get_report_record, get_any_generating_report_lock
-from app.report_builder import build_doc
+from app.db import init_db, save_submission, get_submission, upsert_report_status, get_report_record, get_report_progress
+from app import blob_store, llm_cache, profiling, telemetry
+from app.progress_bus import progress_bus
+from app.prompt_renderer import template_registry
+from app.report_builder import build_doc_async
+from app.report_scheduler import ReportScheduler
+from app.section_metrics import get_section_waterfall
 
 app = FastAPI()
-_active_report_tasks: Set[asyncio.Task] = set()
 
 # Initialize database on startup
 init_db()
+# One-off: move any report files still stored inside the database to the blob store.
+blob_store.migrate_inline_reports()
+# Read prompt templates now rather than on the first report.
+template_registry.preload()
 
 # Set up Jinja2 templates
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -126,151 +133,207 @@ async def get_submission_by_id(submission_id: int):
     return SubmissionResponse(**submission)
 
 
-async def _run_report_background(submission_id: int, submission_data: dict, force: bool):
-    """Background task: generate report and save bytes to DB."""
+async def _run_report_background(submission_id: int, force: bool):
+    """Scheduler job: generate report, store the file and point generated_reports at it."""
     try:
-        upsert_report_status(submission_id, "generating")
-        doc_bytes = await asyncio.to_thread(build_doc, submission_data, submission_id, force)
-        upsert_report_status(submission_id, "done", doc_bytes=doc_bytes)
+        submission = get_submission(submission_id)
+        if submission is None:
+            raise ValueError(f"Submission {submission_id} not found")
+        submission_data = {k: v for k, v in submission.items() if k not in ["id", "created_at"]}
+        upsert_report_status(
+            submission_id,
+            "generating",
+            sections_done=0,
+            sections_total=0,
+            current_section="Starting",
+        )
+        doc_bytes = await build_doc_async(submission_data, submission_id, force)
+        doc_sha256 = await asyncio.to_thread(blob_store.put, doc_bytes)
+        upsert_report_status(submission_id, "done", doc_sha256=doc_sha256, doc_size=len(doc_bytes))
     except Exception as e:
         upsert_report_status(submission_id, "failed", error_message=str(e))
+        raise
+
+
+report_scheduler = ReportScheduler(_run_report_background)
+_active_report_tasks: Set[asyncio.Task] = report_scheduler.active_tasks
+
+telemetry.Callback("report_queue_depth", "Report jobs waiting for a generation slot.", report_scheduler.queue_depth)
+telemetry.Callback(
+    "report_active_tasks", "Reports generating in this process.", lambda: len(_active_report_tasks)
+)
+telemetry.Callback(
+    "report_max_concurrent", "Reports allowed to generate at once.", lambda: report_scheduler.max_concurrent
+)
+
+
+@app.on_event("startup")
+async def _start_report_scheduler():
+    report_scheduler.recover()
+
+
+def _enqueue_report(submission_id: int, force: bool, priority: int) -> str:
+    """Queue a report through the scheduler and mirror the state into generated_reports."""
+    job_status = report_scheduler.submit(submission_id, force=force, priority=priority)
+    if job_status == "queued":
+        upsert_report_status(
+            submission_id,
+            "queued",
+            sections_done=0,
+            sections_total=0,
+            current_section="Queued",
+        )
+        return "queued"
+    return "generating"
 
 
 @app.post("/api/report/{submission_id}/start")
-async def start_report(submission_id: int, background_tasks: BackgroundTasks, force: bool = False):
-    """Start background report generation. Returns immediately."""
+async def start_report(submission_id: int, force: bool = False, priority: int = 0, profile: Optional[str] = None):
+    """
+    Queue background report generation. Returns immediately with the queue state.
+    With profile (e.g. "sample", "cprofile,memory") the generation is profiled;
+    see app/profiling.py and /api/report/{id}/profiles.
+    """
     submission = get_submission(submission_id)
     if submission is None:
         raise HTTPException(status_code=404, detail="Submission not found")
 
-    record = get_report_record(submission_id)
-    if record and record["status"] == "done" and not force:
+    if _report_snapshot(submission_id)["status"] == "done" and not force:
         return {"status": "done"}
-    if record and record["status"] == "generating":
-        return {"status": "generating"}
-
-    active_lock = get_any_generating_report_lock()
-    if active_lock and active_lock["submission_id"] != submission_id:
-        # Auto-release stale locks from crashed/aborted jobs.
-        stale = False
-        no_progress_lock = (
-            (active_lock.get("sections_done") or 0) == 0
-            and (active_lock.get("sections_total") or 0) == 0
-            and not active_lock.get("current_section")
-        )
-        updated_at = active_lock.get("updated_at")
-        if updated_at:
-            try:
-                age_seconds = (datetime.utcnow() - datetime.fromisoformat(updated_at)).total_seconds()
-                stale = age_seconds > Config.REPORT_LOCK_STALE_SECONDS
-            except Exception:
-                stale = no_progress_lock
-        else:
-            stale = no_progress_lock
-
-        if stale:
-            upsert_report_status(
-                active_lock["submission_id"],
-                "failed",
-                error_message="Generation lock auto-cleared due to stale inactivity.",
-            )
-        else:
-            raise HTTPException(
-                status_code=409,
-                detail=f"Another report ({active_lock['submission_id']}) is currently generating. Please retry after it completes.",
-            )
-
-    submission_data = {k: v for k, v in submission.items() if k not in ["id", "created_at"]}
-    # Mark as queued/generating immediately so status endpoint updates right away.
-    upsert_report_status(
-        submission_id,
-        "generating",
-        sections_done=0,
-        sections_total=0,
-        current_section="Queued",
-    )
 
-    # Detach generation from request lifecycle; return immediately.
-    task = asyncio.create_task(_run_report_background(submission_id, submission_data, force))
-    _active_report_tasks.add(task)
-    task.add_done_callback(lambda t: _active_report_tasks.discard(t))
-    return {"status": "generating"}
+    if profile:
+        try:
+            profiling.request(submission_id, profile)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+    status = _enqueue_report(submission_id, force, priority)
+    return {"status": status, "queue_position": report_scheduler.queue_position(submission_id)}
+
+
+_NOT_STARTED = {"status": "not_started", "error_message": None, "sections_done": 0, "sections_total": 0, "current_section": None, "updated_at": None}
+
+# Seconds between repeats of the current state on an idle event stream. Queue
+# position changes arrive as progress_bus publishes from the scheduler.
+_EVENT_HEARTBEAT_SEC = 15.0
+
+
+def _report_snapshot(submission_id: int) -> Dict[str, Any]:
+    """Current progress from the in-process bus; only the first read of a report touches SQLite."""
+    return progress_bus.prime(submission_id, lambda: get_report_progress(submission_id) or _NOT_STARTED)
+
+
+def _status_payload(snapshot: Dict[str, Any], submission_id: int) -> Dict[str, Any]:
+    payload = {
+        "status": snapshot["status"],
+        "sections_done": snapshot.get("sections_done", 0),
+        "sections_total": snapshot.get("sections_total", 0),
+        "current_section": snapshot.get("current_section"),
+        "updated_at": snapshot.get("updated_at"),
+        "queue_position": report_scheduler.queue_position(submission_id) if snapshot["status"] == "queued" else None,
+    }
+    if snapshot["status"] != "not_started":
+        payload["error"] = snapshot.get("error_message")
+    return payload
 
 
 @app.get("/api/report/{submission_id}/status")
 async def report_status(submission_id: int):
-    """Poll report generation status."""
-    record = get_report_record(submission_id)
-    if not record:
-        return {"status": "not_started", "sections_done": 0, "sections_total": 0, "current_section": None, "updated_at": None}
-    return {
-        "status": record["status"],
-        "error": record.get("error_message"),
-        "sections_done": record.get("sections_done", 0),
-        "sections_total": record.get("sections_total", 0),
-        "current_section": record.get("current_section"),
-        "updated_at": record.get("updated_at"),
-    }
+    """Report generation status, served from memory. Prefer /events over polling this."""
+    return _status_payload(_report_snapshot(submission_id), submission_id)
+
+
+@app.get("/api/report/{submission_id}/events")
+async def report_events(submission_id: int):
+    """
+    Server-Sent Events stream of report progress. Sends the current state at
+    once, then every change as it is written, and closes after done/failed.
+    """
+    async def stream():
+        # Subscribe before reading the snapshot so no change can slip in between.
+        queue = progress_bus.subscribe(submission_id)
+        try:
+            snapshot = _report_snapshot(submission_id)
+            while True:
+                yield f"data: {json.dumps(_status_payload(snapshot, submission_id))}\n\n"
+                if snapshot["status"] in ("done", "failed"):
+                    return
+                try:
+                    snapshot = await asyncio.wait_for(queue.get(), timeout=_EVENT_HEARTBEAT_SEC)
+                except asyncio.TimeoutError:
+                    snapshot = _report_snapshot(submission_id)
+        finally:
+            progress_bus.unsubscribe(submission_id, queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _report_file_response(submission_id: int, record: Dict[str, Any], missing_status: int) -> FileResponse:
+    """Serve the stored .docx from disk (sendfile where the server supports it)."""
+    path = blob_store.open_path(record["doc_sha256"])
+    if path is None:
+        raise HTTPException(status_code=missing_status, detail="Report file is missing; please regenerate the report")
+    return FileResponse(
+        path,
+        media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+        filename=f"report_{submission_id}.docx",
+    )
 
 
 @app.get("/api/report/{submission_id}/download")
 async def download_report(submission_id: int):
     """Download the completed report."""
     record = get_report_record(submission_id)
-    if not record or record["status"] != "done" or not record["doc_bytes"]:
+    if not record or record["status"] != "done" or not record["doc_sha256"]:
         raise HTTPException(status_code=404, detail="Report not ready yet")
-    return StreamingResponse(
-        iter([record["doc_bytes"]]),
-        media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-        headers={"Content-Disposition": f"attachment; filename=report_{submission_id}.docx"},
-    )
+    return _report_file_response(submission_id, record, missing_status=404)
+
+
+@app.get("/api/report/{submission_id}/metrics")
+async def report_metrics(submission_id: int, run_id: Optional[str] = None):
+    """Per-section waterfall (timings, tokens, cost) of the report's latest generation, or of run_id."""
+    waterfall = get_section_waterfall(submission_id, run_id)
+    if waterfall is None:
+        raise HTTPException(status_code=404, detail="No section metrics recorded for this report")
+    return waterfall
+
+
+@app.get("/api/report/{submission_id}/profiles")
+async def report_profiles(submission_id: int):
+    """Stored profiles of the report's generations, newest first."""
+    return {"submission_id": submission_id, "profiles": profiling.list_profiles(submission_id)}
+
+
+@app.get("/api/report/{submission_id}/profiles/{profile_id}/{name}")
+async def report_profile_artifact(submission_id: int, profile_id: str, name: str):
+    """Download one artifact (cpu.pstats, cpu.folded, memory.txt, ...) of a stored profile."""
+    path = profiling.artifact_path(submission_id, profile_id, name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile artifact not found")
+    return FileResponse(path, media_type="application/octet-stream", filename=f"report_{submission_id}_{profile_id}_{name}")
 
 
 @app.get("/api/report/{submission_id}")
 @app.post("/api/report/{submission_id}")
-async def generate_report(submission_id: int, force: bool = False):
-    """Legacy sync endpoint — kept for compatibility."""
+async def generate_report(submission_id: int, force: bool = False, priority: int = 0):
+    """Legacy sync endpoint — kept for compatibility. Waits for its turn in the report queue."""
     submission = get_submission(submission_id)
     if submission is None:
         raise HTTPException(status_code=404, detail="Submission not found")
 
-    active_lock = get_any_generating_report_lock()
-    if active_lock and active_lock["submission_id"] != submission_id:
-        stale = False
-        no_progress_lock = (
-            (active_lock.get("sections_done") or 0) == 0
-            and (active_lock.get("sections_total") or 0) == 0
-            and not active_lock.get("current_section")
-        )
-        updated_at = active_lock.get("updated_at")
-        if updated_at:
-            try:
-                age_seconds = (datetime.utcnow() - datetime.fromisoformat(updated_at)).total_seconds()
-                stale = age_seconds > Config.REPORT_LOCK_STALE_SECONDS
-            except Exception:
-                stale = no_progress_lock
-        else:
-            stale = no_progress_lock
-
-        if stale:
-            upsert_report_status(
-                active_lock["submission_id"],
-                "failed",
-                error_message="Generation lock auto-cleared due to stale inactivity.",
-            )
-        else:
-            raise HTTPException(
-                status_code=409,
-                detail=f"Another report ({active_lock['submission_id']}) is currently generating. Please retry after it completes.",
-            )
-
-    submission_data = {k: v for k, v in submission.items() if k not in ["id", "created_at"]}
-    doc_bytes = await asyncio.to_thread(build_doc, submission_data, submission_id, force)
-    return StreamingResponse(
-        iter([doc_bytes]),
-        media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-        headers={"Content-Disposition": f"attachment; filename=report_{submission_id}.docx"},
-    )
+    _enqueue_report(submission_id, force, priority)
+    try:
+        await report_scheduler.wait(submission_id)
+    except RuntimeError as exc:
+        raise HTTPException(status_code=500, detail=f"Report generation failed: {exc}")
+
+    record = get_report_record(submission_id)
+    if not record or record["status"] != "done" or not record["doc_sha256"]:
+        raise HTTPException(status_code=500, detail="Report generation did not produce a document")
+    return _report_file_response(submission_id, record, missing_status=500)
 
 
 @app.get("/api/market-interest-rate")
@@ -283,6 +346,18 @@ async def pricing_estimate(submission_id: int):
     return {"available": False}
 
 
+@app.get("/api/llm-cache/stats")
+def llm_cache_stats():
+    """Hit/miss counters since process start plus current cache size."""
+    return llm_cache.stats()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus scrape endpoint (see app/telemetry.py)."""
+    return PlainTextResponse(telemetry.render(), media_type=telemetry.CONTENT_TYPE)
+
+
 @app.get("/health")
 def health_check():
     return {"status": "ok"}
@@ -0,0 +1,250 @@
+"""
+Retention, archiving and compaction for the SQLite database.
+
+    python -m app.maintenance                 # archive + delete expired rows, GC blobs, incremental vacuum
+    python -m app.maintenance --dry-run       # only report what would be removed
+    python -m app.maintenance --convert-auto-vacuum   # one-off full VACUUM for pre-existing databases
+
+Each table in RETENTION_POLICIES keeps rows for its *_RETENTION_DAYS setting
+(0 keeps them forever). Expired rows are first appended to a gzip JSONL file
+under MAINTENANCE_ARCHIVE_DIR (compressed columns are stored decompressed, so
+archives are plain JSON), then deleted. Rows belonging to a submission that is
+queued or generating are never touched.
+
+Work is done in batches of MAINTENANCE_BATCH_SIZE rows, each in its own short
+transaction, and the vacuum frees a bounded number of pages per step, so a run
+never holds the write lock long enough to stall report generation.
+"""
+import argparse
+import gzip
+import json
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from app import blob_store, profiling
+from app.compression import decompress_text
+from app.db import DB_PATH, get_connection
+
+MAINTENANCE_ARCHIVE_DIR = os.environ.get("MAINTENANCE_ARCHIVE_DIR") or os.path.join(
+    os.path.dirname(os.path.abspath(DB_PATH)), "db_archive"
+)
+MAINTENANCE_BATCH_SIZE = int(os.environ.get("MAINTENANCE_BATCH_SIZE", "500"))
+# Pages freed per incremental_vacuum step (4 KiB each by default).
+MAINTENANCE_VACUUM_STEP_PAGES = int(os.environ.get("MAINTENANCE_VACUUM_STEP_PAGES", "2000"))
+# Days to keep report profiles written by app/profiling.py (0 = forever).
+REPORT_PROFILE_RETENTION_DAYS = int(os.environ.get("REPORT_PROFILE_RETENTION_DAYS", "14"))
+# Blob files younger than this are never collected: a report's file is written
+# just before generated_reports points at it.
+BLOB_GC_GRACE_SECONDS = 3600
+
+
+def _days(name: str, default: str) -> int:
+    return int(os.environ.get(name, default))
+
+
+# (table, timestamp column, retention days, extra WHERE clause, compressed columns)
+RETENTION_POLICIES: List[Tuple[str, str, int, str, Tuple[str, ...]]] = [
+    ("validation_events", "created_at", _days("VALIDATION_EVENTS_RETENTION_DAYS", "90"), "", ("details_json",)),
+    ("stage_checkpoints", "updated_at", _days("STAGE_CHECKPOINTS_RETENTION_DAYS", "90"), "", ()),
+    ("report_sections", "created_at", _days("REPORT_SECTIONS_RETENTION_DAYS", "30"), "", ("content",)),
+    ("section_metrics", "created_at", _days("SECTION_METRICS_RETENTION_DAYS", "90"), "", ()),
+    ("report_jobs", "enqueued_at", _days("REPORT_JOBS_RETENTION_DAYS", "30"), "status IN ('done', 'failed')", ()),
+    (
+        "generated_reports",
+        "updated_at",
+        _days("GENERATED_REPORTS_RETENTION_DAYS", "365"),
+        "status IN ('done', 'failed')",
+        (),
+    ),
+]
+
+_ACTIVE_SUBMISSIONS_SQL = """
+    SELECT submission_id FROM generated_reports WHERE status = 'generating'
+    UNION
+    SELECT submission_id FROM report_jobs WHERE status IN ('queued', 'running')
+"""
+
+
+def _expired_where(column: str, extra: str) -> str:
+    clauses = [f"{column} < ?", f"submission_id NOT IN ({_ACTIVE_SUBMISSIONS_SQL})"]
+    if extra:
+        clauses.append(extra)
+    return " AND ".join(clauses)
+
+
+def _archive_value(column: str, value: Any, compressed: Tuple[str, ...]) -> Any:
+    if column in compressed:
+        return decompress_text(value)
+    if isinstance(value, (bytes, bytearray)):
+        return None  # legacy inline .docx; the file itself is in the blob store or already gone
+    return value
+
+
+def _archive_path(table: str, stamp: str) -> str:
+    return os.path.join(MAINTENANCE_ARCHIVE_DIR, table, f"{stamp}.jsonl.gz")
+
+
+def purge_table(
+    table: str,
+    column: str,
+    retention_days: int,
+    extra_where: str = "",
+    compressed: Tuple[str, ...] = (),
+    archive: bool = True,
+    dry_run: bool = False,
+    stamp: Optional[str] = None,
+) -> int:
+    """Archive and delete rows of one table older than retention_days. Returns the number of rows (to be) removed."""
+    if retention_days <= 0:
+        return 0
+    cutoff = (datetime.utcnow() - timedelta(days=retention_days)).isoformat()
+    where = _expired_where(column, extra_where)
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    if dry_run:
+        cursor.execute(f"SELECT COUNT(*) FROM {table} WHERE {where}", (cutoff,))
+        count = cursor.fetchone()[0]
+        conn.close()
+        return count
+
+    removed = 0
+    archive_file = None
+    try:
+        while True:
+            cursor.execute(f"SELECT * FROM {table} WHERE {where} ORDER BY id LIMIT ?", (cutoff, MAINTENANCE_BATCH_SIZE))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            if archive:
+                if archive_file is None:
+                    path = _archive_path(table, stamp or datetime.utcnow().strftime("%Y%m%dT%H%M%S"))
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    archive_file = gzip.open(path, "at", encoding="utf-8")
+                names = [description[0] for description in cursor.description]
+                for row in rows:
+                    record = {name: _archive_value(name, value, compressed) for name, value in zip(names, row)}
+                    archive_file.write(json.dumps(record, default=str) + "\n")
+                # Rows are only deleted once their archive lines are on disk.
+                archive_file.flush()
+            ids = [row[0] for row in rows]
+            cursor.execute(f"DELETE FROM {table} WHERE id IN ({','.join('?' * len(ids))})", ids)
+            conn.commit()
+            removed += len(ids)
+            if len(rows) < MAINTENANCE_BATCH_SIZE:
+                break
+    finally:
+        if archive_file is not None:
+            archive_file.close()
+        conn.close()
+    return removed
+
+
+def collect_orphan_blobs(dry_run: bool = False) -> int:
+    """Delete blob-store files no generated_reports row points at. Returns the number of files (to be) removed."""
+    if not os.path.isdir(blob_store.BLOB_DIR):
+        return 0
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT DISTINCT doc_sha256 FROM generated_reports WHERE doc_sha256 IS NOT NULL")
+    referenced = {row[0] for row in cursor.fetchall()}
+    conn.close()
+
+    newest_allowed = time.time() - BLOB_GC_GRACE_SECONDS
+    removed = 0
+    for root, _, files in os.walk(blob_store.BLOB_DIR):
+        for name in files:
+            if not name.endswith(".docx"):
+                continue
+            doc_sha256 = name[: -len(".docx")]
+            if doc_sha256 in referenced or os.path.getmtime(os.path.join(root, name)) > newest_allowed:
+                continue
+            if not dry_run:
+                blob_store.delete(doc_sha256)
+            removed += 1
+    return removed
+
+
+def incremental_vacuum(max_pages: Optional[int] = None) -> Dict[str, int]:
+    """
+    Return free pages to the filesystem in MAINTENANCE_VACUUM_STEP_PAGES steps,
+    then truncate the WAL. Needs auto_vacuum=INCREMENTAL (see convert_auto_vacuum).
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    if cursor.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        free = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+        conn.close()
+        return {"freed_pages": 0, "free_pages": free, "auto_vacuum": 0}
+
+    freed = 0
+    while max_pages is None or freed < max_pages:
+        free = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+        if free == 0:
+            break
+        step = min(free, MAINTENANCE_VACUUM_STEP_PAGES)
+        if max_pages is not None:
+            step = min(step, max_pages - freed)
+        # execute() would stop after freeing one page; executescript runs the pragma to completion.
+        conn.executescript(f"PRAGMA incremental_vacuum({step});")
+        remaining = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+        if remaining >= free:
+            break
+        freed += free - remaining
+    cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+    cursor.execute("PRAGMA optimize")
+    free = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+    conn.close()
+    return {"freed_pages": freed, "free_pages": free, "auto_vacuum": 2}
+
+
+def convert_auto_vacuum() -> None:
+    """
+    Switch a database created before auto_vacuum=INCREMENTAL was the default.
+    This runs a full VACUUM, which rewrites the file and blocks writers until it
+    finishes, so run it once while no reports are generating.
+    """
+    conn = get_connection()
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    conn.execute("VACUUM")
+    conn.close()
+
+
+def run_maintenance(archive: bool = True, dry_run: bool = False, vacuum: bool = True) -> Dict[str, Any]:
+    """One maintenance pass over every retention policy, the blob store, report profiles and the free-page list."""
+    stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+    summary: Dict[str, Any] = {"dry_run": dry_run, "removed": {}}
+    for table, column, days, extra_where, compressed in RETENTION_POLICIES:
+        summary["removed"][table] = purge_table(
+            table, column, days, extra_where, compressed, archive=archive, dry_run=dry_run, stamp=stamp
+        )
+    summary["orphan_blobs"] = collect_orphan_blobs(dry_run=dry_run)
+    summary["expired_profiles"] = profiling.delete_profiles_older_than(REPORT_PROFILE_RETENTION_DAYS, dry_run=dry_run)
+    if vacuum and not dry_run:
+        summary["vacuum"] = incremental_vacuum()
+    summary["db_bytes"] = os.path.getsize(DB_PATH) if os.path.exists(DB_PATH) else 0
+    return summary
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Archive expired rows, collect orphan report files and compact the database.")
+    parser.add_argument("--dry-run", action="store_true", help="count what would be removed without changing anything")
+    parser.add_argument("--no-archive", action="store_true", help="delete expired rows without writing them to the archive")
+    parser.add_argument("--no-vacuum", action="store_true", help="skip the incremental vacuum")
+    parser.add_argument(
+        "--convert-auto-vacuum",
+        action="store_true",
+        help="one-off full VACUUM enabling incremental vacuum on an older database (blocks writers)",
+    )
+    args = parser.parse_args()
+
+    if args.convert_auto_vacuum:
+        convert_auto_vacuum()
+    summary = run_maintenance(archive=not args.no_archive, dry_run=args.dry_run, vacuum=not args.no_vacuum)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
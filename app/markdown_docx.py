@@ -0,0 +1,321 @@
+"""
+Markdown to Word rendering for generated report sections.
+
+The LLM writes markdown; parse() turns it into a small block/inline AST in one
+pass over the lines, and render() writes that AST into a python-docx Document.
+
+Blocks are (kind, level, content) tuples:
+
+    ("heading", 2 | 3, inlines)        # and #, ## -> level 2; ### and deeper -> 3
+    ("paragraph", 0, inlines)
+    ("bullet", 0..2, inlines)          - / * / + items; nesting follows indentation
+    ("number", 0..2, (start, inlines)) 1. / 1) items; each list restarts at its first number
+    ("table", 0, (header, rows))       pipe table; cells are inline lists
+
+and inlines are (text, bold, italic, url) tuples covering **bold**, *italic* /
+_italic_, ***both***, [label](url) and bare http(s) URLs.
+
+render() writes each block as WordprocessingML text and parses it in one go.
+It does not go through the python-docx proxies, which:
+  - look up the style by name for every paragraph;
+  - scan the body for sectPr on every insert (quadratic in chapter length);
+  - build run text one character at a time;
+  - walk the table grid to reach each cell.
+Tables, the LLM's and the financial pack's alike, are emitted whole from their
+row matrix, header row included.
+"""
+import re
+import weakref
+from typing import Any, Dict, List, Optional, Tuple
+
+from xml.sax.saxutils import escape
+
+from docx.document import Document as DocumentObject
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls
+from docx.shared import Emu
+
+# Alternatives are tried left to right at the earliest match position, so a
+# bold span wins over the link inside it and is tokenized again for its contents.
+_INLINE_PATTERN = re.compile(
+    r"\*\*\*(?P<strong_em>.+?)\*\*\*"
+    r"|\*\*(?P<strong>.+?)\*\*"
+    r"|\[(?P<label>[^\]]+)\]\((?P<href>https?://[^\s)]+)\)"
+    r"|(?P<url>https?://[^\s)]+)"
+    r"|(?<![\w*])\*(?P<em>[^*\s](?:[^*]*?[^*\s])?)\*(?![\w*])"
+    r"|(?<![\w_])_(?P<em_>[^_\s](?:[^_]*?[^_\s])?)_(?![\w_])"
+)
+_INLINE_MARKERS = re.compile(r"[*_\[]|https?://")
+_BLOCK_PATTERN = re.compile(
+    r"(?P<indent>[ \t]*)(?:(?P<hashes>#{1,6})[ \t]+|(?P<bullet>[-*+])[ \t]+|(?P<number>\d{1,3})[.)][ \t]+)?(?P<text>.*)"
+)
+# Characters XML 1.0 does not allow; tabs, newlines and carriage returns are fine.
+_XML_INVALID_CHARS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+_TABLE_SEPARATOR = re.compile(r"\|?\s*:?-{3,}:?\s*(?:\|\s*:?-{3,}:?\s*)+\|?")
+
+Inline = Tuple[str, bool, bool, Optional[str]]
+Block = Tuple[str, int, Any]
+
+_MAX_LIST_LEVEL = 2
+_LIST_STYLES = {
+    "bullet": ("List Bullet", "List Bullet 2", "List Bullet 3"),
+    "number": ("List Number", "List Number 2", "List Number 3"),
+}
+# Each block is parsed on its own with the namespaces declared on it: moving a
+# parsed root into the document is cheap, moving the children of a shared
+# fragment root makes lxml fix up the namespace of every descendant.
+_NSDECLS = nsdecls("w", "r")
+_HYPERLINK_RPR = '<w:color w:val="0563C1"/><w:u w:val="single"/>'
+# Same table properties as python-docx's add_table, with header-row banding.
+_TABLE_LOOK = (
+    '<w:tblW w:type="auto" w:w="0"/><w:tblLook w:firstColumn="1" w:firstRow="1" w:lastColumn="0"'
+    ' w:lastRow="0" w:noHBand="0" w:noVBand="1" w:val="04A0"/>'
+)
+
+
+# -- parsing -----------------------------------------------------------------
+
+def parse_inline(text: str, bold: bool = False, italic: bool = False, out: Optional[List[Inline]] = None) -> List[Inline]:
+    """Split one line of markdown into formatted text and link spans."""
+    if out is None:
+        out = []
+    if not _INLINE_MARKERS.search(text):
+        if text:
+            out.append((text, bold, italic, None))
+        return out
+    cursor = 0
+    for match in _INLINE_PATTERN.finditer(text):
+        if match.start() > cursor:
+            out.append((text[cursor:match.start()], bold, italic, None))
+        kind = match.lastgroup
+        if kind == "strong_em":
+            parse_inline(match.group(kind), True, True, out)
+        elif kind == "strong":
+            parse_inline(match.group(kind), True, italic, out)
+        elif kind in ("em", "em_"):
+            parse_inline(match.group(kind), bold, True, out)
+        elif kind == "href":
+            out.append((match.group("label"), bold, italic, match.group("href")))
+        else:
+            out.append((match.group(kind), bold, italic, match.group(kind)))
+        cursor = match.end()
+    if cursor < len(text):
+        out.append((text[cursor:], bold, italic, None))
+    return out
+
+
+def plain(text: str, bold: bool = False) -> List[Inline]:
+    """Inlines for text taken as-is (no markdown), e.g. computed figures."""
+    return [(text, bold, False, None)] if text else []
+
+
+def table_block(header: List[str], rows: List[List[Any]]) -> Block:
+    """A table block from plain values, with the header row in bold."""
+    return ("table", 0, ([plain(str(cell), bold=True) for cell in header], [[plain(str(cell)) for cell in row] for row in rows]))
+
+
+def _split_table_row(line: str) -> List[str]:
+    row = line.strip()
+    if row.startswith("|"):
+        row = row[1:]
+    if row.endswith("|"):
+        row = row[:-1]
+    return [cell.strip() for cell in row.split("|")]
+
+
+def parse(text: str) -> List[Block]:
+    """Tokenize a markdown section into blocks in a single pass over its lines."""
+    blocks: List[Block] = []
+    if not text:
+        return blocks
+    lines = text.splitlines()
+    list_indents: List[int] = []
+    i, count = 0, len(lines)
+    while i < count:
+        line = lines[i]
+        stripped = line.strip()
+        i += 1
+        if not stripped:
+            continue
+
+        # Pipe table: header row, separator row, then rows until a blank or pipe-less line.
+        if "|" in stripped and i < count and _TABLE_SEPARATOR.fullmatch(lines[i].strip()):
+            header = [parse_inline(cell, bold=True) for cell in _split_table_row(stripped)]
+            rows = []
+            i += 1
+            while i < count:
+                row_line = lines[i].strip()
+                if not row_line or "|" not in row_line:
+                    break
+                i += 1
+                if not _TABLE_SEPARATOR.fullmatch(row_line):
+                    rows.append([parse_inline(cell) for cell in _split_table_row(row_line)])
+            blocks.append(("table", 0, (header, rows)))
+            list_indents.clear()
+            continue
+
+        match = _BLOCK_PATTERN.match(line)
+        body = match.group("text").strip()
+        if match.group("bullet") or match.group("number"):
+            indent = len(match.group("indent").expandtabs(4))
+            while list_indents and indent < list_indents[-1]:
+                list_indents.pop()
+            if not list_indents or indent > list_indents[-1]:
+                list_indents.append(indent)
+            level = min(len(list_indents) - 1, _MAX_LIST_LEVEL)
+            if match.group("bullet"):
+                blocks.append(("bullet", level, parse_inline(body)))
+            else:
+                blocks.append(("number", level, (int(match.group("number")), parse_inline(body))))
+            continue
+
+        list_indents.clear()
+        if match.group("hashes"):
+            blocks.append(("heading", 2 if len(match.group("hashes")) <= 2 else 3, parse_inline(body)))
+        else:
+            blocks.append(("paragraph", 0, parse_inline(stripped)))
+    return blocks
+
+
+# -- rendering ---------------------------------------------------------------
+
+# Hyperlink relationship ids per document part. part.relate_to() scans every
+# relationship of the part; a report links the same sources from many chapters.
+_hyperlink_ids: "weakref.WeakKeyDictionary[Any, Dict[str, str]]" = weakref.WeakKeyDictionary()
+
+
+def _text_xml(text: str) -> str:
+    text = _XML_INVALID_CHARS.sub("", text)
+    pieces = []
+    for index, piece in enumerate(text.split("\t")):
+        if index:
+            pieces.append("<w:tab/>")
+        if piece:
+            space = ' xml:space="preserve"' if piece[0].isspace() or piece[-1].isspace() else ""
+            pieces.append(f"<w:t{space}>{escape(piece)}</w:t>")
+    return "".join(pieces)
+
+
+class _DocxWriter:
+    """Collects blocks as WordprocessingML and appends them to the end of the document body."""
+
+    def __init__(self, doc: DocumentObject):
+        self.doc = doc
+        self._parts: List[str] = []
+        self._style_ids: Dict[str, str] = {}
+        self._link_ids = _hyperlink_ids.setdefault(doc.part, {})
+        self._list_num_ids: Dict[int, str] = {}
+        self._block_width = None
+
+    def _style_id(self, name: str) -> str:
+        style_id = self._style_ids.get(name)
+        if style_id is None:
+            style_id = self._style_ids[name] = escape(self.doc.styles[name].style_id, {'"': "&quot;"})
+        return style_id
+
+    def _link_id(self, url: str) -> str:
+        r_id = self._link_ids.get(url)
+        if r_id is None:
+            r_id = self._link_ids[url] = self.doc.part.relate_to(url, RT.HYPERLINK, is_external=True)
+        return r_id
+
+    def _restarted_num_id(self, style_name: str, start: int) -> str:
+        """A numbering instance of the list style's definition that starts again at `start`."""
+        numbering = self.doc.part.numbering_part.element
+        style_num_id = self.doc.styles[style_name].element.pPr.numPr.numId.val
+        abstract_num_id = numbering.num_having_numId(style_num_id).abstractNumId.val
+        num = numbering.add_num(abstract_num_id)
+        num.add_lvlOverride(ilvl=0).add_startOverride(start)
+        return str(num.numId)
+
+    def _inlines(self, inlines: List[Inline]) -> str:
+        runs = []
+        for text, bold, italic, url in inlines:
+            r_pr = ("<w:b/>" if bold else "") + ("<w:i/>" if italic else "")
+            if url is None:
+                r_pr = f"<w:rPr>{r_pr}</w:rPr>" if r_pr else ""
+                runs.append(f"<w:r>{r_pr}{_text_xml(text)}</w:r>")
+            else:
+                runs.append(
+                    f'<w:hyperlink r:id="{self._link_id(url)}"><w:r><w:rPr>{r_pr}{_HYPERLINK_RPR}</w:rPr>'
+                    f"{_text_xml(text)}</w:r></w:hyperlink>"
+                )
+        return "".join(runs)
+
+    def paragraph(self, inlines: List[Inline], style: Optional[str] = None, num_id: Optional[str] = None) -> None:
+        p_pr = ""
+        if style is not None:
+            num_pr = f'<w:numPr><w:ilvl w:val="0"/><w:numId w:val="{num_id}"/></w:numPr>' if num_id else ""
+            p_pr = f'<w:pPr><w:pStyle w:val="{self._style_id(style)}"/>{num_pr}</w:pPr>'
+        self._parts.append(f"<w:p {_NSDECLS}>{p_pr}{self._inlines(inlines)}</w:p>")
+
+    def table(self, header: List[List[Inline]], rows: List[List[List[Inline]]]) -> None:
+        """
+        Emit a w:tbl for the header row and data rows in one pass. The column
+        count follows the header; short rows get empty cells, extra cells are
+        dropped. The header row repeats on every page the table spans.
+        """
+        if self._block_width is None:
+            section = self.doc.sections[-1]
+            self._block_width = section.page_width - section.left_margin - section.right_margin
+        col_count = max(1, len(header))
+        col_width = Emu(self._block_width // col_count).twips
+        tc_open = f'<w:tc><w:tcPr><w:tcW w:type="dxa" w:w="{col_width}"/></w:tcPr><w:p>'
+        empty_cell = f"{tc_open}</w:p></w:tc>"
+
+        parts = [
+            f'<w:tbl {_NSDECLS}><w:tblPr><w:tblStyle w:val="{self._style_id("Table Grid")}"/>{_TABLE_LOOK}</w:tblPr><w:tblGrid>',
+            f'<w:gridCol w:w="{col_width}"/>' * col_count,
+            "</w:tblGrid>",
+        ]
+        for row_index, cells in enumerate([header] + rows):
+            parts.append("<w:tr><w:trPr><w:tblHeader/></w:trPr>" if row_index == 0 else "<w:tr>")
+            for c in range(col_count):
+                if c < len(cells) and cells[c]:
+                    parts.append(f"{tc_open}{self._inlines(cells[c])}</w:p></w:tc>")
+                else:
+                    parts.append(empty_cell)
+            parts.append("</w:tr>")
+        parts.append("</w:tbl>")
+        self._parts.append("".join(parts))
+
+    def write(self, blocks: List[Block]) -> None:
+        for kind, level, content in blocks:
+            if kind == "number":
+                start, inlines = content
+                # A new list (or a deeper level of one) starts its own numbering.
+                for deeper in [lvl for lvl in self._list_num_ids if lvl > level]:
+                    del self._list_num_ids[deeper]
+                style = _LIST_STYLES["number"][level]
+                if level not in self._list_num_ids:
+                    self._list_num_ids[level] = self._restarted_num_id(style, start)
+                self.paragraph(inlines, style, self._list_num_ids[level])
+                continue
+            if kind == "bullet":
+                self.paragraph(content, _LIST_STYLES["bullet"][level])
+                continue
+            self._list_num_ids.clear()
+            if kind == "heading":
+                self.paragraph(content, f"Heading {level}")
+            elif kind == "table":
+                self.table(*content)
+            else:
+                self.paragraph(content)
+        self._flush()
+
+    def _flush(self) -> None:
+        body = self.doc.element.body
+        sect_pr = body.sectPr
+        for part in self._parts:
+            element = parse_xml(part)
+            if sect_pr is not None:
+                sect_pr.addprevious(element)
+            else:
+                body.append(element)
+        self._parts = []
+
+
+def render(doc: DocumentObject, blocks: List[Block]) -> None:
+    """Append parsed blocks to the end of the document."""
+    _DocxWriter(doc).write(blocks)
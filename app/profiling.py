@@ -0,0 +1,381 @@
+"""
+Opt-in CPU and memory profiling of report generation.
+
+A profiled run records each scope's call count, wall time and CPU time. The
+scopes are the checks of each staged-pipeline stage ("stage:<name>"),
+finalize_report, render_markdown_to_doc and add_financial_table_pack. Waiting
+for sections to be generated is left out of every scope. Each profile also
+holds one of:
+
+    cprofile  deterministic cProfile of every scope: cpu.pstats (pstats,
+              snakeviz) and cpu.txt (top functions by cumulative time)
+    sample    a background thread samples the stacks of threads inside a scope
+              every PROFILE_SAMPLE_INTERVAL_MS: cpu.folded, the input of
+              flamegraph.pl and speedscope. Cheap enough to leave on in production.
+
+With "memory" added, tracemalloc runs for the whole report. memory.txt then
+holds the traced peak and the allocation sites that grew the most up to the
+largest point seen at a scope exit.
+
+Runs are profiled in two ways:
+
+  - PROFILE_REPORTS (e.g. "sample" or "cprofile,memory") profiles every
+    report. PROFILE_SLOW_REPORT_SEC then keeps only slow ones.
+  - POST /api/report/{id}/start?profile=... profiles that generation only, and
+    its profile is always kept. A slow report can be re-run this way under the
+    profiler without a restart or redeploy.
+
+Artifacts are written to REPORT_PROFILE_DIR/<submission_id>/<profile_id>/.
+The directory also holds summary.json, which names the section-metrics run it
+belongs to. GET /api/report/{id}/profiles lists a report's profiles.
+
+Scopes find their profile through a context variable, so a run that is not
+profiled pays one ContextVar lookup per scope. Section generation happens on
+worker threads or the event loop and is not profiled. The LLM waits there are
+already in the section metrics; this module is for the CPU work they hide.
+Work handed to a worker thread is profiled only when it runs inside a copy
+of the caller's context, as the staged financial chapter does.
+"""
+import asyncio
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import shutil
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from app import section_metrics
+from app.config import Config
+from app.db import DB_PATH
+
+PROFILE_DIR = os.environ.get("REPORT_PROFILE_DIR") or os.path.join(
+    os.path.dirname(os.path.abspath(DB_PATH)), "report_profiles"
+)
+CPU_MODES = ("cprofile", "sample")
+
+_active: ContextVar[Optional["ReportProfile"]] = ContextVar("report_profile", default=None)
+_requested: Dict[int, Tuple[Optional[str], bool]] = {}
+_requested_lock = threading.Lock()
+_tracemalloc_users = 0
+_tracemalloc_lock = threading.Lock()
+
+
+def parse_spec(spec: str) -> Tuple[Optional[str], bool]:
+    """Parse "sample", "cprofile,memory", "memory", ... into (cpu mode, memory). Raises ValueError."""
+    parts = {part.strip().lower() for part in spec.split(",") if part.strip()}
+    unknown = parts - set(CPU_MODES) - {"memory"}
+    if unknown or not parts:
+        raise ValueError(f"Unknown profile mode {spec!r}; use cprofile or sample, optionally with memory")
+    cpu_modes = [mode for mode in CPU_MODES if mode in parts]
+    if len(cpu_modes) > 1:
+        raise ValueError("Choose one of cprofile and sample")
+    return (cpu_modes[0] if cpu_modes else None), "memory" in parts
+
+
+def request(submission_id: int, spec: str) -> None:
+    """Profile the next generation of this report, whatever PROFILE_REPORTS says."""
+    parsed = parse_spec(spec)
+    with _requested_lock:
+        _requested[submission_id] = parsed
+
+
+def _acquire_tracemalloc() -> None:
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _tracemalloc_users += 1
+
+
+def _release_tracemalloc() -> None:
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0:
+            tracemalloc.stop()
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class ReportProfile:
+    """Profile of one generation of one report. Scopes may run on several threads."""
+
+    def __init__(self, submission_id: int, pipeline: str, cpu: Optional[str], memory: bool, requested: bool):
+        self.submission_id = submission_id
+        self.pipeline = pipeline
+        self.cpu = cpu
+        self.memory = memory
+        self.requested = requested
+        self.profile_id = f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.run_id: Optional[str] = None
+        self.started_at = datetime.utcnow().isoformat()
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+        self._depth: Dict[int, int] = {}
+        self._scopes: Dict[str, Dict[str, float]] = {}
+        self._profilers: List[cProfile.Profile] = []
+        self._samples: Counter = Counter()
+        self._sampler: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._memory_lock = threading.Lock()
+        self._memory_baseline: Optional[tracemalloc.Snapshot] = None
+        self._memory_largest: Optional[tracemalloc.Snapshot] = None
+        self._memory_largest_bytes = 0
+        if memory:
+            _acquire_tracemalloc()
+            # The peak is process-wide: with several reports traced at once it is their combined peak.
+            tracemalloc.reset_peak()
+            self._memory_baseline = tracemalloc.take_snapshot()
+        if cpu == "sample":
+            self._sampler = threading.Thread(target=self._sample, name=f"profile-{submission_id}", daemon=True)
+            self._sampler.start()
+
+    def _sample(self) -> None:
+        interval = max(Config.PROFILE_SAMPLE_INTERVAL_MS, 1.0) / 1000
+        while not self._stop.wait(interval):
+            with self._lock:
+                thread_ids = [thread_id for thread_id, depth in self._depth.items() if depth]
+            if not thread_ids:
+                continue
+            frames = sys._current_frames()
+            for thread_id in thread_ids:
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                if stack:
+                    self._samples[";".join(reversed(stack))] += 1
+
+    @contextmanager
+    def scope(self, name: str):
+        if self.run_id is None:
+            run = section_metrics.current_run(self.submission_id)
+            self.run_id = run.run_id if run else None
+        thread_id = threading.get_ident()
+        with self._lock:
+            depth = self._depth.get(thread_id, 0)
+            self._depth[thread_id] = depth + 1
+        profiler = None
+        if depth == 0 and self.cpu == "cprofile":
+            profiler = cProfile.Profile()
+            profiler.enable()
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.thread_time() - cpu
+            if profiler is not None:
+                profiler.disable()
+            with self._lock:
+                self._depth[thread_id] = depth
+                totals = self._scopes.setdefault(name, {"calls": 0, "wall_ms": 0.0, "cpu_ms": 0.0})
+                totals["calls"] += 1
+                totals["wall_ms"] += wall * 1000
+                totals["cpu_ms"] += cpu * 1000
+                if profiler is not None:
+                    self._profilers.append(profiler)
+            if self.memory:
+                self._note_memory()
+
+    def _note_memory(self) -> None:
+        with self._memory_lock:
+            current, _ = tracemalloc.get_traced_memory()
+            if current > self._memory_largest_bytes:
+                self._memory_largest_bytes = current
+                self._memory_largest = tracemalloc.take_snapshot()
+
+    def finish(self, status: str) -> Optional[str]:
+        """Stop profiling and write the artifacts if they are to be kept. Returns the profile directory."""
+        wall_sec = time.perf_counter() - self.started
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        peak_bytes = 0
+        if self.memory:
+            _, peak_bytes = tracemalloc.get_traced_memory()
+            self._note_memory()
+            _release_tracemalloc()
+        keep = self.requested or wall_sec >= Config.PROFILE_SLOW_REPORT_SEC
+        if not keep:
+            return None
+        directory = os.path.join(PROFILE_DIR, str(self.submission_id), self.profile_id)
+        os.makedirs(directory, exist_ok=True)
+        files = []
+        if self._profilers:
+            stats = pstats.Stats(self._profilers[0])
+            for profiler in self._profilers[1:]:
+                stats.add(profiler)
+            stats.dump_stats(os.path.join(directory, "cpu.pstats"))
+            text = io.StringIO()
+            pstats.Stats(os.path.join(directory, "cpu.pstats"), stream=text).sort_stats("cumulative").print_stats(60)
+            with open(os.path.join(directory, "cpu.txt"), "w") as f:
+                f.write(text.getvalue())
+            files += ["cpu.pstats", "cpu.txt"]
+        if self._samples:
+            with open(os.path.join(directory, "cpu.folded"), "w") as f:
+                f.writelines(f"{stack} {count}\n" for stack, count in self._samples.most_common())
+            files.append("cpu.folded")
+        if self._memory_largest is not None and self._memory_baseline is not None:
+            with open(os.path.join(directory, "memory.txt"), "w") as f:
+                f.write(f"traced peak: {peak_bytes / 1024 / 1024:.1f} MiB\n")
+                f.write(f"largest traced at a scope exit: {self._memory_largest_bytes / 1024 / 1024:.1f} MiB\n\n")
+                f.write("top allocation sites by growth since the run started:\n")
+                for stat in self._memory_largest.compare_to(self._memory_baseline, "lineno")[:30]:
+                    f.write(f"{stat}\n")
+            files.append("memory.txt")
+        summary = {
+            "submission_id": self.submission_id,
+            "profile_id": self.profile_id,
+            "run_id": self.run_id,
+            "pipeline": self.pipeline,
+            "status": status,
+            "cpu": self.cpu,
+            "memory": self.memory,
+            "requested": self.requested,
+            "started_at": self.started_at,
+            "wall_ms": round(wall_sec * 1000, 1),
+            "samples": sum(self._samples.values()),
+            "sample_interval_ms": Config.PROFILE_SAMPLE_INTERVAL_MS if self.cpu == "sample" else None,
+            "peak_traced_bytes": peak_bytes or None,
+            "scopes": {
+                name: {"calls": int(t["calls"]), "wall_ms": round(t["wall_ms"], 1), "cpu_ms": round(t["cpu_ms"], 1)}
+                for name, t in self._scopes.items()
+            },
+            "files": files,
+        }
+        with open(os.path.join(directory, "summary.json"), "w") as f:
+            json.dump(summary, f, indent=2)
+        return directory
+
+
+def _begin(submission_id: int, pipeline: str) -> Optional[ReportProfile]:
+    with _requested_lock:
+        requested = _requested.pop(submission_id, None)
+    if requested is not None:
+        cpu, memory = requested
+    elif Config.PROFILE_REPORTS:
+        try:
+            cpu, memory = parse_spec(Config.PROFILE_REPORTS)
+        except ValueError:
+            return None
+    else:
+        return None
+    return ReportProfile(submission_id, pipeline, cpu, memory, requested is not None)
+
+
+@contextmanager
+def report(submission_id: int, pipeline: str = "legacy"):
+    """Profile one generation of a report when requested or enabled; a no-op otherwise."""
+    profile = _begin(submission_id, pipeline)
+    if profile is None:
+        yield None
+        return
+    token = _active.set(profile)
+    status = "failed"
+    try:
+        yield profile
+        status = "done"
+    finally:
+        _active.reset(token)
+        profile.finish(status)
+
+
+@asynccontextmanager
+async def report_async(submission_id: int, pipeline: str = "legacy"):
+    """report() for coroutines; the artifacts are written off the event loop."""
+    profile = _begin(submission_id, pipeline)
+    if profile is None:
+        yield None
+        return
+    token = _active.set(profile)
+    status = "failed"
+    try:
+        yield profile
+        status = "done"
+    finally:
+        _active.reset(token)
+        await asyncio.to_thread(profile.finish, status)
+
+
+@contextmanager
+def scope(name: str):
+    """Measure a block as `name` when the current report is being profiled."""
+    profile = _active.get()
+    if profile is None:
+        yield
+        return
+    with profile.scope(name):
+        yield
+
+
+def profiled(name: str):
+    """Decorator form of scope()."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profile = _active.get()
+            if profile is None:
+                return func(*args, **kwargs)
+            with profile.scope(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def list_profiles(submission_id: int) -> List[Dict[str, Any]]:
+    """Summaries of the report's stored profiles, newest first."""
+    root = os.path.join(PROFILE_DIR, str(submission_id))
+    if not os.path.isdir(root):
+        return []
+    summaries = []
+    for profile_id in sorted(os.listdir(root), reverse=True):
+        try:
+            with open(os.path.join(root, profile_id, "summary.json")) as f:
+                summaries.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return summaries
+
+
+def artifact_path(submission_id: int, profile_id: str, name: str) -> Optional[str]:
+    """Path of one artifact of a stored profile, or None. Only names listed in its summary are served."""
+    for summary in list_profiles(submission_id):
+        if summary.get("profile_id") == profile_id and name in summary.get("files", []) + ["summary.json"]:
+            path = os.path.join(PROFILE_DIR, str(submission_id), profile_id, name)
+            return path if os.path.isfile(path) else None
+    return None
+
+
+def delete_profiles_older_than(days: int, dry_run: bool = False) -> int:
+    """Remove profile directories older than `days` (0 keeps them forever). Returns how many (would be) removed."""
+    if days <= 0 or not os.path.isdir(PROFILE_DIR):
+        return 0
+    oldest_allowed = time.time() - days * 86400
+    removed = 0
+    for submission_dir in os.listdir(PROFILE_DIR):
+        root = os.path.join(PROFILE_DIR, submission_dir)
+        if not os.path.isdir(root):
+            continue
+        for profile_id in os.listdir(root):
+            path = os.path.join(root, profile_id)
+            if os.path.getmtime(path) > oldest_allowed:
+                continue
+            if not dry_run:
+                shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+    return removed
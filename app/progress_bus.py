@@ -0,0 +1,91 @@
+"""
+In-process publish/subscribe bus for report progress.
+
+db.upsert_report_status and db.update_report_progress publish every change
+here, so /status reads and the /events stream are answered from memory rather
+than SQLite. The bus only sees writes made by this process: a report with no
+snapshot yet is loaded from the database once (see prime) and every later
+publish is merged into that snapshot.
+"""
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+class ProgressBus:
+    """Latest progress snapshot per submission plus asyncio subscribers waiting for changes."""
+
+    def __init__(self, max_entries: int = 5000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._snapshots: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._subscribers: Dict[int, List[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+
+    def get(self, submission_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            snapshot = self._snapshots.get(submission_id)
+            return dict(snapshot) if snapshot is not None else None
+
+    def prime(self, submission_id: int, load: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Return the snapshot, loading it with load() the first time. The load runs
+        under the bus lock so a write committed meanwhile cannot be lost: its
+        publish waits and is merged on top of the loaded row.
+        """
+        with self._lock:
+            if submission_id not in self._snapshots:
+                self._store(submission_id, dict(load()))
+            return dict(self._snapshots[submission_id])
+
+    def publish(self, submission_id: int, changes: Dict[str, Any]) -> None:
+        """
+        Merge changes into the submission's snapshot and wake its subscribers.
+        Safe from any thread. Submissions nobody has read yet are skipped: their
+        first read primes a complete snapshot from the database.
+        """
+        with self._lock:
+            if submission_id not in self._snapshots:
+                return
+            snapshot = {**self._snapshots[submission_id], **changes}
+            self._store(submission_id, snapshot)
+            subscribers = list(self._subscribers.get(submission_id, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, dict(snapshot))
+            except RuntimeError:
+                pass  # subscriber's loop already closed
+
+    def subscribe(self, submission_id: int) -> asyncio.Queue:
+        """Return a queue that receives a snapshot on every publish for this submission."""
+        queue: asyncio.Queue = asyncio.Queue()
+        with self._lock:
+            self._subscribers.setdefault(submission_id, []).append((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, submission_id: int, queue: asyncio.Queue) -> None:
+        with self._lock:
+            remaining = [entry for entry in self._subscribers.get(submission_id, []) if entry[1] is not queue]
+            if remaining:
+                self._subscribers[submission_id] = remaining
+            else:
+                self._subscribers.pop(submission_id, None)
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(len(entries) for entries in self._subscribers.values())
+
+    def _store(self, submission_id: int, snapshot: Dict[str, Any]) -> None:
+        # Caller holds the lock. Least recently written snapshots without a live
+        # subscriber are dropped first; they are re-primed from the database if
+        # asked for again.
+        self._snapshots[submission_id] = snapshot
+        self._snapshots.move_to_end(submission_id)
+        for stale_id in list(self._snapshots):
+            if len(self._snapshots) <= self.max_entries:
+                break
+            if stale_id not in self._subscribers:
+                del self._snapshots[stale_id]
+
+
+progress_bus = ProgressBus()
@@ -1,8 +1,19 @@
+import functools
 import os
-from typing import Dict, Any
-
+import re
+import string
+import threading
+from collections import ChainMap
+from typing import Dict, Any, List, Mapping, Optional, Tuple
 
+from app.config import Config
 
+PROMPTS_DIR = os.path.join(os.path.dirname(__file__), "prompts")
+OUTPUT_SPECIFICATION_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)),
+    "docs",
+    "report-output-specification.md",
+)
 
 
 class SafePromptVariables(dict):
@@ -12,6 +23,51 @@ class SafePromptVariables(dict):
         return "Not provided"
 
 
+class TemplateRegistry:
+    """
+    Prompt templates and the output specification, read once and kept in memory.
+
+    With hot_reload on, each lookup stats the file and rereads it only if its
+    mtime changed, so prompt edits show up without a restart. With it off, a
+    file is never touched again after its first read.
+    """
+
+    def __init__(self, hot_reload: bool = False):
+        self.hot_reload = hot_reload
+        self._lock = threading.Lock()
+        self._files: Dict[str, Tuple[int, str]] = {}
+
+    def read(self, path: str) -> Optional[str]:
+        """Contents of path, or None if the file does not exist."""
+        entry = self._files.get(path)
+        if entry is not None and not self.hot_reload:
+            return entry[1]
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            with self._lock:
+                self._files.pop(path, None)
+            return None
+        if entry is not None and entry[0] == mtime_ns:
+            return entry[1]
+        with open(path, 'r', encoding='utf-8') as f:
+            text = f.read()
+        with self._lock:
+            self._files[path] = (mtime_ns, text)
+        return text
+
+    def preload(self) -> int:
+        """Read and compile every prompt template and read the output specification. Returns the number of templates."""
+        names = [name for name in os.listdir(PROMPTS_DIR) if name.endswith(".txt")]
+        for name in names:
+            compile_template(self.read(os.path.join(PROMPTS_DIR, name)))
+        self.read(OUTPUT_SPECIFICATION_PATH)
+        return len(names)
+
+
+template_registry = TemplateRegistry(hot_reload=Config.PROMPT_HOT_RELOAD)
+
+
 def load_output_specification() -> str:
     """
     Load the editable report output specification markdown.
@@ -19,16 +75,10 @@ def load_output_specification() -> str:
     Returns:
         Markdown content from docs/report-output-specification.md
     """
-    docs_path = os.path.join(
-        os.path.dirname(os.path.dirname(__file__)),
-        "docs",
-        "report-output-specification.md",
-    )
-    if not os.path.exists(docs_path):
+    specification = template_registry.read(OUTPUT_SPECIFICATION_PATH)
+    if specification is None:
         return "Output specification file not found."
-
-    with open(docs_path, 'r', encoding='utf-8') as f:
-        return f.read()
+    return specification
 
 
 def load_prompt(prompt_name: str) -> str:
@@ -41,14 +91,88 @@ def load_prompt(prompt_name: str) -> str:
     Returns:
         The prompt template content as a string
     """
-    prompts_dir = os.path.join(os.path.dirname(__file__), "prompts")
-    prompt_path = os.path.join(prompts_dir, f"{prompt_name}.txt")
-    
-    if not os.path.exists(prompt_path):
+    prompt_path = os.path.join(PROMPTS_DIR, f"{prompt_name}.txt")
+    template = template_registry.read(prompt_path)
+    if template is None:
         raise FileNotFoundError(f"Prompt template not found: {prompt_path}")
-    
-    with open(prompt_path, 'r', encoding='utf-8') as f:
-        return f.read()
+    return template
+
+
+# Attribute or index access after a field's root name: "{a.b}", "{a[0]}".
+_FIELD_ROOT = re.compile(r"[.\[]")
+
+
+class CompiledTemplate:
+    """
+    A prompt template parsed once into literal text and placeholders.
+
+    render() converts only the variables the template uses, in the same way
+    render_prompt always has: None and missing values become "Not provided",
+    everything else goes through str(). Templates with anything beyond plain
+    {name} placeholders (format specs, conversions, attribute or index access)
+    keep the original str.format_map rendering.
+    """
+
+    __slots__ = ("source", "fields", "_literals", "_slots", "_plain")
+
+    def __init__(self, source: str):
+        self.source = source
+        literals: List[str] = []
+        slots: List[str] = []
+        fields: Dict[str, None] = {}
+        plain = True
+        pending = ""
+        for literal, field_name, format_spec, conversion in string.Formatter().parse(source):
+            pending += literal
+            if field_name is None:
+                continue
+            if not field_name.isidentifier() or format_spec or conversion:
+                plain = False
+            root = _FIELD_ROOT.split(field_name, 1)[0]
+            if root and not root.isdigit():
+                fields[root] = None
+            literals.append(pending)
+            slots.append(field_name)
+            pending = ""
+        literals.append(pending)
+        self.fields: Tuple[str, ...] = tuple(fields)
+        self._literals = literals
+        self._slots = slots
+        self._plain = plain
+
+    def render(self, variables: Mapping[str, Any]) -> str:
+        values = {}
+        for name in self.fields:
+            value = variables.get(name)
+            values[name] = "Not provided" if value is None else str(value)
+        if not self._plain:
+            try:
+                return self.source.format_map(SafePromptVariables(values))
+            except Exception as e:
+                raise ValueError(f"Failed to render template: {e}")
+        pieces = []
+        for literal, name in zip(self._literals, self._slots):
+            pieces.append(literal)
+            pieces.append(values[name])
+        pieces.append(self._literals[-1])
+        return "".join(pieces)
+
+    def check_fields(self, variables: Mapping[str, Any]) -> Dict[str, List[str]]:
+        """Placeholders with no value (rendered as "Not provided") and variables the template never uses."""
+        return {
+            "missing": [name for name in self.fields if variables.get(name) is None],
+            "unused": sorted(name for name in variables if name not in self.fields),
+        }
+
+
+@functools.lru_cache(maxsize=64)
+def compile_template(template: str) -> CompiledTemplate:
+    return CompiledTemplate(template)
+
+
+def get_section_template(section_name: str) -> CompiledTemplate:
+    """The compiled prompt template for a report section; recompiled only when its file changes."""
+    return compile_template(load_prompt(section_name))
 
 
 def render_prompt(template: str, variables: Dict[str, Any]) -> str:
@@ -62,28 +186,78 @@ def render_prompt(template: str, variables: Dict[str, Any]) -> str:
     Returns:
         The rendered prompt with variables substituted
     """
-    # Convert all values to strings and handle None values
-    safe_variables = {}
-    for key, value in variables.items():
-        if value is None:
-            safe_variables[key] = "Not provided"
-        else:
-            safe_variables[key] = str(value)
-    
-    try:
-        return template.format_map(SafePromptVariables(safe_variables))
-    except Exception as e:
-        raise ValueError(f"Failed to render template: {e}")
+    return compile_template(template).render(variables)
 
 
-def get_section_prompt(section_name: str, submission_data: Dict[str, Any], extra_context: Dict[str, Any] = None) -> str:
-    """Load and render a prompt for a specific report section."""
-    template = load_prompt(section_name)
-    prompt_data = {
-        **submission_data,
+# Every section prompt opens with {report_brief}: the persona, the project data
+# and the writing rules all chapters share (prompts/report_brief.txt). It is
+# the same text for every chapter of a report, so build_shared_context can
+# send it once as a cached system-prompt prefix and leave the prompt a pointer.
+REPORT_BRIEF_PROMPT = "report_brief"
+REPORT_BRIEF_HEADING = "REPORT BRIEF (shared by every chapter of this report):"
+REPORT_BRIEF_IN_PREFIX = "Project data and report rules: see REPORT BRIEF in the system prompt."
+
+
+def _report_brief(submission_data: Mapping[str, Any]) -> str:
+    brief = get_section_template(REPORT_BRIEF_PROMPT).render(submission_data)
+    return f"{REPORT_BRIEF_HEADING}\n{brief}"
+
+
+def _section_prompt_variables(
+    submission_data: Dict[str, Any], extra_context: Dict[str, Any] = None, brief_in_prefix: bool = False
+) -> Mapping[str, Any]:
+    # Layered lookup instead of a merged copy of the whole submission per section.
+    defaults = {
         "output_specification": load_output_specification(),
         "rag_context": "No reference documents available.",
+        "report_brief": REPORT_BRIEF_IN_PREFIX if brief_in_prefix else _report_brief(submission_data),
+    }
+    return ChainMap(extra_context or {}, defaults, submission_data)
+
+
+def get_section_prompt(
+    section_name: str,
+    submission_data: Dict[str, Any],
+    extra_context: Dict[str, Any] = None,
+    brief_in_prefix: bool = False,
+) -> str:
+    """
+    Load and render a prompt for a specific report section. With
+    brief_in_prefix the report brief is left to the shared context (see
+    build_shared_context) and the prompt only points to it.
+    """
+    variables = _section_prompt_variables(submission_data, extra_context, brief_in_prefix)
+    return get_section_template(section_name).render(variables)
+
+
+def build_shared_context(submission_data: Dict[str, Any]) -> str:
+    """
+    The report brief shared by every section prompt of a report, as a
+    system-prompt prefix that Anthropic can cache (see LLMClient.caches_prefix).
+    Rendered from the submission alone, so it is byte-identical for every
+    chapter and every pipeline stage of the same submission.
+    """
+    return _report_brief(submission_data)
+
+
+def get_section_prompt_fields(section_name: str) -> Tuple[str, ...]:
+    """Names of the variables a section's prompt reads, in first-use order, including those of the report brief."""
+    fields: Dict[str, None] = {}
+    for name in get_section_template(section_name).fields:
+        if name == "report_brief":
+            fields.update(dict.fromkeys(get_section_template(REPORT_BRIEF_PROMPT).fields))
+        else:
+            fields[name] = None
+    return tuple(fields)
+
+
+def check_section_prompt_fields(
+    section_name: str, submission_data: Dict[str, Any], extra_context: Dict[str, Any] = None
+) -> Dict[str, List[str]]:
+    """Missing and unused variables for a section prompt and its report brief (see CompiledTemplate.check_fields)."""
+    variables = _section_prompt_variables(submission_data, extra_context)
+    fields = get_section_prompt_fields(section_name)
+    return {
+        "missing": [name for name in fields if variables.get(name) is None],
+        "unused": sorted(name for name in variables if name not in fields and name != "report_brief"),
     }
-    if extra_context:
-        prompt_data.update(extra_context)
-    return render_prompt(template, prompt_data)
@@ -1,21 +1,21 @@
 import re
 import time
-import threading
-import concurrent.futures
+import asyncio
 from urllib.parse import urlparse
 from docx import Document
 from docx.shared import Pt, RGBColor
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 from docx.oxml.ns import qn
 from docx.oxml import OxmlElement
-from docx.opc.constants import RELATIONSHIP_TYPE as RT
-from typing import Dict, Any, List
+from typing import Callable, Dict, Any, List, Optional, Tuple
 from io import BytesIO
-from app.llm_client import llm_client
+from app import llm_cache, markdown_docx, profiling, section_metrics
+from app.llm_client import ProgressCallback, llm_client
 from app.config import Config
-from app.prompt_renderer import get_section_prompt
-from app.db import get_cached_section, save_section, upsert_report_status
+from app.prompt_renderer import build_shared_context, get_section_prompt
+from app.db import get_cached_section, save_report_token_usage, save_section, update_report_progress, upsert_report_status
 from app.data_fetchers import fetch_context_for_section
+from app.section_graph import run_section_graph, run_section_graph_async
 
 SECTION_LABELS = {
     'executive_summary':       'Executive Summary',
@@ -116,169 +116,13 @@ def _sanitize_invalid_links(text: str, validation_cache: Dict[str, bool]) -> str
     return URL_PATTERN.sub(bare_url_repl, updated)
 
 
-def _add_hyperlink(paragraph, text: str, url: str) -> None:
-    """Insert a clickable external hyperlink into a paragraph."""
-    part = paragraph.part
-    r_id = part.relate_to(url, RT.HYPERLINK, is_external=True)
-
-    hyperlink = OxmlElement('w:hyperlink')
-    hyperlink.set(qn('r:id'), r_id)
-
-    new_run = OxmlElement('w:r')
-    rPr = OxmlElement('w:rPr')
-
-    color = OxmlElement('w:color')
-    color.set(qn('w:val'), '0563C1')
-    rPr.append(color)
-
-    underline = OxmlElement('w:u')
-    underline.set(qn('w:val'), 'single')
-    rPr.append(underline)
-
-    new_run.append(rPr)
-    text_el = OxmlElement('w:t')
-    text_el.text = text
-    new_run.append(text_el)
-    hyperlink.append(new_run)
-    paragraph._p.append(hyperlink)
-
-
-def _add_inline_runs(paragraph, text: str) -> None:
-    """Render inline markdown features: **bold**, [links](url), and bare URLs."""
-    # Split by bold first; odd indexes are bold segments.
-    bold_parts = re.split(r'\*\*(.+?)\*\*', text)
-    for i, part in enumerate(bold_parts):
-        if not part:
-            continue
-
-        is_bold = (i % 2 == 1)
-        cursor = 0
-
-        # First resolve markdown links [text](url)
-        for m in MD_LINK_PATTERN.finditer(part):
-            before = part[cursor:m.start()]
-            if before:
-                # Handle bare URLs in the non-link segment
-                start = 0
-                for u in URL_PATTERN.finditer(before):
-                    plain = before[start:u.start()]
-                    if plain:
-                        run = paragraph.add_run(plain)
-                        run.bold = is_bold
-                    _add_hyperlink(paragraph, u.group(1), u.group(1))
-                    start = u.end()
-                tail = before[start:]
-                if tail:
-                    run = paragraph.add_run(tail)
-                    run.bold = is_bold
-
-            _add_hyperlink(paragraph, m.group(1), m.group(2))
-            cursor = m.end()
-
-        remaining = part[cursor:]
-        if remaining:
-            start = 0
-            for u in URL_PATTERN.finditer(remaining):
-                plain = remaining[start:u.start()]
-                if plain:
-                    run = paragraph.add_run(plain)
-                    run.bold = is_bold
-                _add_hyperlink(paragraph, u.group(1), u.group(1))
-                start = u.end()
-            tail = remaining[start:]
-            if tail:
-                run = paragraph.add_run(tail)
-                run.bold = is_bold
-
-
-def _split_md_table_row(line: str) -> List[str]:
-    row = line.strip()
-    if row.startswith('|'):
-        row = row[1:]
-    if row.endswith('|'):
-        row = row[:-1]
-    return [c.strip() for c in row.split('|')]
-
-
-def _is_md_table_separator(line: str) -> bool:
-    s = line.strip()
-    return bool(re.match(r'^\|?\s*:?-{3,}:?\s*(\|\s*:?-{3,}:?\s*)+\|?$', s))
-
-def _add_para_with_inline_bold(doc: Document, text: str, style: str = None):
-    """Add a paragraph, converting **bold** spans to Word bold runs."""
-    para = doc.add_paragraph(style=style) if style else doc.add_paragraph()
-    _add_inline_runs(para, text)
-    return para
-
-
+@profiling.profiled("render_markdown_to_doc")
 def render_markdown_to_doc(doc: Document, text: str) -> None:
     """
     Parse LLM markdown output and write it into the Word document
     using proper Word styles instead of raw markdown symbols.
     """
-    if not text:
-        return
-
-    lines = text.split('\n')
-    i = 0
-    while i < len(lines):
-        line = lines[i]
-        stripped = line.strip()
-        if not stripped:
-            i += 1
-            continue
-
-        # Markdown table: header row + separator + data rows
-        if '|' in stripped and i + 1 < len(lines) and _is_md_table_separator(lines[i + 1]):
-            header_cells = _split_md_table_row(lines[i])
-            table_rows = []
-            j = i + 2
-            while j < len(lines):
-                row_line = lines[j].strip()
-                if not row_line or '|' not in row_line:
-                    break
-                # Skip accidental separator repeats
-                if _is_md_table_separator(row_line):
-                    j += 1
-                    continue
-                table_rows.append(_split_md_table_row(lines[j]))
-                j += 1
-
-            col_count = max(1, len(header_cells))
-            table = doc.add_table(rows=1 + len(table_rows), cols=col_count)
-            table.style = 'Table Grid'
-
-            for c, value in enumerate(header_cells[:col_count]):
-                cell_para = table.rows[0].cells[c].paragraphs[0]
-                cell_para.text = ''
-                _add_inline_runs(cell_para, value)
-                for run in cell_para.runs:
-                    run.bold = True
-
-            for r, row_vals in enumerate(table_rows, start=1):
-                for c in range(col_count):
-                    value = row_vals[c] if c < len(row_vals) else ''
-                    cell_para = table.rows[r].cells[c].paragraphs[0]
-                    cell_para.text = ''
-                    _add_inline_runs(cell_para, value)
-
-            i = j
-            continue
-
-        if stripped.startswith('### '):
-            doc.add_heading(stripped[4:], level=3)
-        elif stripped.startswith('## '):
-            doc.add_heading(stripped[3:], level=2)
-        elif stripped.startswith('# '):
-            doc.add_heading(stripped[2:], level=2)
-        elif stripped.startswith('- ') or stripped.startswith('* '):
-            _add_para_with_inline_bold(doc, stripped[2:], style='List Bullet')
-        elif stripped.startswith('**') and stripped.endswith('**') and stripped.count('**') == 2:
-            p = doc.add_paragraph()
-            p.add_run(stripped[2:-2]).bold = True
-        else:
-            _add_para_with_inline_bold(doc, stripped)
-        i += 1
+    markdown_docx.render(doc, markdown_docx.parse(text))
 
 
 # ---------------------------------------------------------------------------
@@ -553,6 +397,7 @@ def _build_table_data(index: int, f: dict):
     return headers, rows
 
 
+@profiling.profiled("add_financial_table_pack")
 def add_financial_table_pack(doc: Document, submission: Dict[str, Any]) -> None:
     """
     Add a 15-table financial pack inside Chapter 6.
@@ -579,37 +424,44 @@ def add_financial_table_pack(doc: Document, submission: Dict[str, Any]) -> None:
     budget_inr = _parse_budget_inr(str(budget_raw))
     f = _compute_financials(budget_inr)
 
-    doc.add_heading('6.1 Financial Tables (Target: 15 Pages)', level=2)
-    doc.add_paragraph(
-        "The following financial table pack presents a 3-year financial projection derived "
-        f"from the total project cost of {_fmt(budget_inr)}. All figures use standard "
-        "industry assumptions and should be validated against actual vendor quotes."
-    )
-
+    # The whole pack is written as one block list: each table is emitted
+    # straight from its row matrix (see app.markdown_docx).
+    blocks = [
+        ('heading', 2, markdown_docx.plain('6.1 Financial Tables (Target: 15 Pages)')),
+        ('paragraph', 0, markdown_docx.plain(
+            "The following financial table pack presents a 3-year financial projection derived "
+            f"from the total project cost of {_fmt(budget_inr)}. All figures use standard "
+            "industry assumptions and should be validated against actual vendor quotes."
+        )),
+    ]
     for index, title in enumerate(table_titles, start=1):
-        heading_para = doc.add_paragraph(title)
-        if heading_para.runs:
-            heading_para.runs[0].bold = True
-
         headers, rows = _build_table_data(index, f)
-        num_cols = len(headers)
-        table = doc.add_table(rows=1 + len(rows), cols=num_cols)
-        table.style = 'Table Grid'
+        blocks.append(('paragraph', 0, markdown_docx.plain(title, bold=True)))
+        blocks.append(markdown_docx.table_block(headers, rows))
+        blocks.append(('paragraph', 0, []))
+    markdown_docx.render(doc, blocks)
 
-        # Header row
-        hdr_cells = table.rows[0].cells
-        for col_index, header in enumerate(headers):
-            hdr_cells[col_index].text = header
-            for para in hdr_cells[col_index].paragraphs:
-                for run in para.runs:
-                    run.bold = True
 
-        # Data rows
-        for row_index, row_data in enumerate(rows, start=1):
-            for col_index, cell_value in enumerate(row_data):
-                table.rows[row_index].cells[col_index].text = str(cell_value)
-
-        doc.add_paragraph()
+def _section_request(
+    section_name: str, submission_data: Dict[str, Any], extra_context: Optional[Dict[str, Any]], route: str
+) -> Tuple[Optional[str], str, str]:
+    """
+    (shared context or None, section prompt, text the LLM cache key is built
+    from). The report brief goes in a cached prefix only on routes that
+    would actually read it from cache; otherwise it stays in the prompt.
+    """
+    if 'missing_inputs' not in submission_data:
+        # Callers outside generate_report_sections (the staged financial chapter)
+        # pass the raw submission; the brief must match the other chapters'.
+        submission_data = _submission_with_context(submission_data)
+    shared_context = build_shared_context(submission_data) if Config.PROMPT_CACHE_ENABLED else None
+    if shared_context is not None and not llm_client.caches_prefix(route, shared_context):
+        shared_context = None
+    in_prefix = shared_context is not None
+    prompt = get_section_prompt(section_name, submission_data, extra_context, brief_in_prefix=in_prefix)
+    if not in_prefix:
+        return None, prompt, prompt
+    return shared_context, prompt, f"{shared_context}\n\n{prompt}"
 
 
 def get_or_generate_section(
@@ -621,98 +473,141 @@ def get_or_generate_section(
     max_tokens: int = 1600,
     extra_context: Dict[str, Any] = None,
     model: str = "claude",
+    reuse_llm_cache: bool = True,
+    on_progress: Optional[ProgressCallback] = None,
 ) -> str:
-    if not force:
-        cached = get_cached_section(submission_id, section_name)
-        if cached:
-            return cached
-
-    rendered_prompt = get_section_prompt(section_name, submission_data, extra_context)
-    content = llm_client.generate(rendered_prompt, max_tokens=max_tokens, mode=generation_mode, model=model)
-    save_section(submission_id, section_name, content)
-    return content
+    """
+    Return section text, trying the per-submission section cache first (unless
+    force) and then the content-addressed LLM cache (unless reuse_llm_cache is
+    False, e.g. when retrying a response that failed validation).
 
+    on_progress is forwarded to llm_client.generate for live calls; if it raises
+    StreamAborted nothing is cached or saved.
 
-def build_doc(submission: Dict[str, Any], submission_id: int, force: bool = False) -> bytes:
+    Each call is measured and recorded in section_metrics (see app.section_metrics).
     """
-    Build a Word document from submission data with AI-generated content.
-    
-    Args:
-        submission: Dictionary containing submission data
-        submission_id: The submission ID for caching
-        force: If True, regenerate sections even if cached
-        
-    Returns:
-        Bytes of the generated .docx file
-    """
-    # Identify missing inputs for assumptions
+    metric = section_metrics.SectionMetric(submission_id, section_name, generation_mode)
+    try:
+        content = None if force else get_cached_section(submission_id, section_name)
+        if content:
+            metric.cache = "section"
+            metric.route = "section_cache"
+        else:
+            metric.route = route = llm_client.describe_route(generation_mode, model)
+            with metric.timing("render_ms"):
+                shared_context, rendered_prompt, cache_text = _section_request(
+                    section_name, submission_data, extra_context, route,
+                )
+            cache_key = llm_cache.make_key(cache_text, route, max_tokens)
+            content = llm_cache.get(cache_key) if reuse_llm_cache else None
+            if content is None:
+                with metric.timing("llm_ms"):
+                    content = llm_client.generate(
+                        rendered_prompt, max_tokens=max_tokens, mode=generation_mode, model=model,
+                        on_progress=on_progress, shared_context=shared_context, usage_key=submission_id,
+                        call_metrics=metric.llm,
+                    )
+                answered = llm_client.answered_route(route, metric.llm)
+                if answered != route:
+                    cache_key = llm_cache.make_key(cache_text, answered, max_tokens)
+                llm_cache.set(cache_key, answered, max_tokens, content)
+            else:
+                metric.cache = "llm"
+            save_section(submission_id, section_name, content)
+    except Exception as exc:
+        metric.finish(exc)
+        raise
+    metric.finish()
+    return content
+
+
+async def get_or_generate_section_async(
+    submission_id: int,
+    section_name: str,
+    submission_data: Dict[str, Any],
+    force: bool = False,
+    generation_mode: str = "plain",
+    max_tokens: int = 1600,
+    extra_context: Dict[str, Any] = None,
+    model: str = "claude",
+    reuse_llm_cache: bool = True,
+    on_progress: Optional[ProgressCallback] = None,
+) -> str:
+    """Async twin of get_or_generate_section; SQLite reads/writes run off the event loop."""
+    metric = section_metrics.SectionMetric(submission_id, section_name, generation_mode)
+    try:
+        content = None if force else await asyncio.to_thread(get_cached_section, submission_id, section_name)
+        if content:
+            metric.cache = "section"
+            metric.route = "section_cache"
+        else:
+            metric.route = route = llm_client.describe_route(generation_mode, model)
+            with metric.timing("render_ms"):
+                shared_context, rendered_prompt, cache_text = _section_request(
+                    section_name, submission_data, extra_context, route,
+                )
+            cache_key = llm_cache.make_key(cache_text, route, max_tokens)
+            content = await asyncio.to_thread(llm_cache.get, cache_key) if reuse_llm_cache else None
+            if content is None:
+                with metric.timing("llm_ms"):
+                    content = await llm_client.agenerate(
+                        rendered_prompt, max_tokens=max_tokens, mode=generation_mode, model=model,
+                        on_progress=on_progress, shared_context=shared_context, usage_key=submission_id,
+                        call_metrics=metric.llm,
+                    )
+                answered = llm_client.answered_route(route, metric.llm)
+                if answered != route:
+                    cache_key = llm_cache.make_key(cache_text, answered, max_tokens)
+                await asyncio.to_thread(llm_cache.set, cache_key, answered, max_tokens, content)
+            else:
+                metric.cache = "llm"
+            await asyncio.to_thread(save_section, submission_id, section_name, content)
+    except Exception as exc:
+        metric.finish(exc)
+        raise
+    metric.finish()
+    return content
+
+
+# Every section except executive_summary, which reads several of them (see app.section_graph).
+REPORT_SECTIONS = [
+    'introduction',
+    'regulatory_framework',
+    'market_assessment',
+    'business_operating_model',
+    'equipment_profiles',
+    'financial_feasibility',
+    'risk_assessment',
+    'caveats',
+    'appendices',
+]
+
+
+def _submission_with_context(submission: Dict[str, Any]) -> Dict[str, Any]:
+    """Add missing_inputs info to submission data for prompt rendering."""
     missing_inputs = identify_missing_inputs(submission)
-    
-    # Add missing_inputs info to submission data for prompt rendering
     submission_with_context = {**submission}
     if missing_inputs:
         submission_with_context['missing_inputs'] = ', '.join(missing_inputs)
     else:
         submission_with_context['missing_inputs'] = 'None'
-    
-    section_names = [
-        'introduction',
-        'regulatory_framework',
-        'market_assessment',
-        'business_operating_model',
-        'equipment_profiles',
-        'financial_feasibility',
-        'risk_assessment',
-        'caveats',
-        'appendices',
-    ]
+    return submission_with_context
 
-    # Executive Summary is generated LAST so it can pull context from every other section.
-    # All other sections are independent of each other and can run in parallel.
-    total_calls = len(section_names) + 1  # +1 for executive_summary
-    section_content: Dict[str, str] = {}
-
-    # Thread-safe counter so the progress bar stays accurate even when sections
-    # finish in a different order than they were started.
-    _done_count = 0
-    _done_lock = threading.Lock()
-
-    def _generate_one_section(section_name: str):
-        """Worker function: generates one section and returns (name, text)."""
-        nonlocal _done_count
-        generation_mode = Config.resolve_section_mode(section_name)
-        model = Config.resolve_section_model(section_name)
-        max_tokens = Config.WEB_SECTION_MAX_TOKENS if generation_mode == "web" else Config.PLAIN_SECTION_MAX_TOKENS
-        rag_context = fetch_context_for_section(section_name, submission_with_context)
-        extra_ctx = {"rag_context": rag_context} if rag_context else None
-        content = get_or_generate_section(
-            submission_id, section_name, submission_with_context,
-            force, generation_mode, max_tokens,
-            extra_context=extra_ctx,
-            model=model,
-        )
-        with _done_lock:
-            _done_count += 1
-            done = _done_count
-        upsert_report_status(
-            submission_id, "generating",
-            sections_done=done,
-            sections_total=total_calls,
-            current_section=f"{SECTION_LABELS.get(section_name, section_name)} — done ({done}/{total_calls - 1} sections)",
-        )
-        return section_name, content
-
-    # Run all sections except executive_summary in parallel.
-    # max_workers is capped at PARALLEL_SECTION_WORKERS (default 3) to avoid
-    # spiking Anthropic token-per-minute limits.
-    with concurrent.futures.ThreadPoolExecutor(
-        max_workers=Config.PARALLEL_SECTION_WORKERS
-    ) as executor:
-        futures = {executor.submit(_generate_one_section, name): name for name in section_names}
-        for future in concurrent.futures.as_completed(futures):
-            name, content = future.result()
-            section_content[name] = content
 
+def _section_generation_args(section_name: str, submission_with_context: Dict[str, Any]) -> Dict[str, Any]:
+    """Resolve mode, model, token budget and reference context for one section."""
+    generation_mode = Config.resolve_section_mode(section_name)
+    rag_context = fetch_context_for_section(section_name, submission_with_context)
+    return {
+        "generation_mode": generation_mode,
+        "max_tokens": Config.WEB_SECTION_MAX_TOKENS if generation_mode == "web" else Config.PLAIN_SECTION_MAX_TOKENS,
+        "extra_context": {"rag_context": rag_context} if rag_context else None,
+        "model": Config.resolve_section_model(section_name),
+    }
+
+
+def _executive_summary_args(submission: Dict[str, Any], section_content: Dict[str, str]) -> Dict[str, Any]:
+    """Build the executive summary call from the financial model and finished chapters."""
     # Build financial highlights for executive summary context
     budget_raw = submission.get('budget', submission.get('total_investment', '5000000'))
     budget_inr = _parse_budget_inr(str(budget_raw))
@@ -737,46 +632,250 @@ def build_doc(submission: Dict[str, Any], submission_id: int, force: bool = Fals
     risk_context = (section_content.get('risk_assessment', '') or '')[:600].strip()
     market_context = (section_content.get('market_assessment', '') or '')[:400].strip()
 
-    # Generate Executive Summary LAST with full context
-    upsert_report_status(
-        submission_id, "generating",
-        sections_done=total_calls,
-        sections_total=total_calls,
-        current_section="Executive Summary (final step)",
-    )
-    section_content['executive_summary'] = get_or_generate_section(
-        submission_id,
-        'executive_summary',
-        submission_with_context,
-        force,
-        Config.resolve_section_mode('executive_summary'),
-        Config.PLAIN_SECTION_MAX_TOKENS,
-        extra_context={
+    return {
+        "generation_mode": Config.resolve_section_mode('executive_summary'),
+        "max_tokens": Config.PLAIN_SECTION_MAX_TOKENS,
+        "extra_context": {
             'financial_highlights': financial_highlights,
             'risk_context': risk_context or 'Risk assessment not yet available.',
             'market_context': market_context or 'Market assessment not yet available.',
         },
-    )
+    }
 
-    # Validate and sanitize links in all generated sections before rendering output.
+
+def _report_section_done(submission_id: int, section_name: str, done: int, total_calls: int) -> None:
     upsert_report_status(
         submission_id, "generating",
-        sections_done=total_calls,
+        sections_done=done,
         sections_total=total_calls,
-        current_section="Validating source links",
+        current_section=f"{SECTION_LABELS.get(section_name, section_name)} — done ({done}/{total_calls} sections)",
     )
-    link_validation_cache: Dict[str, bool] = {}
-    for key in list(section_content.keys()):
-        section_content[key] = _sanitize_invalid_links(section_content[key], link_validation_cache)
 
-    # Mark financial tables as the final step
+
+def _report_section_writing(submission_id: int, section_name: str, tokens: int) -> None:
+    update_report_progress(
+        submission_id,
+        f"{SECTION_LABELS.get(section_name, section_name)} — writing (~{tokens} tokens)",
+    )
+
+
+def _report_final_step(submission_id: int, total_calls: int, step: str) -> None:
     upsert_report_status(
         submission_id, "generating",
         sections_done=total_calls,
         sections_total=total_calls,
-        current_section="Finalizing financial tables",
+        current_section=step,
     )
 
+
+# Generation order comes from app.section_graph.SECTION_DEPENDENCIES, not list order.
+REPORT_GRAPH_SECTIONS = REPORT_SECTIONS + ['executive_summary']
+
+
+def generate_report_sections(
+    submission: Dict[str, Any],
+    submission_id: int,
+    force: bool = False,
+    completed: Optional[Dict[str, str]] = None,
+    generators: Optional[Dict[str, Callable[[], str]]] = None,
+) -> Dict[str, str]:
+    """
+    Generate every report section through the section dependency graph.
+
+    Sections start as soon as the chapters they read are finished (the
+    executive summary waits for risk, market and financials only), up to
+    PARALLEL_SECTION_WORKERS at a time. Sections passed in `completed` are
+    reused as-is and not regenerated; sections in `generators` are produced by
+    calling generators[name]() in their slot of the graph instead of
+    get_or_generate_section (the staged pipeline's validated financial chapter).
+    """
+    submission_with_context = _submission_with_context(submission)
+    total_calls = len(REPORT_GRAPH_SECTIONS)
+    generators = generators or {}
+
+    def _run_section(section_name: str, finished: Dict[str, str]) -> str:
+        if section_name in generators:
+            return generators[section_name]()
+        if section_name == 'executive_summary':
+            args = _executive_summary_args(submission, finished)
+        else:
+            args = _section_generation_args(section_name, submission_with_context)
+        def _on_progress(text: str, tokens: int) -> None:
+            _report_section_writing(submission_id, section_name, tokens)
+
+        return get_or_generate_section(
+            submission_id, section_name, submission_with_context, force, on_progress=_on_progress, **args,
+        )
+
+    def _on_done(section_name: str, content: str, done: int, total: int) -> None:
+        _report_section_done(submission_id, section_name, total_calls - total + done, total_calls)
+
+    return run_section_graph(
+        _run_section,
+        REPORT_GRAPH_SECTIONS,
+        max_workers=Config.PARALLEL_SECTION_WORKERS,
+        completed=completed,
+        on_done=_on_done,
+    )
+
+
+async def generate_report_sections_async(
+    submission: Dict[str, Any],
+    submission_id: int,
+    force: bool = False,
+    completed: Optional[Dict[str, str]] = None,
+) -> Dict[str, str]:
+    """Async twin of generate_report_sections; only SQLite and reference-data calls leave the loop."""
+    submission_with_context = _submission_with_context(submission)
+    total_calls = len(REPORT_GRAPH_SECTIONS)
+
+    loop = asyncio.get_running_loop()
+    # Live progress: at most one write in flight per section, always of the latest count.
+    progress_writers: Dict[str, asyncio.Task] = {}
+    latest_tokens: Dict[str, int] = {}
+
+    async def _write_progress(section_name: str) -> None:
+        try:
+            while section_name in latest_tokens:
+                tokens = latest_tokens.pop(section_name)
+                await asyncio.to_thread(_report_section_writing, submission_id, section_name, tokens)
+        finally:
+            progress_writers.pop(section_name, None)
+
+    async def _run_section(section_name: str, finished: Dict[str, str]) -> str:
+        if section_name == 'executive_summary':
+            args = _executive_summary_args(submission, finished)
+        else:
+            # Reference data fetchers may hit the network, so resolve them off the loop.
+            args = await asyncio.to_thread(_section_generation_args, section_name, submission_with_context)
+
+        def _on_progress(text: str, tokens: int) -> None:
+            # Called on the loop mid-stream: hand the count to the section's writer without waiting.
+            latest_tokens[section_name] = tokens
+            if section_name not in progress_writers:
+                progress_writers[section_name] = loop.create_task(_write_progress(section_name))
+
+        try:
+            return await get_or_generate_section_async(
+                submission_id, section_name, submission_with_context, force, on_progress=_on_progress, **args,
+            )
+        finally:
+            # Drop unwritten counts and let the last write land before the section is marked done.
+            latest_tokens.pop(section_name, None)
+            writer = progress_writers.get(section_name)
+            if writer is not None:
+                await writer
+
+    async def _on_done(section_name: str, content: str, done: int, total: int) -> None:
+        await asyncio.to_thread(
+            _report_section_done, submission_id, section_name, total_calls - total + done, total_calls,
+        )
+
+    return await run_section_graph_async(
+        _run_section,
+        REPORT_GRAPH_SECTIONS,
+        max_concurrency=Config.PARALLEL_SECTION_WORKERS,
+        completed=completed,
+        on_done=_on_done,
+    )
+
+
+def build_doc(submission: Dict[str, Any], submission_id: int, force: bool = False) -> bytes:
+    """
+    Build a Word document from submission data with AI-generated content.
+    
+    Args:
+        submission: Dictionary containing submission data
+        submission_id: The submission ID for caching
+        force: If True, regenerate sections even if cached
+        
+    Returns:
+        Bytes of the generated .docx file
+    """
+    llm_client.token_usage.take(submission_id)  # drop usage left by an earlier, failed run
+    section_metrics.begin_run(submission_id)
+    # No scope around the whole call: most of it is waiting for section workers.
+    with profiling.report(submission_id):
+        try:
+            section_content = generate_report_sections(submission, submission_id, force)
+        except Exception:
+            section_metrics.end_run(submission_id, status="failed")
+            raise
+        return finalize_report(submission, submission_id, section_content)
+
+
+async def build_doc_async(submission: Dict[str, Any], submission_id: int, force: bool = False) -> bytes:
+    """
+    Async twin of build_doc for callers that run on an event loop (FastAPI).
+
+    Sections are awaited on the loop, at most PARALLEL_SECTION_WORKERS at a
+    time, instead of on a thread pool, so many reports can be in flight
+    without a thread per section. Only the CPU-bound DOCX rendering and short
+    SQLite calls are handed to worker threads.
+    """
+    llm_client.token_usage.take(submission_id)  # drop usage left by an earlier, failed run
+    section_metrics.begin_run(submission_id)
+    async with profiling.report_async(submission_id):
+        try:
+            section_content = await generate_report_sections_async(submission, submission_id, force)
+        except Exception:
+            await asyncio.to_thread(section_metrics.end_run, submission_id, status="failed")
+            raise
+        return await asyncio.to_thread(finalize_report, submission, submission_id, section_content)
+
+
+@profiling.profiled("finalize_report")
+def finalize_report(
+    submission: Dict[str, Any],
+    submission_id: int,
+    section_content: Dict[str, str],
+    total_calls: int = len(REPORT_GRAPH_SECTIONS),
+) -> bytes:
+    """
+    Sanitize links in already-generated sections, then render the .docx.
+
+    Callers that generate sections themselves (the staged pipeline) use this
+    directly instead of build_doc so nothing is generated twice. The LLM token
+    usage gathered for the submission since it started is saved with the report,
+    and the run's section metrics are written with each section's DOCX render time.
+    """
+    # Validate and sanitize links in all generated sections before rendering output.
+    _report_final_step(submission_id, total_calls, "Validating source links")
+    link_validation_cache: Dict[str, bool] = {}
+    section_content = {
+        key: _sanitize_invalid_links(text, link_validation_cache)
+        for key, text in section_content.items()
+    }
+
+    # Mark financial tables as the final step
+    _report_final_step(submission_id, total_calls, "Finalizing financial tables")
+    render_times: Dict[str, float] = {}
+    try:
+        doc_bytes = render_report_doc(submission, section_content, render_times)
+    except Exception:
+        section_metrics.end_run(submission_id, render_times, status="failed")
+        raise
+    section_metrics.end_run(submission_id, render_times)
+    save_report_token_usage(submission_id, llm_client.token_usage.take(submission_id))
+    return doc_bytes
+
+
+def _render_section(
+    doc: Document, section_content: Dict[str, str], section_name: str, render_times: Optional[Dict[str, float]]
+) -> None:
+    started = time.perf_counter()
+    render_markdown_to_doc(doc, section_content[section_name])
+    if render_times is not None:
+        render_times[section_name] = round((time.perf_counter() - started) * 1000, 1)
+
+
+def render_report_doc(
+    submission: Dict[str, Any], section_content: Dict[str, str], render_times: Optional[Dict[str, float]] = None
+) -> bytes:
+    """
+    Lay out the generated chapters, financial table pack and appendices as a .docx.
+    With render_times, the milliseconds spent laying out each section are stored in it.
+    """
     doc = Document()
 
     apply_report_formatting(doc)
@@ -800,38 +899,38 @@ def build_doc(submission: Dict[str, Any], submission_id: int, force: bool = Fals
     # Chapters 1-8 (target 90 pages in aggregate per output specification)
     doc.add_page_break()
     doc.add_heading('Chapter 1: Executive Summary (Target: 2 Pages)', level=1)
-    render_markdown_to_doc(doc, section_content['executive_summary'])
+    _render_section(doc, section_content, 'executive_summary', render_times)
 
     doc.add_page_break()
     doc.add_heading('Chapter 2: Introduction (Target: 6 Pages)', level=1)
-    render_markdown_to_doc(doc, section_content['introduction'])
+    _render_section(doc, section_content, 'introduction', render_times)
 
     doc.add_page_break()
     doc.add_heading('Chapter 3: Regulatory Framework (Target: 10 Pages)', level=1)
-    render_markdown_to_doc(doc, section_content['regulatory_framework'])
+    _render_section(doc, section_content, 'regulatory_framework', render_times)
 
     doc.add_page_break()
     doc.add_heading('Chapter 4: Market Assessment (Target: 16 Pages)', level=1)
-    render_markdown_to_doc(doc, section_content['market_assessment'])
+    _render_section(doc, section_content, 'market_assessment', render_times)
 
     doc.add_page_break()
     doc.add_heading('Chapter 5: Business and Operating Model (Target: 23 Pages)', level=1)
-    render_markdown_to_doc(doc, section_content['business_operating_model'])
+    _render_section(doc, section_content, 'business_operating_model', render_times)
     doc.add_heading('5.1 Illustrated Key Equipment Profiles (Target: 5-6 Pages)', level=2)
-    render_markdown_to_doc(doc, section_content['equipment_profiles'])
+    _render_section(doc, section_content, 'equipment_profiles', render_times)
 
     doc.add_page_break()
     doc.add_heading('Chapter 6: Financial Feasibility (Target: 24 Pages)', level=1)
-    render_markdown_to_doc(doc, section_content['financial_feasibility'])
+    _render_section(doc, section_content, 'financial_feasibility', render_times)
     add_financial_table_pack(doc, submission)
 
     doc.add_page_break()
     doc.add_heading('Chapter 7: Risk Assessment & Mitigation (Target: 6 Pages)', level=1)
-    render_markdown_to_doc(doc, section_content['risk_assessment'])
+    _render_section(doc, section_content, 'risk_assessment', render_times)
 
     doc.add_page_break()
     doc.add_heading('Chapter 8: Caveats (Target: 3 Pages)', level=1)
-    render_markdown_to_doc(doc, section_content['caveats'])
+    _render_section(doc, section_content, 'caveats', render_times)
 
     # Additional chapterized context sections
     doc.add_heading('Project Timeline', level=1)
@@ -849,7 +948,7 @@ def build_doc(submission: Dict[str, Any], submission_id: int, force: bool = Fals
     # Appendices are generated but treated outside the 90-page chapter count.
     doc.add_page_break()
     doc.add_heading('Appendices', level=1)
-    render_markdown_to_doc(doc, section_content['appendices'])
+    _render_section(doc, section_content, 'appendices', render_times)
     
     # Footer
     doc.add_paragraph()
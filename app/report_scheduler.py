@@ -0,0 +1,167 @@
+"""
+Bounded multi-report job scheduler.
+
+Report jobs are persisted in the `report_jobs` table so the queue survives a
+restart. At most Config.MAX_CONCURRENT_REPORTS jobs run at the same time; the
+rest wait and are admitted in priority order (FIFO within a priority level).
+Waiting time is converted into extra priority (see REPORT_QUEUE_AGING_SECONDS)
+so a steady stream of high-priority jobs can never starve older ones.
+
+The scheduler lives inside the web process and drives jobs as asyncio tasks,
+so it assumes a single web worker owns the queue (Railway and Modal both run
+one uvicorn process). That also lets it keep the waiting jobs in memory:
+queue positions and depth are computed without SQLite, and position changes
+are published on app.progress_bus for the /events stream.
+"""
+import asyncio
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from app.config import Config
+from app.db import (
+    enqueue_report_job,
+    get_report_jobs,
+    requeue_running_report_jobs,
+    set_report_job_status,
+)
+from app.progress_bus import progress_bus
+
+JobRunner = Callable[[int, bool], Awaitable[None]]
+
+
+def _effective_priority(job: Dict[str, Any], now: datetime) -> float:
+    """Base priority plus one level per REPORT_QUEUE_AGING_SECONDS spent waiting."""
+    try:
+        waited = (now - datetime.fromisoformat(job["enqueued_at"])).total_seconds()
+    except Exception:
+        waited = 0.0
+    aging = Config.REPORT_QUEUE_AGING_SECONDS
+    bonus = max(0.0, waited) / aging if aging > 0 else 0.0
+    return job["priority"] + bonus
+
+
+def order_queued_jobs(jobs: List[Dict[str, Any]], now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """Return queued jobs in admission order (highest effective priority, then oldest)."""
+    now = now or datetime.utcnow()
+    queued = [job for job in jobs if job["status"] == "queued"]
+    return sorted(queued, key=lambda job: (-_effective_priority(job, now), job["enqueued_at"]))
+
+
+class ReportScheduler:
+    def __init__(self, runner: JobRunner, max_concurrent: Optional[int] = None):
+        self._runner = runner
+        self._max_concurrent = max(1, max_concurrent or Config.MAX_CONCURRENT_REPORTS)
+        self._running: Set[int] = set()
+        # Queued jobs by submission id, mirroring the "queued" rows of report_jobs.
+        self._queued: Dict[int, Dict[str, Any]] = {}
+        self._positions: Dict[int, int] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._waiters: Dict[int, List[asyncio.Future]] = {}
+
+    @property
+    def max_concurrent(self) -> int:
+        return self._max_concurrent
+
+    @property
+    def active_tasks(self) -> Set[asyncio.Task]:
+        return self._tasks
+
+    def recover(self) -> None:
+        """Requeue jobs orphaned by a previous process, load the queue and start admitting work."""
+        requeue_running_report_jobs()
+        self._queued = {job["submission_id"]: job for job in get_report_jobs(("queued",))}
+        self._dispatch()
+
+    def submit(self, submission_id: int, force: bool = False, priority: int = 0) -> str:
+        """Queue a report unless it is already queued or running. Returns the job status."""
+        if submission_id in self._running:
+            return "running"
+        if submission_id in self._queued:
+            return "queued"
+
+        enqueued_at = enqueue_report_job(submission_id, priority=priority, force=force)
+        self._queued[submission_id] = {
+            "submission_id": submission_id,
+            "status": "queued",
+            "priority": priority,
+            "force": force,
+            "enqueued_at": enqueued_at,
+            "started_at": None,
+        }
+        self._dispatch()
+        return "running" if submission_id in self._running else "queued"
+
+    def queue_position(self, submission_id: int) -> Optional[int]:
+        """1-based position in the admission order, or None if the job is not waiting."""
+        if submission_id not in self._queued:
+            return None
+        for index, job in enumerate(order_queued_jobs(list(self._queued.values())), start=1):
+            if job["submission_id"] == submission_id:
+                return index
+        return None
+
+    def queue_depth(self) -> int:
+        return len(self._queued)
+
+    async def wait(self, submission_id: int) -> None:
+        """Wait until the submission's job finishes. Raises RuntimeError if it failed."""
+        if submission_id not in self._running and submission_id not in self._queued:
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(submission_id, []).append(future)
+        await future
+
+    def _dispatch(self) -> None:
+        free_slots = self._max_concurrent - len(self._running)
+        ordered = order_queued_jobs(list(self._queued.values()))
+        for job in ordered[:max(0, free_slots)]:
+            submission_id = job["submission_id"]
+            set_report_job_status(submission_id, "running")
+            del self._queued[submission_id]
+            self._running.add(submission_id)
+            task = asyncio.create_task(self._run_job(job))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        self._publish_positions(ordered[max(0, free_slots):])
+
+    def _publish_positions(self, ordered: List[Dict[str, Any]]) -> None:
+        """Tell progress_bus subscribers of every queued report whose position moved."""
+        positions = {job["submission_id"]: index for index, job in enumerate(ordered, start=1)}
+        for submission_id, position in positions.items():
+            if self._positions.get(submission_id) != position:
+                progress_bus.publish(submission_id, {"queue_position": position})
+        self._positions = positions
+
+    async def _run_job(self, job: Dict[str, Any]) -> None:
+        submission_id = job["submission_id"]
+        error: Optional[str] = None
+        cancelled = False
+        try:
+            await self._runner(submission_id, job["force"])
+        except asyncio.CancelledError:
+            # Shutdown: leave the job queued so recover() resumes it on the next start.
+            cancelled = True
+            raise
+        except Exception as exc:
+            error = str(exc) or exc.__class__.__name__
+        finally:
+            status = "queued" if cancelled else "failed" if error else "done"
+            try:
+                set_report_job_status(submission_id, status, error_message=error)
+            except Exception:
+                # The waiters below must still be released; recover() requeues a job left "running".
+                pass
+            self._running.discard(submission_id)
+            if cancelled:
+                self._queued[submission_id] = {**job, "started_at": None}
+            for future in self._waiters.pop(submission_id, []):
+                if future.done():
+                    continue
+                if cancelled:
+                    future.cancel()
+                elif error:
+                    future.set_exception(RuntimeError(error))
+                else:
+                    future.set_result(None)
+            if not cancelled:
+                self._dispatch()
@@ -0,0 +1,186 @@
+"""
+Dependency-aware scheduling of report sections.
+
+SECTION_DEPENDENCIES declares which chapters a section reads before it can be
+written. run_section_graph (threads) and run_section_graph_async (asyncio)
+start every section as soon as its inputs are ready, and when more sections
+are ready than there are free workers they start the one heading the longest
+remaining chain first, so total wall time approaches the critical path.
+"""
+import asyncio
+import concurrent.futures
+import heapq
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from app.config import Config
+
+SECTION_DEPENDENCIES: Dict[str, Tuple[str, ...]] = {
+    "introduction": (),
+    "regulatory_framework": (),
+    "market_assessment": (),
+    "business_operating_model": (),
+    "equipment_profiles": (),
+    "financial_feasibility": (),
+    "risk_assessment": (),
+    "caveats": (),
+    "appendices": (),
+    # Summarises the top risks, the market picture and the financial chapter.
+    "executive_summary": ("risk_assessment", "market_assessment", "financial_feasibility"),
+}
+
+SectionRunner = Callable[[str, Dict[str, str]], str]
+AsyncSectionRunner = Callable[[str, Dict[str, str]], Awaitable[str]]
+SectionDone = Callable[[str, str, int, int], None]
+AsyncSectionDone = Callable[[str, str, int, int], Awaitable[None]]
+
+
+def section_cost(section_name: str) -> float:
+    """Relative duration estimate: the token budget, doubled for web mode's two calls."""
+    if Config.resolve_section_mode(section_name) == "web":
+        calls = 2 if Config.ENABLE_CLAUDE_WEB_SEARCH else 1
+        return calls * float(Config.WEB_SECTION_MAX_TOKENS)
+    return float(Config.PLAIN_SECTION_MAX_TOKENS)
+
+
+def _plan(sections: Iterable[str], completed: Dict[str, str]):
+    """Return (pending deps per section, dependents per section, critical-path priority)."""
+    todo = [name for name in sections if name not in completed]
+    todo_set = set(todo)
+    pending = {
+        name: {dep for dep in SECTION_DEPENDENCIES.get(name, ()) if dep in todo_set}
+        for name in todo
+    }
+    dependents: Dict[str, List[str]] = {name: [] for name in todo}
+    for name, deps in pending.items():
+        for dep in deps:
+            dependents[dep].append(name)
+
+    priority: Dict[str, float] = {}
+
+    def chain_length(name: str) -> float:
+        if name not in priority:
+            priority[name] = section_cost(name) + max((chain_length(d) for d in dependents[name]), default=0.0)
+        return priority[name]
+
+    for name in todo:
+        chain_length(name)
+    return pending, dependents, priority
+
+
+class _ReadyQueue:
+    """Ready sections ordered by longest remaining chain, then declaration order."""
+
+    def __init__(self, priority: Dict[str, float], order: List[str]):
+        self._priority = priority
+        self._order = {name: index for index, name in enumerate(order)}
+        self._heap: List[Tuple[float, int, str]] = []
+
+    def push(self, name: str) -> None:
+        heapq.heappush(self._heap, (-self._priority[name], self._order[name], name))
+
+    def pop(self) -> str:
+        return heapq.heappop(self._heap)[2]
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+
+def run_section_graph(
+    run_section: SectionRunner,
+    sections: Iterable[str],
+    max_workers: int,
+    completed: Optional[Dict[str, str]] = None,
+    on_done: Optional[SectionDone] = None,
+) -> Dict[str, str]:
+    """
+    Generate sections on a thread pool in dependency order.
+
+    run_section(name, results) receives every finished section so far, which
+    always includes the section's declared dependencies. Sections already in
+    `completed` are treated as done. on_done(name, content, done, total) is
+    called as each section finishes. The first failure is re-raised after the
+    sections already running have finished.
+    """
+    sections = list(sections)
+    results: Dict[str, str] = dict(completed or {})
+    pending, dependents, priority = _plan(sections, results)
+    ready = _ReadyQueue(priority, sections)
+    for name, deps in pending.items():
+        if not deps:
+            ready.push(name)
+
+    total = len(pending)
+    done_count = 0
+    in_flight: Dict[concurrent.futures.Future, str] = {}
+    error: Optional[BaseException] = None
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        while ready or in_flight:
+            while ready and len(in_flight) < max(1, max_workers) and error is None:
+                name = ready.pop()
+                in_flight[executor.submit(run_section, name, dict(results))] = name
+            if not in_flight:
+                break
+
+            finished, _ = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in finished:
+                name = in_flight.pop(future)
+                if future.exception() is not None:
+                    error = error or future.exception()
+                    continue
+                results[name] = future.result()
+                done_count += 1
+                if on_done:
+                    on_done(name, results[name], done_count, total)
+                for dependent in dependents[name]:
+                    pending[dependent].discard(name)
+                    if not pending[dependent]:
+                        ready.push(dependent)
+
+    if error is not None:
+        raise error
+    return results
+
+
+async def run_section_graph_async(
+    run_section: AsyncSectionRunner,
+    sections: Iterable[str],
+    max_concurrency: int,
+    completed: Optional[Dict[str, str]] = None,
+    on_done: Optional[AsyncSectionDone] = None,
+) -> Dict[str, str]:
+    """Asyncio twin of run_section_graph (on_done is awaited); on failure the remaining tasks are cancelled."""
+    sections = list(sections)
+    results: Dict[str, str] = dict(completed or {})
+    pending, dependents, priority = _plan(sections, results)
+    ready = _ReadyQueue(priority, sections)
+    for name, deps in pending.items():
+        if not deps:
+            ready.push(name)
+
+    total = len(pending)
+    done_count = 0
+    in_flight: Dict[asyncio.Task, str] = {}
+
+    try:
+        while ready or in_flight:
+            while ready and len(in_flight) < max(1, max_concurrency):
+                name = ready.pop()
+                in_flight[asyncio.create_task(run_section(name, dict(results)))] = name
+
+            finished, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for task in finished:
+                name = in_flight.pop(task)
+                results[name] = task.result()
+                done_count += 1
+                if on_done:
+                    await on_done(name, results[name], done_count, total)
+                for dependent in dependents[name]:
+                    pending[dependent].discard(name)
+                    if not pending[dependent]:
+                        ready.push(dependent)
+    finally:
+        for task in in_flight:
+            task.cancel()
+
+    return results
@@ -0,0 +1,197 @@
+"""
+Per-section timing, token and cost telemetry for report generation.
+
+Every get_or_generate_section call is measured by a SectionMetric:
+
+    queue_wait_ms   from the moment the section's dependencies were done (or the
+                    run started) until generation began -- waiting for a free
+                    section worker, plus reference-data lookups
+    render_ms       building the prompt
+    llm_ms          the LLM call, retries and back-off included
+    total_ms        the whole call, cache lookups and the section save included
+    docx_render_ms  laying the section out in the .docx (filled in at finalize)
+
+plus the cache that answered (section / llm / miss), the model that actually
+answered, API calls, rate-limit retries, token usage and an estimated cost.
+
+build_doc, build_doc_async and run_staged_pipeline open a ReportRun per
+generation; its metrics are kept in memory and written to section_metrics in
+one transaction when the run ends (finalize_report, or the failure path), so
+a report costs one extra commit however many sections it has. Calls made
+outside a run are written at once. GET /api/report/{id}/metrics returns the
+waterfall of the latest run (get_section_waterfall). Ending a run also feeds
+the report and section latency histograms served by /metrics.
+"""
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from app.db import get_section_metrics, save_section_metrics
+from app.llm_client import CallMetrics
+from app.section_graph import SECTION_DEPENDENCIES
+from app.telemetry import REPORT_SECONDS, SECTION_LLM_SECONDS
+
+# USD per million tokens: (input, output, cache read, cache write). Models not
+# listed (GitHub Models, the stub) are counted as free.
+MODEL_PRICES_PER_MTOK: Dict[str, tuple] = {
+    "claude-sonnet-4-6": (3.00, 15.00, 0.30, 3.75),
+}
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 1)
+
+
+def estimate_cost_usd(model: Optional[str], usage: Dict[str, int]) -> float:
+    prices = MODEL_PRICES_PER_MTOK.get(model or "")
+    if prices is None:
+        return 0.0
+    tokens = (
+        usage.get("input_tokens", 0),
+        usage.get("output_tokens", 0),
+        usage.get("cache_read_input_tokens", 0),
+        usage.get("cache_creation_input_tokens", 0),
+    )
+    return round(sum(count * price for count, price in zip(tokens, prices)) / 1_000_000, 6)
+
+
+class ReportRun:
+    """Clock and metric buffer of one generation of one report."""
+
+    def __init__(self, submission_id: int, pipeline: str = "legacy"):
+        self.submission_id = submission_id
+        self.pipeline = pipeline
+        self.run_id = uuid.uuid4().hex
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+        self._finished_at: Dict[str, float] = {}
+        self._rows: List[Dict[str, Any]] = []
+
+    def ready_at(self, section_name: str) -> float:
+        """When the section could have started: its last dependency finishing, else the run start."""
+        with self._lock:
+            times = [self._finished_at[dep] for dep in SECTION_DEPENDENCIES.get(section_name, ()) if dep in self._finished_at]
+        return max(times, default=self.started)
+
+    def add(self, row: Dict[str, Any], finished: float) -> None:
+        with self._lock:
+            self._rows.append(row)
+            if row["status"] == "done":
+                self._finished_at[row["section_name"]] = finished
+
+    def flush(self, docx_render_ms: Optional[Dict[str, float]] = None) -> None:
+        with self._lock:
+            rows, self._rows = self._rows, []
+        if docx_render_ms:
+            # A section generated more than once (sourcing retries) was rendered from its last successful call.
+            last_done = {row["section_name"]: row for row in rows if row["status"] == "done"}
+            for section_name, elapsed in docx_render_ms.items():
+                if section_name in last_done:
+                    last_done[section_name]["docx_render_ms"] = elapsed
+        save_section_metrics(rows)
+
+
+_runs: Dict[int, ReportRun] = {}
+_runs_lock = threading.Lock()
+
+
+def begin_run(submission_id: int, pipeline: str = "legacy") -> ReportRun:
+    """Start measuring a new generation of the report; an unfinished earlier run is discarded."""
+    run = ReportRun(submission_id, pipeline)
+    with _runs_lock:
+        _runs[submission_id] = run
+    return run
+
+
+def current_run(submission_id: int) -> Optional[ReportRun]:
+    with _runs_lock:
+        return _runs.get(submission_id)
+
+
+def end_run(submission_id: int, docx_render_ms: Optional[Dict[str, float]] = None, status: str = "done") -> None:
+    """Write the run's metrics (with per-section DOCX render times, when known) and forget it."""
+    with _runs_lock:
+        run = _runs.pop(submission_id, None)
+    if run is not None:
+        REPORT_SECONDS.observe(time.monotonic() - run.started, pipeline=run.pipeline, status=status)
+        run.flush(docx_render_ms)
+
+
+class SectionMetric:
+    """Measures one get_or_generate_section call; finish() hands the row to the report's run."""
+
+    def __init__(self, submission_id: int, section_name: str, generation_mode: str):
+        self.submission_id = submission_id
+        self.section_name = section_name
+        self.generation_mode = generation_mode
+        self.run = current_run(submission_id)
+        self.started = time.monotonic()
+        self.timings: Dict[str, float] = {}
+        self.cache = "miss"
+        self.route: Optional[str] = None
+        self.llm = CallMetrics()
+
+    @contextmanager
+    def timing(self, name: str):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.timings[name] = _ms(time.monotonic() - started)
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        finished = time.monotonic()
+        run_started = self.run.started if self.run else self.started
+        model = self.llm.model or self.route
+        row = {
+            "submission_id": self.submission_id,
+            "run_id": self.run.run_id if self.run else uuid.uuid4().hex,
+            "section_name": self.section_name,
+            "status": "failed" if error is not None else "done",
+            "cache": self.cache,
+            "model": model,
+            "generation_mode": self.generation_mode,
+            "start_offset_ms": _ms(self.started - run_started),
+            "queue_wait_ms": _ms(max(0.0, self.started - self.run.ready_at(self.section_name))) if self.run else None,
+            "render_ms": self.timings.get("render_ms"),
+            "llm_ms": self.timings.get("llm_ms"),
+            "total_ms": _ms(finished - self.started),
+            "docx_render_ms": None,
+            "llm_calls": self.llm.calls,
+            "retries": self.llm.retries,
+            "input_tokens": self.llm.usage["input_tokens"],
+            "output_tokens": self.llm.usage["output_tokens"],
+            "cache_read_tokens": self.llm.usage["cache_read_input_tokens"],
+            "cache_write_tokens": self.llm.usage["cache_creation_input_tokens"],
+            "cost_usd": estimate_cost_usd(self.llm.model, self.llm.usage),
+            "error": (str(error) or error.__class__.__name__)[:500] if error is not None else None,
+            "created_at": datetime.utcnow().isoformat(),
+        }
+        if row["llm_ms"] is not None:
+            SECTION_LLM_SECONDS.observe(row["llm_ms"] / 1000, model=model or "")
+        if self.run is not None:
+            self.run.add(row, finished)
+        else:
+            save_section_metrics([row])
+
+
+_TOTAL_FIELDS = ("llm_calls", "retries", "input_tokens", "output_tokens", "cache_read_tokens", "cache_write_tokens")
+
+
+def get_section_waterfall(submission_id: int, run_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Sections of the latest (or given) run in start order, each with its end offset, plus run totals."""
+    rows = get_section_metrics(submission_id, run_id)
+    if not rows:
+        return None
+    sections = []
+    for row in rows:
+        entry = {key: value for key, value in row.items() if key not in ("submission_id", "run_id")}
+        entry["end_offset_ms"] = round((row["start_offset_ms"] or 0) + (row["total_ms"] or 0), 1)
+        sections.append(entry)
+    totals: Dict[str, Any] = {field: sum(row[field] or 0 for row in rows) for field in _TOTAL_FIELDS}
+    totals["cost_usd"] = round(sum(row["cost_usd"] or 0 for row in rows), 6)
+    totals["wall_ms"] = max(entry["end_offset_ms"] for entry in sections)
+    return {"submission_id": submission_id, "run_id": rows[0]["run_id"], "sections": sections, "totals": totals}
@@ -1,21 +1,27 @@
+import contextvars
 import hashlib
 import json
 import re
 from datetime import datetime
 from typing import Any, Dict, List, Optional, Tuple
 
+from app import profiling, section_metrics
 from app.config import Config
 from app.db import (
     get_submission_execution_mode,
     set_submission_execution_mode,
     get_submission_baseline_lock,
     save_submission_baseline_lock,
-    upsert_stage_checkpoint,
-    add_validation_event,
+    StageRecordBuffer,
     set_submission_last_failed_stage,
     get_assumptions_review,
 )
-from app.report_builder import build_doc, get_or_generate_section
+from app.llm_client import StreamAborted, llm_client
+from app.report_builder import finalize_report, generate_report_sections, get_or_generate_section
+
+
+# Output budget of the financial chapter (get_or_generate_section's default).
+FINANCIAL_MAX_TOKENS = 1600
 
 
 class StageError(RuntimeError):
@@ -90,6 +96,7 @@ def _basis_and_source_for_assumption(
     return "Client Provided", []
 
 
+@profiling.profiled("stage:baseline")
 def _build_stage1_baseline_artifact(
     submission_data: Dict[str, Any],
     baseline_payload: Dict[str, Any],
@@ -200,8 +207,17 @@ def _financial_required_missing(submission: Dict[str, Any]) -> List[str]:
     return sorted(set(missing))
 
 
+_QUANTITATIVE_CLAIM = re.compile(r"\b\d+(?:\.\d+)?%?\b")
+_HEADING_LINE = re.compile(r"^#{1,6}[ \t].*$", re.MULTILINE)
+
+
 def _contains_quantitative_claims(text: str) -> bool:
-    return bool(re.search(r"\b\d+(?:\.\d+)?%?\b", text or ""))
+    return bool(_QUANTITATIVE_CLAIM.search(text or ""))
+
+
+def _count_quantitative_claims(text: str) -> int:
+    """Figures stated in the text, not counting section numbers in headings ("## 6.2 ...")."""
+    return len(_QUANTITATIVE_CLAIM.findall(_HEADING_LINE.sub("", text or "")))
 
 
 def _passes_sourcing_rule(text: str) -> Tuple[bool, str]:
@@ -216,7 +232,32 @@ def _passes_sourcing_rule(text: str) -> Tuple[bool, str]:
     return False, "missing_link_or_fallback"
 
 
-def _validate_financial_sourcing(submission_id: int, submission_data: Dict[str, Any], force: bool) -> str:
+def _early_sourcing_check(max_tokens: int, share: float, min_claims: int):
+    """
+    Progress callback that stops a streaming answer which, after share of
+    max_tokens, already states min_claims figures and not one source link or
+    fallback phrase. The prompt asks for a URL wherever a figure is used, so
+    an answer this far along without any is almost always rejected in the end;
+    stopping it here saves the rest of its budget for the retry.
+    """
+    check_after = int(max_tokens * share)
+
+    def check(partial_text: str, tokens: int) -> None:
+        if tokens < check_after or _count_quantitative_claims(partial_text) < min_claims:
+            return
+        passed, reason = _passes_sourcing_rule(partial_text)
+        if not passed:
+            raise StreamAborted(f"{reason} after ~{tokens} tokens")
+
+    return check
+
+
+def _validate_financial_sourcing(
+    submission_id: int,
+    submission_data: Dict[str, Any],
+    force: bool,
+    records: StageRecordBuffer,
+) -> str:
     """Generate financial section with bounded retries for sourcing discipline."""
     attempts = 0
     last_content = ""
@@ -224,19 +265,39 @@ def _validate_financial_sourcing(submission_id: int, submission_data: Dict[str,
 
     while attempts < max_attempts:
         attempts += 1
-        content = get_or_generate_section(
-            submission_id=submission_id,
-            section_name="financial_feasibility",
-            submission_data=submission_data,
-            force=force or attempts > 1,
-        )
+        # The last attempt always runs to completion so there is text to fall back on.
+        early_check = None
+        if Config.SOURCING_EARLY_ABORT_SHARE > 0 and attempts < max_attempts:
+            early_check = _early_sourcing_check(
+                FINANCIAL_MAX_TOKENS, Config.SOURCING_EARLY_ABORT_SHARE, Config.SOURCING_EARLY_ABORT_CLAIMS
+            )
+        try:
+            content = get_or_generate_section(
+                submission_id=submission_id,
+                section_name="financial_feasibility",
+                submission_data=submission_data,
+                force=force or attempts > 1,
+                max_tokens=FINANCIAL_MAX_TOKENS,
+                # A retry must reach the model; the cached answer is the one that just failed.
+                reuse_llm_cache=attempts == 1,
+                on_progress=early_check,
+            )
+        except StreamAborted as exc:
+            records.add_validation_event(
+                submission_id=submission_id,
+                stage_name="financial",
+                event_type="sourcing_validation",
+                passed=False,
+                details={"attempt": attempts, "reason": "missing_link_or_fallback", "stopped_early": str(exc)},
+            )
+            continue
         last_content = content
 
         if not _contains_quantitative_claims(content):
             return content
 
         passed, reason = _passes_sourcing_rule(content)
-        add_validation_event(
+        records.add_validation_event(
             submission_id=submission_id,
             stage_name="financial",
             event_type="sourcing_validation",
@@ -261,6 +322,7 @@ def _validate_financial_sourcing(submission_id: int, submission_data: Dict[str,
     return content_with_fallback
 
 
+@profiling.profiled("stage:financial")
 def _build_material_number_provenance(submission_data: Dict[str, Any], review: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """
     Build provenance records for core material numbers used in financial and operating logic.
@@ -316,6 +378,7 @@ def _build_material_number_provenance(submission_data: Dict[str, Any], review: O
     return records
 
 
+@profiling.profiled("stage:financial")
 def _build_stage2_financial_snapshot(submission_data: Dict[str, Any]) -> Dict[str, Any]:
     """Create a lightweight canonical object used for Chapter 6 consistency checks."""
     snapshot_fields = [
@@ -343,6 +406,7 @@ def _token_present(text: str, value: Any) -> bool:
     return token.lower() in (text or "").lower()
 
 
+@profiling.profiled("stage:financial")
 def _validate_chapter6_mapping(financial_text: str, model_snapshot: Dict[str, Any]) -> Dict[str, Any]:
     missing_in_chapter = []
     for field_name, value in model_snapshot.items():
@@ -356,6 +420,7 @@ def _validate_chapter6_mapping(financial_text: str, model_snapshot: Dict[str, An
     }
 
 
+@profiling.profiled("stage:assembly")
 def _validate_equipment_profile_content(equipment_text: str) -> Dict[str, Any]:
     text = equipment_text or ""
     has_url = bool(re.search(r"https?://\S+", text))
@@ -395,6 +460,7 @@ def _word_overlap_ratio(a: str, b: str) -> float:
     return len(words_a & words_b) / max(1, min(len(words_a), len(words_b)))
 
 
+@profiling.profiled("stage:assembly")
 def _run_lightweight_quality_checks(section_content: Dict[str, str]) -> Dict[str, Any]:
     warnings: List[str] = []
 
@@ -437,18 +503,27 @@ def _run_lightweight_quality_checks(section_content: Dict[str, str]) -> Dict[str
     }
 
 
-def _stage_start(submission_id: int, stage_name: str, baseline_hash: str) -> None:
-    upsert_stage_checkpoint(
+def _stage_start(records: StageRecordBuffer, submission_id: int, stage_name: str, baseline_hash: str) -> None:
+    records.upsert_stage_checkpoint(
         submission_id=submission_id,
         stage_name=stage_name,
         baseline_hash=baseline_hash,
         status="in_progress",
         error_message=None,
     )
-
-
-def _stage_complete(submission_id: int, stage_name: str, baseline_hash: str, output_hash: str = "", output_size: int = 0) -> None:
-    upsert_stage_checkpoint(
+    # Committed at once, so a crash or timeout mid-stage still shows the stage ran.
+    records.flush()
+
+
+def _stage_complete(
+    records: StageRecordBuffer,
+    submission_id: int,
+    stage_name: str,
+    baseline_hash: str,
+    output_hash: str = "",
+    output_size: int = 0,
+) -> None:
+    records.upsert_stage_checkpoint(
         submission_id=submission_id,
         stage_name=stage_name,
         baseline_hash=baseline_hash,
@@ -457,21 +532,93 @@ def _stage_complete(submission_id: int, stage_name: str, baseline_hash: str, out
         output_hash=output_hash,
         output_size=output_size,
     )
+    # One commit per stage for its checkpoints and validation events.
+    records.flush()
 
 
-def _stage_fail(submission_id: int, stage_name: str, baseline_hash: str, error_message: str) -> None:
-    upsert_stage_checkpoint(
+def _stage_fail(records: StageRecordBuffer, submission_id: int, stage_name: str, baseline_hash: str, error_message: str) -> None:
+    records.upsert_stage_checkpoint(
         submission_id=submission_id,
         stage_name=stage_name,
         baseline_hash=baseline_hash,
         status="failed",
         error_message=error_message,
     )
+    records.flush()
+    section_metrics.end_run(submission_id, status="failed")
     set_submission_last_failed_stage(submission_id, stage_name)
 
 
+def _run_financial_stage(
+    submission_id: int,
+    submission_for_generation: Dict[str, Any],
+    force: bool,
+    records: StageRecordBuffer,
+    baseline_hash: str,
+    review: Optional[Dict[str, Any]],
+) -> str:
+    """
+    Stage 2 after its input check: generate the financial chapter under the
+    sourcing rule, record the model snapshot, the chapter 6 mapping and the
+    material-number provenance, and complete the stage. Returns the chapter.
+    """
+    stage_name = "financial"
+    financial_content = _validate_financial_sourcing(submission_id, submission_for_generation, force, records)
+    stage2_snapshot = _build_stage2_financial_snapshot(submission_for_generation)
+    records.add_validation_event(
+        submission_id=submission_id,
+        stage_name=stage_name,
+        event_type="financial_model_snapshot",
+        passed=True,
+        details={"snapshot": stage2_snapshot},
+    )
+
+    chapter6_mapping = _validate_chapter6_mapping(financial_content, stage2_snapshot)
+    records.add_validation_event(
+        submission_id=submission_id,
+        stage_name=stage_name,
+        event_type="chapter6_model_mapping",
+        passed=chapter6_mapping["match"],
+        details=chapter6_mapping,
+    )
+
+    # Capture a compact provenance snapshot for material financial/operating numbers.
+    provenance_records = _build_material_number_provenance(submission_for_generation, review if Config.REQUIRE_CLIENT_REVIEW else None)
+    unable_to_source_count = sum(1 for record in provenance_records if record.get("provenance") == "unable_to_source")
+    records.add_validation_event(
+        submission_id=submission_id,
+        stage_name=stage_name,
+        event_type="material_number_provenance",
+        passed=unable_to_source_count == 0,
+        details={
+            "unable_to_source_count": unable_to_source_count,
+            "records": provenance_records,
+        },
+    )
+
+    records.add_validation_event(
+        submission_id=submission_id,
+        stage_name=stage_name,
+        event_type="required_financial_inputs",
+        passed=True,
+        details={"missing": []},
+    )
+    _stage_complete(records, submission_id, stage_name, baseline_hash)
+    return financial_content
+
+
 def run_staged_pipeline(submission_id: int, submission_data: Dict[str, Any], force: bool = False) -> bytes:
     """Run staged generation with baseline locking and checkpoint instrumentation."""
+    # Stage checkpoints are committed as they happen; validation events once per stage.
+    records = StageRecordBuffer()
+    try:
+        with profiling.report(submission_id, pipeline="staged"):
+            return _run_stages(submission_id, submission_data, force, records)
+    finally:
+        records.close()
+
+
+def _run_stages(submission_id: int, submission_data: Dict[str, Any], force: bool, records: StageRecordBuffer) -> bytes:
     mode = get_submission_execution_mode(submission_id)
     if mode and mode != "staged":
         raise StageError("Submission execution mode mismatch: expected staged")
@@ -480,6 +627,8 @@ def run_staged_pipeline(submission_id: int, submission_data: Dict[str, Any], for
     baseline_payload = _canonical_baseline(submission_data)
     baseline_hash = _hash_payload(baseline_payload)
     review: Optional[Dict[str, Any]] = None
+    llm_client.token_usage.take(submission_id)  # drop usage left by an earlier, failed run
+    section_metrics.begin_run(submission_id, pipeline="staged")
     submission_for_generation = dict(submission_data)
 
     if Config.REQUIRE_CLIENT_REVIEW:
@@ -497,7 +646,7 @@ def run_staged_pipeline(submission_id: int, submission_data: Dict[str, Any], for
     # Stage 1: baseline lock
     stage_name = "baseline"
     try:
-        _stage_start(submission_id, stage_name, baseline_hash)
+        _stage_start(records, submission_id, stage_name, baseline_hash)
         existing_lock = get_submission_baseline_lock(submission_id)
         if existing_lock and existing_lock["baseline_hash"] != baseline_hash:
             raise StageError("Baseline immutability violation: locked baseline differs from current payload")
@@ -505,7 +654,7 @@ def run_staged_pipeline(submission_id: int, submission_data: Dict[str, Any], for
         if not existing_lock:
             save_submission_baseline_lock(submission_id, baseline_payload, baseline_hash)
 
-        add_validation_event(
+        records.add_validation_event(
             submission_id=submission_id,
             stage_name=stage_name,
             event_type="baseline_lock",
@@ -513,25 +662,25 @@ def run_staged_pipeline(submission_id: int, submission_data: Dict[str, Any], for
             details={"locked_at": datetime.utcnow().isoformat()},
         )
         baseline_artifact = _build_stage1_baseline_artifact(submission_for_generation, baseline_payload, review)
-        add_validation_event(
+        records.add_validation_event(
             submission_id=submission_id,
             stage_name=stage_name,
             event_type="baseline_artifact",
             passed=len(baseline_artifact.get("missing_inputs", [])) == 0,
             details=baseline_artifact,
         )
-        _stage_complete(submission_id, stage_name, baseline_hash)
+        _stage_complete(records, submission_id, stage_name, baseline_hash)
     except Exception as exc:
-        _stage_fail(submission_id, stage_name, baseline_hash, str(exc))
+        _stage_fail(records, submission_id, stage_name, baseline_hash, str(exc))
         raise
 
     # Stage 2: financial prerequisites + sourcing
     stage_name = "financial"
     try:
-        _stage_start(submission_id, stage_name, baseline_hash)
+        _stage_start(records, submission_id, stage_name, baseline_hash)
         missing = _financial_required_missing(submission_for_generation)
         missing_questions = [_question_for_missing_field(field) for field in missing]
-        add_validation_event(
+        records.add_validation_event(
             submission_id=submission_id,
             stage_name=stage_name,
             event_type="financial_input_readiness",
@@ -542,7 +691,7 @@ def run_staged_pipeline(submission_id: int, submission_data: Dict[str, Any], for
             },
         )
         if missing:
-            add_validation_event(
+            records.add_validation_event(
                 submission_id=submission_id,
                 stage_name=stage_name,
                 event_type="required_financial_inputs",
@@ -550,75 +699,42 @@ def run_staged_pipeline(submission_id: int, submission_data: Dict[str, Any], for
                 details={"missing": missing, "questions": missing_questions},
             )
             raise StageError(f"Missing required financial inputs: {', '.join(missing)}")
-
-        financial_content = _validate_financial_sourcing(submission_id, submission_for_generation, force=force)
-        stage2_snapshot = _build_stage2_financial_snapshot(submission_for_generation)
-        add_validation_event(
-            submission_id=submission_id,
-            stage_name=stage_name,
-            event_type="financial_model_snapshot",
-            passed=True,
-            details={"snapshot": stage2_snapshot},
-        )
-
-        chapter6_mapping = _validate_chapter6_mapping(financial_content, stage2_snapshot)
-        add_validation_event(
-            submission_id=submission_id,
-            stage_name=stage_name,
-            event_type="chapter6_model_mapping",
-            passed=chapter6_mapping["match"],
-            details=chapter6_mapping,
-        )
-
-        # Capture a compact provenance snapshot for material financial/operating numbers.
-        provenance_records = _build_material_number_provenance(submission_for_generation, review if Config.REQUIRE_CLIENT_REVIEW else None)
-        unable_to_source_count = sum(1 for record in provenance_records if record.get("provenance") == "unable_to_source")
-        add_validation_event(
-            submission_id=submission_id,
-            stage_name=stage_name,
-            event_type="material_number_provenance",
-            passed=unable_to_source_count == 0,
-            details={
-                "unable_to_source_count": unable_to_source_count,
-                "records": provenance_records,
-            },
-        )
-
-        add_validation_event(
-            submission_id=submission_id,
-            stage_name=stage_name,
-            event_type="required_financial_inputs",
-            passed=True,
-            details={"missing": []},
-        )
-        _stage_complete(submission_id, stage_name, baseline_hash)
     except Exception as exc:
-        _stage_fail(submission_id, stage_name, baseline_hash, str(exc))
+        _stage_fail(records, submission_id, stage_name, baseline_hash, str(exc))
         raise
 
+    # The rest of stage 2 runs inside stage 3. Only the executive summary reads
+    # the financial chapter, so the other chapters start as soon as the inputs
+    # are confirmed and the sourcing loop takes the financial chapter's slot in
+    # the section graph; the executive summary waits for its validated text.
+    financial_state: Dict[str, Any] = {}
+    # Run on a graph worker inside this thread's context, so the stage's
+    # profiled helpers still report to the run's profile (see app.profiling).
+    financial_context = contextvars.copy_context()
+
+    def _financial_chapter() -> str:
+        content = financial_context.run(
+            _run_financial_stage, submission_id, submission_for_generation, force, records, baseline_hash, review
+        )
+        financial_state["complete"] = True
+        return content
+
     # Stage 3 + 4: chapter generation and final assembly
     stage_name = "assembly"
     try:
-        _stage_start(submission_id, stage_name, baseline_hash)
-
-        section_names = [
-            "executive_summary",
-            "introduction",
-            "regulatory_framework",
-            "market_assessment",
-            "business_operating_model",
-            "equipment_profiles",
-            "financial_feasibility",
-            "risk_assessment",
-            "caveats",
-        ]
-        section_content = {
-            section_name: get_or_generate_section(submission_id, section_name, submission_for_generation, force=False)
-            for section_name in section_names
-        }
+        _stage_start(records, submission_id, stage_name, baseline_hash)
+
+        # Chapters are generated once, through the section dependency graph, and
+        # rendered from that same content below.
+        section_content = generate_report_sections(
+            submission_for_generation,
+            submission_id,
+            force=force,
+            generators={"financial_feasibility": _financial_chapter},
+        )
 
         equipment_validation = _validate_equipment_profile_content(section_content.get("equipment_profiles", ""))
-        add_validation_event(
+        records.add_validation_event(
             submission_id=submission_id,
             stage_name=stage_name,
             event_type="equipment_profile_validation",
@@ -627,7 +743,7 @@ def run_staged_pipeline(submission_id: int, submission_data: Dict[str, Any], for
         )
 
         quality_checks = _run_lightweight_quality_checks(section_content)
-        add_validation_event(
+        records.add_validation_event(
             submission_id=submission_id,
             stage_name=stage_name,
             event_type="assembly_quality_checks",
@@ -635,9 +751,10 @@ def run_staged_pipeline(submission_id: int, submission_data: Dict[str, Any], for
             details=quality_checks,
         )
 
-        doc_bytes = build_doc(submission_for_generation, submission_id, force=force)
+        doc_bytes = finalize_report(submission_for_generation, submission_id, section_content)
         output_hash = hashlib.sha256(doc_bytes).hexdigest()
         _stage_complete(
+            records,
             submission_id,
             stage_name,
             baseline_hash,
@@ -647,5 +764,8 @@ def run_staged_pipeline(submission_id: int, submission_data: Dict[str, Any], for
         set_submission_last_failed_stage(submission_id, None)
         return doc_bytes
     except Exception as exc:
-        _stage_fail(submission_id, stage_name, baseline_hash, str(exc))
+        _stage_fail(records, submission_id, stage_name, baseline_hash, str(exc))
+        if not financial_state.get("complete"):
+            # Failed last, so last_failed_stage names the earliest stage left unfinished.
+            _stage_fail(records, submission_id, "financial", baseline_hash, str(exc))
         raise
@@ -0,0 +1,189 @@
+"""
+In-process Prometheus metrics for the generation service, served by GET /metrics.
+
+There is no client library: the Counter and Histogram classes below keep
+plain numbers under a lock and render the text exposition format on scrape.
+Recording is a dict lookup plus an addition (and a bisect for histograms), so
+the instrumented paths -- every SQLite commit, every LLM retry -- pay well
+under a microsecond. Values that already live elsewhere (queue depth, cache
+counters) are read by callbacks at scrape time instead of being copied.
+
+Values are per process and start from zero on restart; Prometheus' rate()
+and increase() account for the resets.
+"""
+import bisect
+import math
+import threading
+from typing import Callable, Dict, List, Sequence, Tuple, Union
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LabelValues = Tuple[str, ...]
+CallbackValue = Union[float, Dict[LabelValues, float]]
+
+_registry: List["_Metric"] = []
+_registry_lock = threading.Lock()
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)) + "}"
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = ()):
+        super().__init__(name, help_text, label_names)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        if not values and not self.label_names:
+            values = [((), 0.0)]
+        return [f"{self.name}{_labels(self.label_names, key)} {_format_value(value)}" for key, value in values]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float], label_names: Sequence[str] = ()):
+        super().__init__(name, help_text, label_names)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket (last one is +Inf)], sum, count
+        self._series: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = ([0] * (len(self.buckets) + 1), [0.0, 0.0])
+            series[0][index] += 1
+            series[1][0] += value
+            series[1][1] += 1
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            series = sorted((key, (list(counts), list(totals))) for key, (counts, totals) in self._series.items())
+        lines = []
+        for key, (counts, (total, count)) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                labels = _labels(self.label_names + ("le",), key + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {_format_value(count)}")
+        return lines
+
+
+class Callback(_Metric):
+    """A gauge or counter whose value is read from elsewhere when /metrics is scraped."""
+
+    def __init__(
+        self, name: str, help_text: str, read: Callable[[], CallbackValue], kind: str = "gauge",
+        label_names: Sequence[str] = (),
+    ):
+        super().__init__(name, help_text, label_names)
+        self.kind = kind
+        self._read = read
+
+    def samples(self) -> List[str]:
+        value = self._read()
+        values = sorted(value.items()) if isinstance(value, dict) else [((), value)]
+        return [f"{self.name}{_labels(self.label_names, key)} {_format_value(sample)}" for key, sample in values]
+
+
+def hit_ratio(hits: float, misses: float) -> float:
+    lookups = hits + misses
+    return round(hits / lookups, 4) if lookups else 0.0
+
+
+def render() -> str:
+    """Every registered metric in the Prometheus text format. A failing callback is skipped, not fatal."""
+    with _registry_lock:
+        metrics = list(_registry)
+    blocks = []
+    for metric in metrics:
+        try:
+            blocks.append(metric.render())
+        except Exception:
+            continue
+    return "\n".join(blocks) + "\n"
+
+
+# -- service metrics recorded across the app ---------------------------------
+
+REPORT_SECONDS = Histogram(
+    "report_generation_seconds",
+    "Wall time of one report generation, from the first section to the finished .docx.",
+    buckets=(15, 30, 60, 120, 180, 240, 300, 450, 600, 900, 1200, 1800),
+    label_names=("pipeline", "status"),
+)
+SECTION_LLM_SECONDS = Histogram(
+    "section_llm_seconds",
+    "LLM time of one section, rate-limit retries and back-off included.",
+    buckets=(1, 2.5, 5, 10, 15, 20, 30, 45, 60, 90, 120, 180),
+    label_names=("model",),
+)
+LLM_RATE_LIMIT_RETRIES = Counter(
+    "llm_rate_limit_retries_total", "Anthropic calls retried after a rate-limit (429) error."
+)
+LLM_RATE_LIMIT_SLEEP_SECONDS = Counter(
+    "llm_rate_limit_sleep_seconds_total", "Seconds spent in back-off before rate-limit retries."
+)
+DB_COMMITS = Counter("db_commits_total", "SQLite commits made through the connection pool.")
+DATA_FETCHER_CACHE_LOOKUPS = Counter(
+    "data_fetcher_cache_lookups_total", "Reference-data cache lookups by result.", label_names=("result",)
+)
+Callback(
+    "data_fetcher_cache_hit_ratio",
+    "Share of reference-data cache lookups answered from the cache since start.",
+    lambda: hit_ratio(DATA_FETCHER_CACHE_LOOKUPS.value(result="hit"), DATA_FETCHER_CACHE_LOOKUPS.value(result="miss")),
+)
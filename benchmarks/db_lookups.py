@@ -0,0 +1,145 @@
+"""
+Lookup latency of the hot status / lock / audit queries as the tables grow.
+
+Fills a throwaway database with reports (1% of them generating) and ten
+validation events per submission, then times get_any_generating_report_lock,
+get_report_progress and get_validation_events at each size, with the
+migration-created indexes and again with them dropped. With the indexes, the
+median latency should stay flat as the row count grows.
+
+    python -m benchmarks.db_lookups                  # 1k, 10k, 50k reports
+    python -m benchmarks.db_lookups --sizes 1000 100000 --repeat 500
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+_tmp_dir = tempfile.mkdtemp(prefix="db_lookups_")
+os.environ["DATABASE_PATH"] = os.path.join(_tmp_dir, "bench.db")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import db  # noqa: E402  (DATABASE_PATH must be set first)
+from app.db_migrations import _lookup_indexes  # noqa: E402
+
+EVENTS_PER_SUBMISSION = 10
+INDEXES = (
+    "idx_generated_reports_status_updated",
+    "idx_validation_events_submission_created",
+    "idx_stage_checkpoints_submission_created",
+    "idx_report_jobs_status_enqueued",
+    "idx_llm_response_cache_created",
+    "idx_llm_response_cache_last_used",
+)
+
+
+def _grow_to(target: int, current: int) -> None:
+    """Insert submissions current+1..target with a report row and validation events each."""
+    start = datetime(2026, 1, 1)
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    for submission_id in range(current + 1, target + 1):
+        stamp = (start + timedelta(seconds=submission_id)).isoformat()
+        cursor.execute(
+            "INSERT INTO submissions (id, created_at, payload_json) VALUES (?, ?, '{}')",
+            (submission_id, stamp),
+        )
+        cursor.execute(
+            """
+            INSERT INTO generated_reports (submission_id, status, sections_done, sections_total, current_section, created_at, updated_at)
+            VALUES (?, ?, 10, 10, 'done', ?, ?)
+            """,
+            (submission_id, "generating" if submission_id % 100 == 0 else "done", stamp, stamp),
+        )
+        cursor.executemany(
+            """
+            INSERT INTO validation_events (submission_id, stage_name, event_type, passed, details_json, created_at)
+            VALUES (?, 'financial', 'sourcing_validation', 1, '{"attempt": 1}', ?)
+            """,
+            [(submission_id, f"{stamp}.{n:02d}") for n in range(EVENTS_PER_SUBMISSION)],
+        )
+    conn.commit()
+    conn.close()
+
+
+def _median_us(fn, repeat: int, size: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        submission_id = random.randint(1, size)
+        t0 = time.perf_counter()
+        fn(submission_id)
+        samples.append((time.perf_counter() - t0) * 1e6)
+    return statistics.median(samples)
+
+
+def _measure(size: int, repeat: int) -> dict:
+    return {
+        "generating_lock": _median_us(lambda _: db.get_any_generating_report_lock(), repeat, size),
+        "report_progress": _median_us(db.get_report_progress, repeat, size),
+        "validation_events": _median_us(db.get_validation_events, repeat, size),
+    }
+
+
+def _query_plans() -> list:
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    plans = []
+    for label, sql in (
+        (
+            "generating_lock",
+            "SELECT submission_id, sections_done, sections_total, current_section, updated_at FROM generated_reports "
+            "WHERE status = 'generating' ORDER BY updated_at DESC LIMIT 1",
+        ),
+        ("validation_events", "SELECT * FROM validation_events WHERE submission_id = 1 ORDER BY created_at ASC"),
+    ):
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+        plans.append((label, "; ".join(row[3] for row in cursor.fetchall())))
+    conn.close()
+    return plans
+
+
+def _set_indexes(enabled: bool) -> None:
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    if enabled:
+        _lookup_indexes(cursor)
+    else:
+        for name in INDEXES:
+            cursor.execute(f"DROP INDEX IF EXISTS {name}")
+    conn.commit()
+    conn.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    db.init_db()
+    print(f"database: {db.DB_PATH}")
+    print(f"{'reports':>8} {'indexes':>8} {'lock µs':>9} {'progress µs':>12} {'events µs':>10}")
+    current = 0
+    for size in sorted(args.sizes):
+        _grow_to(size, current)
+        current = size
+        for enabled in (True, False):
+            _set_indexes(enabled)
+            result = _measure(size, args.repeat)
+            print(
+                f"{size:>8} {'on' if enabled else 'off':>8} {result['generating_lock']:>9.1f} "
+                f"{result['report_progress']:>12.1f} {result['validation_events']:>10.1f}"
+            )
+        _set_indexes(True)
+
+    print("\nquery plans with indexes:")
+    for label, plan in _query_plans():
+        print(f"  {label}: {plan}")
+
+
+if __name__ == "__main__":
+    main()
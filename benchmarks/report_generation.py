@@ -0,0 +1,365 @@
+"""
+End-to-end report generation throughput and latency against the simulated LLM.
+
+Runs whole reports through each entry point -- build_doc (sync, one thread per
+report), build_doc_async (one event loop), run_staged_pipeline, and the HTTP
+API (POST /api/submit, /api/report/{id}/start, the /events stream until done,
+then /download) -- with LLM_PROVIDER=simulated, for every combination of
+section workers, concurrent reports and submission size. Every report is a
+fresh submission generated with force=True and the LLM response cache off,
+so each run pays for every section.
+
+For each scenario it prints and records p50/p95/p99 report wall time,
+sections/sec, LLM requests (retries included), SQLite commits and peak RSS. API latency runs from
+submit to download and so includes time spent in the report queue; the other
+targets time each report from its own start.
+
+    python -m benchmarks.report_generation                          # default sweep
+    python -m benchmarks.report_generation --targets api --concurrency 1 2 4 --reports 12
+    python -m benchmarks.report_generation --output after.json --compare before.json
+
+LLM_SIM_* settings (see .env.example) are honoured; LLM_SIM_TIME_SCALE
+defaults to 0.02 here so a report takes seconds instead of minutes.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+_tmp_dir = tempfile.mkdtemp(prefix="report_generation_")
+os.environ["DATABASE_PATH"] = os.path.join(_tmp_dir, "bench.db")
+os.environ["REPORT_BLOB_DIR"] = os.path.join(_tmp_dir, "report_blobs")
+os.environ["LLM_PROVIDER"] = "simulated"
+os.environ["LLM_CACHE_ENABLED"] = "false"
+os.environ["REQUIRE_CLIENT_REVIEW"] = "false"
+os.environ.setdefault("LLM_SIM_TIME_SCALE", "0.02")
+# The simulator's own TPM budget (LLM_SIM_TPM) stands in for the real limit.
+os.environ.setdefault("CLAUDE_TOKENS_PER_MINUTE", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import db  # noqa: E402  (the environment above must be set first)
+from app.config import Config  # noqa: E402
+from app.data_fetchers import fetch_context_for_section  # noqa: E402
+from app.llm_client import llm_client  # noqa: E402
+from app.report_builder import REPORT_GRAPH_SECTIONS, build_doc, build_doc_async  # noqa: E402
+from app.staged_pipeline import run_staged_pipeline  # noqa: E402
+
+TARGETS = ("build_doc", "build_doc_async", "staged", "api")
+# Extra characters of free text spread over the optional submission fields.
+SUBMISSION_SIZES = {"small": 0, "medium": 1500, "large": 8000}
+_FREE_TEXT_FIELDS = ("product_mix", "utilities_consumption", "promoter_background", "notes", "target_market")
+_FILLER = (
+    "The promoters have run a similar unit for eight years and supply regional distributors "
+    "under annual contracts with staged price revisions and assured off-take. "
+)
+
+
+class _CommitCounter:
+    """Counts COMMITs on every pooled SQLite connection opened after install()."""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def _trace(self, statement: str) -> None:
+        if statement.startswith("COMMIT"):
+            with self._lock:
+                self.count += 1
+
+    def install(self) -> None:
+        open_connection = db._pool._open
+
+        def open_traced():
+            conn = open_connection()
+            conn.set_trace_callback(self._trace)
+            return conn
+
+        db._pool._open = open_traced
+
+
+_commits = _CommitCounter()
+
+
+def _reset_peak_rss() -> bool:
+    """Reset the kernel's high-water mark (Linux); elsewhere peak RSS is for the whole process."""
+    try:
+        with open("/proc/self/clear_refs", "w") as handle:
+            handle.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as handle:
+            for line in handle:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _percentile(samples: List[float], q: float) -> float:
+    """Nearest-rank percentile; 0.0 for no samples."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, int(-(-q * len(ordered) // 100)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def make_submission(index: int, size: str) -> Dict[str, Any]:
+    """A valid SubmissionCreate payload padded with SUBMISSION_SIZES[size] characters of free text."""
+    payload: Dict[str, Any] = {
+        "client_name": f"Benchmark Client {index}",
+        "project_title": f"Cold-pressed oil unit {index}",
+        "product_service": "Cold-pressed groundnut and sesame oil in 1 L and 5 L packs",
+        "project_location": "Rajkot, Gujarat",
+        "business_model": "Manufacturing",
+        "sizing_mode": "budget_driven",
+        "total_investment": 25000000.0,
+        "selling_price": 240.0,
+        "production_rampup": "60% in year 1, 75% in year 2, 85% from year 3",
+        "market_geography": "Gujarat and Maharashtra",
+        "operating_days": 300,
+        "shifts_per_day": 2,
+        "hours_per_shift": 8,
+        "debt_percentage": 70.0,
+        "equity_percentage": 30.0,
+        "loan_tenor": 7,
+        "interest_rate": 10.5,
+        "repayment_frequency": "quarterly",
+        "currency": "INR",
+        # Legacy fields the form fills in from the ones above.
+        "business_idea": "Cold-pressed groundnut and sesame oil in 1 L and 5 L packs",
+        "location_land": "Rajkot, Gujarat",
+        "goals": "Gujarat and Maharashtra",
+        "budget": 25000000.0,
+    }
+    per_field = SUBMISSION_SIZES[size] // len(_FREE_TEXT_FIELDS)
+    if per_field:
+        text = (_FILLER * (per_field // len(_FILLER) + 1))[:per_field]
+        for field in _FREE_TEXT_FIELDS:
+            payload[field] = text
+    return payload
+
+
+def _new_report(payload: Dict[str, Any]) -> tuple:
+    submission_id = db.save_submission(payload)
+    db.upsert_report_status(submission_id, "generating")
+    return submission_id, payload
+
+
+def _timed(fn: Callable[[], Any]) -> Optional[float]:
+    started = time.perf_counter()
+    try:
+        fn()
+    except Exception as exc:
+        print(f"    report failed: {exc}", file=sys.stderr)
+        return None
+    return time.perf_counter() - started
+
+
+def _run_threaded(reports: List[tuple], concurrency: int, staged: bool) -> List[Optional[float]]:
+    def run(report):
+        submission_id, payload = report
+        if staged:
+            return _timed(lambda: run_staged_pipeline(submission_id, payload, force=True))
+        return _timed(lambda: build_doc(payload, submission_id, force=True))
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(run, reports))
+
+
+def _run_async(reports: List[tuple], concurrency: int) -> List[Optional[float]]:
+    async def main():
+        slots = asyncio.Semaphore(concurrency)
+
+        async def run(submission_id, payload):
+            async with slots:
+                started = time.perf_counter()
+                try:
+                    await build_doc_async(payload, submission_id, force=True)
+                except Exception as exc:
+                    print(f"    report failed: {exc}", file=sys.stderr)
+                    return None
+                return time.perf_counter() - started
+
+        return await asyncio.gather(*(run(submission_id, payload) for submission_id, payload in reports))
+
+    return asyncio.run(main())
+
+
+def _run_api(payloads: List[Dict[str, Any]], concurrency: int) -> List[Optional[float]]:
+    import httpx
+
+    from app import main as web
+
+    # The scheduler reads MAX_CONCURRENT_REPORTS once, when the app is imported.
+    web.report_scheduler._max_concurrent = concurrency
+
+    async def one(client, payload):
+        started = time.perf_counter()
+        try:
+            response = await client.post("/api/submit", json=payload)
+            response.raise_for_status()
+            submission_id = int(response.json()["id"])
+            (await client.post(f"/api/report/{submission_id}/start", params={"force": "true"})).raise_for_status()
+            async with client.stream("GET", f"/api/report/{submission_id}/events") as events:
+                async for line in events.aiter_lines():
+                    if line.startswith("data: ") and json.loads(line[6:])["status"] == "failed":
+                        raise RuntimeError(json.loads(line[6:])["error"])
+            (await client.get(f"/api/report/{submission_id}/download")).raise_for_status()
+        except Exception as exc:
+            print(f"    report failed: {exc}", file=sys.stderr)
+            return None
+        return time.perf_counter() - started
+
+    async def main():
+        transport = httpx.ASGITransport(app=web.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            web.report_scheduler.recover()
+            return await asyncio.gather(*(one(client, payload) for payload in payloads))
+
+    return asyncio.run(main())
+
+
+def run_scenario(target: str, workers: int, concurrency: int, size: str, reports: int, first_index: int) -> Dict[str, Any]:
+    Config.PARALLEL_SECTION_WORKERS = workers
+    payloads = [make_submission(first_index + n, size) for n in range(reports)]
+    rss_reset = _reset_peak_rss()
+    commits_before = _commits.count
+    requests_before = llm_client._get_simulator().requests
+    started = time.perf_counter()
+
+    if target == "api":
+        latencies = _run_api(payloads, concurrency)
+    else:
+        prepared = [_new_report(payload) for payload in payloads]
+        if target == "build_doc_async":
+            latencies = _run_async(prepared, concurrency)
+        else:
+            latencies = _run_threaded(prepared, concurrency, staged=target == "staged")
+
+    wall_s = time.perf_counter() - started
+    done = [elapsed for elapsed in latencies if elapsed is not None]
+    sections = len(done) * len(REPORT_GRAPH_SECTIONS)
+    return {
+        "target": target,
+        "workers": workers,
+        "concurrency": concurrency,
+        "size": size,
+        "reports": reports,
+        "failed": reports - len(done),
+        "p50_s": round(_percentile(done, 50), 3),
+        "p95_s": round(_percentile(done, 95), 3),
+        "p99_s": round(_percentile(done, 99), 3),
+        "wall_s": round(wall_s, 3),
+        "sections_per_s": round(sections / wall_s, 2) if wall_s else 0.0,
+        "llm_requests": llm_client._get_simulator().requests - requests_before,
+        "db_commits": _commits.count - commits_before,
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "peak_rss_scope": "scenario" if rss_reset else "process",
+    }
+
+
+def _scenario_key(result: Dict[str, Any]) -> tuple:
+    return result["target"], result["workers"], result["concurrency"], result["size"]
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def _print_comparison(results: List[Dict[str, Any]], baseline_path: str) -> None:
+    with open(baseline_path) as handle:
+        baseline = {_scenario_key(result): result for result in json.load(handle)["results"]}
+    print(f"\nchange vs {baseline_path} (negative is faster / fewer):")
+    print(f"{'target':>16} {'w':>3} {'c':>3} {'size':>7} {'p50':>8} {'p95':>8} {'sect/s':>8} {'commits':>8}")
+    for result in results:
+        before = baseline.get(_scenario_key(result))
+        if before is None:
+            continue
+
+        def change(field):
+            return f"{(result[field] - before[field]) / before[field] * 100:+.1f}%" if before[field] else "n/a"
+
+        print(
+            f"{result['target']:>16} {result['workers']:>3} {result['concurrency']:>3} {result['size']:>7} "
+            f"{change('p50_s'):>8} {change('p95_s'):>8} {change('sections_per_s'):>8} {change('db_commits'):>8}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--targets", nargs="+", choices=TARGETS, default=list(TARGETS))
+    parser.add_argument("--workers", type=int, nargs="+", default=[3, 6], help="PARALLEL_SECTION_WORKERS values")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4], help="reports generating at once")
+    parser.add_argument("--sizes", nargs="+", choices=list(SUBMISSION_SIZES), default=["small", "large"])
+    parser.add_argument("--reports", type=int, default=8, help="reports per scenario")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="earlier --output file to print relative changes against")
+    args = parser.parse_args()
+
+    _commits.install()
+    db.init_db()
+    # Fill the on-disk macro / RBI data cache once so no scenario pays for the fetch.
+    for section_name in ("market_assessment", "financial_feasibility"):
+        fetch_context_for_section(section_name, make_submission(0, "small"))
+    print(f"database: {db.DB_PATH}  time scale: {os.environ['LLM_SIM_TIME_SCALE']}")
+    print(
+        f"{'target':>16} {'w':>3} {'c':>3} {'size':>7} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} "
+        f"{'sect/s':>7} {'reqs':>6} {'commits':>8} {'rss MB':>7} {'failed':>6}"
+    )
+    results = []
+    first_index = 1
+    for target in args.targets:
+        for workers in args.workers:
+            for concurrency in args.concurrency:
+                for size in args.sizes:
+                    result = run_scenario(target, workers, concurrency, size, args.reports, first_index)
+                    first_index += args.reports
+                    results.append(result)
+                    print(
+                        f"{target:>16} {workers:>3} {concurrency:>3} {size:>7} {result['p50_s']:>7.2f} "
+                        f"{result['p95_s']:>7.2f} {result['p99_s']:>7.2f} {result['sections_per_s']:>7.2f} "
+                        f"{result['llm_requests']:>6} {result['db_commits']:>8} {result['peak_rss_mb']:>7.1f} "
+                        f"{result['failed']:>6}"
+                    )
+
+    if args.output:
+        report = {
+            "created_at": datetime.utcnow().isoformat(),
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "simulator": {name: os.environ[name] for name in sorted(os.environ) if name.startswith("LLM_SIM_")},
+            "results": results,
+        }
+        with open(args.output, "w") as handle:
+            json.dump(report, handle, indent=2)
+        print(f"\nresults written to {args.output}")
+    if args.compare:
+        _print_comparison(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -94,6 +94,8 @@ def generate_report_job(submission_id: int, force: bool = False) -> bytes:
     # Point the app at the volume-mounted paths
     os.environ.setdefault("CHROMA_DB_PATH", "/data/chroma")
     os.environ.setdefault("DATABASE_PATH", "/data/db/submissions.db")
+    # The volume is shared by several containers; WAL needs shared memory on one host.
+    os.environ["SQLITE_JOURNAL_MODE"] = "DELETE"
     os.environ["LLM_PROVIDER"] = "claude"
 
     # Add project root to path so app.* imports work
@@ -114,6 +116,30 @@ def generate_report_job(submission_id: int, force: bool = False) -> bytes:
     return LegacyBackend().build_report(submission_id, submission_data, force)
 
 
+# ---------------------------------------------------------------------------
+# Nightly database maintenance — retention, archiving, blob GC, incremental vacuum
+# ---------------------------------------------------------------------------
+@app.function(
+    volumes={"/data/db": sqlite_vol},
+    schedule=modal.Cron("30 21 * * *"),  # 03:00 IST, outside working hours
+    timeout=1800,
+)
+def database_maintenance() -> dict:
+    """Archive expired rows to /data/db/db_archive and compact the database (see app/maintenance.py)."""
+    import os
+    import sys
+
+    os.environ["DATABASE_PATH"] = "/data/db/submissions.db"
+    os.environ["SQLITE_JOURNAL_MODE"] = "DELETE"
+    sys.path.insert(0, "/root")
+
+    from app.maintenance import run_maintenance
+
+    summary = run_maintenance()
+    sqlite_vol.commit()
+    return summary
+
+
 # ---------------------------------------------------------------------------
 # ASGI web server — serves the full FastAPI app on Modal
 # ---------------------------------------------------------------------------
@@ -132,6 +158,7 @@ def web():
     import sys
 
     os.environ["DATABASE_PATH"] = "/data/db/submissions.db"
+    os.environ["SQLITE_JOURNAL_MODE"] = "DELETE"
     os.environ.setdefault("CHROMA_DB_PATH", "/data/chroma")
     os.environ["LLM_PROVIDER"] = "claude"
 
@@ -159,6 +186,7 @@ def trigger_report(submission_id: int, force: bool = False):
     from fastapi.responses import Response
 
     os.environ["DATABASE_PATH"] = "/data/db/submissions.db"
+    os.environ["SQLITE_JOURNAL_MODE"] = "DELETE"
     os.environ.setdefault("CHROMA_DB_PATH", "/data/chroma")
     os.environ["LLM_PROVIDER"] = "claude"
     sys.path.insert(0, "/root")